@@ -3,10 +3,17 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from config import Config
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 
 db = SQLAlchemy()
-limiter = Limiter(key_func=get_remote_address) 
+
+
+def _rate_limit_key():
+    # Per API key / Clerk user rather than per IP (see app.utils.rate_limits)
+    from app.utils.rate_limits import rate_limit_identity
+    return rate_limit_identity()
+
+
+limiter = Limiter(key_func=_rate_limit_key, storage_uri=Config.RATELIMIT_STORAGE_URI)
 
 def create_app():
     app = Flask(__name__)
@@ -22,10 +29,29 @@ def create_app():
     from app.routes.prompt_response import llm_bp
     from app.routes.handle_chats import chat_bp
     from app.routes.api_keys import api_key_bp
+    from app.routes.metrics import metrics_bp
+    from app.routes.results import results_bp
+    from app.routes.figures import figures_bp
 
     app.register_blueprint(database_bp)
     app.register_blueprint(llm_bp)
     app.register_blueprint(chat_bp)
     app.register_blueprint(api_key_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(results_bp)
+    app.register_blueprint(figures_bp)
+
+    from app.utils.usage_recorder import init_usage_recorder
+    init_usage_recorder(app)
+
+    from app.utils.rate_limits import init_rate_limits
+    init_rate_limits(app)
+
+    from app.utils.schema_jobs import reset_stuck_introspections
+    reset_stuck_introspections(app)
+
+    if Config.PREWARM != "off":
+        from app.utils.prewarm import start_prewarm
+        start_prewarm(Config.PREWARM)
 
     return app
@@ -0,0 +1,237 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.test import EnvironBuilder
+from config import Config
+from app import create_app
+from app.utils import metrics
+
+# --- ASGI Entry Point ---
+# create_asgi_app() wraps create_app() for an ASGI server (see backend/asgi.py):
+#
+#   POST /api/query   runs natively on the event loop. The LLM call is awaited
+#                     (llm_client.acomplete_json), so a query waiting on the
+#                     model holds no thread; auth, caches, SQL and saving the
+#                     message run on ASYNC_BLOCKING_WORKERS threads.
+#   everything else   served by the Flask app as a plain WSGI call on a pool
+#                     of ASYNC_WSGI_WORKERS threads, its body streamed out
+#                     chunk by chunk and closed afterwards (so
+#                     Response.call_on_close callbacks run).
+#
+# Both paths go through the same Flask request handling (before_request hooks
+# such as the limiter, error handlers, CORS), so responses are identical to
+# the WSGI server's. Lifespan shutdown flushes pending API key usage.
+QUERY_PATH = "/api/query"
+
+
+def _environ(scope, body):
+    """ WSGI environ for an ASGI HTTP scope, so Flask can build its request from it. """
+    headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]]
+    client = scope.get("client")
+    return EnvironBuilder(
+        path=scope["path"],
+        base_url=f"{scope.get('scheme', 'http')}://localhost{scope.get('root_path', '')}",
+        method=scope["method"],
+        headers=headers,
+        data=body,
+        query_string=scope.get("query_string", b"").decode("latin-1"),
+        environ_base={"REMOTE_ADDR": client[0] if client else ""},
+    ).get_environ()
+
+
+async def _read_body(receive):
+    """ The request body, or None if the client disconnected before sending all of it. """
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def _status_code(status):
+    return int(status.split(" ", 1)[0])
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+class AsyncQueryApp:
+    """ ASGI app: async /api/query plus the Flask app for every other route. """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(Config.ASYNC_BLOCKING_WORKERS, thread_name_prefix="asgi-blocking")
+        self.wsgi_executor = ThreadPoolExecutor(Config.ASYNC_WSGI_WORKERS, thread_name_prefix="asgi-wsgi")
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        metrics.register_gauge("asgi", lambda: {"queries_in_flight": self.in_flight})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == QUERY_PATH and scope["method"] == "POST":
+            await self._query(scope, receive, send)
+        elif scope["type"] == "http":
+            await self._wsgi(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def run_blocking(self, fn, *args):
+        """ Runs fn(*args) on the blocking pool inside an app context. """
+        def call():
+            with self.flask_app.app_context():
+                return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                from app.utils.usage_recorder import flush
+                await asyncio.get_running_loop().run_in_executor(self.executor, flush)
+                self.executor.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _wsgi(self, scope, receive, send):
+        body = await _read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.wsgi_executor, self._run_wsgi, _environ(scope, body), loop, send)
+
+    def _run_wsgi(self, environ, loop, send):
+        """ Calls the Flask app as a WSGI server would, sending each body chunk through the loop. """
+        def sync_send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def write(chunk):
+            # Headers go out with the first chunk, so errors before it can still replace them
+            if not start.get("sent"):
+                start["sent"] = True
+                sync_send(start["message"])
+            if chunk:
+                sync_send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and start.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            start["message"] = {"type": "http.response.start", "status": _status_code(status), "headers": _asgi_headers(headers)}
+            return write
+
+        body = self.flask_app(environ, start_response)
+        try:
+            for chunk in body:
+                write(chunk)
+            write(b"")
+            sync_send({"type": "http.response.body"})
+        finally:
+            # PEP 3333: the server closes the iterable, whatever ended the response
+            if hasattr(body, "close"):
+                body.close()
+
+    async def _query(self, scope, receive, send):
+        body = await _read_body(receive)
+        if body is None:
+            return
+        environ = _environ(scope, body)
+
+        loop = asyncio.get_running_loop()
+        self._count(1)
+        metrics.incr("asgi.queries")
+        try:
+            ctx, result_format, response = await loop.run_in_executor(self.executor, self._start, environ)
+            if response is None:
+                response = await self._run_admitted(loop, environ, ctx, result_format)
+        except Exception as e:
+            response = await loop.run_in_executor(self.executor, self._error, environ, e)
+        finally:
+            self._count(-1)
+
+        status, headers, content = response
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def _run_admitted(self, loop, environ, ctx, result_format):
+        from app.utils.admission import query_admission, AdmissionRejected
+        from app.utils.query_pipeline import run_query_pipeline_async
+
+        try:
+            # Queued queries wait on the loop, not on a worker thread
+            ticket = await query_admission.acquire_async(ctx["identity"])
+        except AdmissionRejected as e:
+            return await loop.run_in_executor(self.executor, self._rejected, environ, e.retry_after)
+        try:
+            async for event, payload in run_query_pipeline_async(ctx, self.run_blocking):
+                if event in ("error", "done"):
+                    return await loop.run_in_executor(
+                        self.executor, self._finish, environ, ctx, event, payload, result_format
+                    )
+        finally:
+            query_admission.release(ticket)
+
+    def _count(self, delta):
+        with self._in_flight_lock:
+            self.in_flight += delta
+
+    def _start(self, environ):
+        """ before_request hooks, format negotiation and auth: (ctx, format, None) or (None, None, response). """
+        from app.routes.prompt_response import _query_format, _prepare_query, _detach_database
+
+        with self.flask_app.request_context(environ):
+            try:
+                rv = self.flask_app.preprocess_request()
+                if rv is None:
+                    result_format, rv = _query_format()
+                if rv is None:
+                    ctx, rv = _prepare_query()
+                if rv is None:
+                    # The ORM object does not outlive this request context
+                    return _detach_database(ctx), result_format, None
+            except Exception as e:
+                rv = self._handle_exception(e)
+            return None, None, self._as_asgi(self.flask_app.finalize_request(rv))
+
+    def _finish(self, environ, ctx, event, payload, result_format):
+        from app.routes.prompt_response import _query_event_response
+
+        with self.flask_app.request_context(environ):
+            try:
+                rv = _query_event_response(ctx, event, payload, result_format)
+            except Exception as e:
+                rv = self._handle_exception(e)
+            return self._as_asgi(self.flask_app.finalize_request(rv))
+
+    def _rejected(self, environ, retry_after):
+        from app.utils.rate_limits import rate_limited_response
+
+        with self.flask_app.request_context(environ):
+            rv = rate_limited_response(retry_after, "Too many queries in flight")
+            return self._as_asgi(self.flask_app.finalize_request(rv))
+
+    def _error(self, environ, error):
+        with self.flask_app.request_context(environ):
+            return self._as_asgi(self.flask_app.finalize_request(self._handle_exception(error)))
+
+    def _handle_exception(self, error):
+        try:
+            return self.flask_app.handle_user_exception(error)
+        except Exception as e:
+            return self.flask_app.handle_exception(e)
+
+    @staticmethod
+    def _as_asgi(response):
+        return response.status_code, _asgi_headers(response.headers.items()), response.get_data()
+
+
+def create_asgi_app():
+    return AsyncQueryApp(create_app())
@@ -2,6 +2,8 @@ from app import db
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime
+import json
+from app.utils.schema_render import render_schema
 
 class DatabaseConnection(db.Model):
     __tablename__ = 'Databases' 
@@ -14,6 +16,13 @@ class DatabaseConnection(db.Model):
     database_type = db.Column(db.String)
     database_status = db.Column(db.String)
     database_schema_json = db.Column(db.String)
+    database_schema_prompt = db.Column(db.String)  # Compact per-table rendering for LLM prompts
+    introspection_started_at = db.Column(db.DateTime)  # When the status last became "Introspecting"
+
+    def set_schema(self, schema):
+        """ Stores the schema together with its precomputed prompt rendering. """
+        self.database_schema_json = json.dumps(schema)
+        self.database_schema_prompt = json.dumps(render_schema(schema))
 
     def to_dict(self):
         return {
@@ -3,6 +3,8 @@ from flask import Blueprint, jsonify, request
 from app import db
 from app.models.apiModel import ApiKey
 from app.utils.key_utils import hash_api_key, generate_api_key
+from app.utils.api_key_cache import invalidate_api_key
+from app.utils.usage_recorder import pending_usage, key_rate
 from app.utils.clerk_auth import verify_clerk_token
 from datetime import datetime, timedelta
 
@@ -66,6 +68,7 @@ def delete_api_key():
 
     db.session.delete(api_key)
     db.session.commit()
+    invalidate_api_key(api_key.key_hash)
 
     return jsonify({
         "key_id": str(key_id),
@@ -97,10 +100,12 @@ def reset_api_key():
     raw_key = generate_api_key()
     hashed_key = hash_api_key(raw_key)
 
+    old_key = api_key.key_hash
     # api_key.key_hash = hashed_key
     api_key.key_hash = raw_key
     api_key.last_used_at = None
     db.session.commit()
+    invalidate_api_key(old_key)
 
     return jsonify({
         "key_id": str(api_key.key_id),
@@ -129,7 +134,9 @@ def list_api_keys():
             "created_at": key.created_at.isoformat(),
             "expires_at": key.expires_at.isoformat() if key.expires_at else None,
             "last_used_at": key.last_used_at.isoformat() if key.last_used_at else None,
-            "usage_count": key.usage_count,
+            # Include requests the usage recorder has not flushed yet
+            "usage_count": (key.usage_count or 0) + pending_usage(key.key_id),
+            "requests_per_second": round(key_rate(key.key_id), 3),
             "is_active": not expired
         })
 
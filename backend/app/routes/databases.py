@@ -1,13 +1,14 @@
-from flask import Blueprint, request, jsonify
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import OperationalError
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models.database_connection import DatabaseConnection 
 from app.utils.clerk_auth import verify_clerk_token
-from app.utils.nl2sql_utils import get_db_schema
-from app.utils.clerk_user_utils import get_clerk_user_email
-from app.utils.supabase_utils import ensure_user_in_supabase
+from app.utils.user_sync import ensure_user_known
+from app.utils.engine_registry import invalidate_engine
+from app.utils.schema_jobs import submit_introspection, get_job, mark_introspecting
+from app.utils.schema_render import schema_shape_error
+from app.utils import llm_cache, result_cache, schema_retrieval
 import json
+import uuid
 
 
 database_bp = Blueprint('databases', __name__)
@@ -15,10 +16,8 @@ database_bp = Blueprint('databases', __name__)
 def get_user_databases():
     user = verify_clerk_token()
     user_id = user["sub"]
-    email = get_clerk_user_email(user_id)
-    # print(f"[User Info] ID: {user_id}, Email: {email}")
-
-    ensure_user_in_supabase(user_id, email)
+    # Makes sure the user exists in Supabase, in the background and at most once per TTL
+    ensure_user_known(user_id)
 
     results = DatabaseConnection.query.filter_by(user_id=user_id).all()
     return jsonify([db.to_dict() for db in results])
@@ -29,10 +28,7 @@ def add_database():
     user = verify_clerk_token()
     print("User payload:", user)
     user_id = user["sub"]
-    email = get_clerk_user_email(user_id)
-    # print(f"[User Info] ID: {user_id}, Email: {email}")
-
-    # ensure_user_in_supabase(user_id, email)
+    ensure_user_known(user_id)
 
     data = request.get_json()
 
@@ -42,43 +38,22 @@ def add_database():
     if missing:
         return jsonify({"error": f"Missing fields: {', '.join(missing)}"}), 400
 
-    db_string = data["database_string"]
-    status = "Active"
-    schema_json = None
-
-    # ✅ Try to connect and fetch schema
-    try:
-        engine = create_engine(db_string)
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-
-        # If connection succeeds, try fetching schema
-        try:
-            schema = get_db_schema(engine)
-            schema_json = json.dumps(schema)
-        except Exception as schema_error:
-            # Schema fetching failed — still allow creation but mark schema empty
-            schema_json = json.dumps({})
-            print(f"[Schema Error] {schema_error}")
-
-    except Exception as conn_error:
-        status = "Inactive"
-        schema_json = json.dumps({})
-        print(f"[Connection Error] {conn_error}")
-
-    # ✅ Create and save database record
+    # ✅ Create the record now; connection test and schema fetch run in the background
     new_db = DatabaseConnection(
+        database_id=uuid.uuid4(),
         user_id=user_id,
-        database_string=db_string,
+        database_string=data["database_string"],
         database_name=data["database_name"],
         database_type=data["database_type"],
-        database_status=status,
-        database_schema_json=schema_json
     )
+    mark_introspecting(new_db)
+    new_db.set_schema({})
     db.session.add(new_db)
     db.session.commit()
 
-    return jsonify(new_db.to_dict()), 201
+    submit_introspection(current_app._get_current_object(), new_db.database_id, user_id)
+
+    return jsonify(new_db.to_dict()), 202
 
 # routes/databases.py
 
@@ -95,6 +70,9 @@ def delete_database(database_id):
 
     db.session.delete(db_conn)
     db.session.commit()
+    invalidate_engine(database_id)
+    llm_cache.invalidate_database(database_id)
+    result_cache.invalidate_database(database_id)
 
     return jsonify({"message": "Database deleted"}), 200
 
@@ -114,17 +92,35 @@ def update_database(database_id):
     db_conn.database_type = data.get("database_type", db_conn.database_type)
     db_conn.database_string = data.get("database_string", db_conn.database_string)
     db_conn.database_name = data.get("database_name", db_conn.database_name)
-
-    try:
-        engine = create_engine(db_conn.database_string)
-        schema = get_db_schema(engine)
-        print("✅ Updated schema fetched:", schema)
-        db_conn.database_schema_json = json.dumps(schema)
-    except Exception as e:
-        print("❌ Failed to fetch updated schema:", e)
+    mark_introspecting(db_conn)
 
     db.session.commit()
-    return jsonify(db_conn.to_dict())
+    invalidate_engine(database_id)
+    llm_cache.invalidate_database(database_id)
+    result_cache.invalidate_database(database_id)
+
+    # Schema is re-fetched in the background; poll /status for completion
+    submit_introspection(current_app._get_current_object(), db_conn.database_id, user_id)
+    return jsonify(db_conn.to_dict()), 202
+
+
+@database_bp.route("/api/databases/<string:database_id>/status", methods=["GET"])
+def get_database_status(database_id):
+    """
+    Reports the database status and the state of its latest introspection job.
+    """
+    user = verify_clerk_token()
+    user_id = user["sub"]
+
+    db_conn = DatabaseConnection.query.filter_by(database_id=database_id, user_id=user_id).first()
+    if not db_conn:
+        return jsonify({"error": "Database not found or unauthorized"}), 404
+
+    return jsonify({
+        "database_id": str(db_conn.database_id),
+        "database_status": db_conn.database_status,
+        "job": get_job(db_conn.database_id)
+    })
 
 
 
@@ -164,10 +160,15 @@ def update_database_schema(database_id):
     updated_schema_data = request.get_json()
     if not updated_schema_data:
         return jsonify({"error": "Invalid request body"}), 400
+    shape_error = schema_shape_error(updated_schema_data)
+    if shape_error:
+        return jsonify({"error": shape_error}), 400
 
     # We replace the old schema with the new, updated one.
-    db_conn.database_schema_json = json.dumps(updated_schema_data)
+    db_conn.set_schema(updated_schema_data)
     
     db.session.commit()
+    schema_retrieval.build_index(database_id, updated_schema_data)
+    llm_cache.invalidate_database(database_id)
     
     return jsonify({"message": "Schema descriptions updated successfully"}), 200
\ No newline at end of file
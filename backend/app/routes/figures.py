@@ -0,0 +1,92 @@
+import json
+import uuid
+from flask import Blueprint, request, jsonify
+from app.models.messageModel import Message
+from app.models.database_connection import DatabaseConnection
+from app.utils.api_verification_utils import get_request_user_id
+from app.utils.engine_registry import get_engine
+from app.utils.figure_utils import SPEC_FIELDS, get_figure, spec_hash
+from app.utils.nl2sql_utils import execute_query
+from app.utils.result_cache import make_result_key, get_cached_results
+from app.utils.result_store import read_page
+
+figures_bp = Blueprint("figures", __name__)
+
+
+def _load_rows(response, user_id):
+    """
+    Full result rows for a stored response: the spilled result, then the
+    result cache, then re-running the query; the stored first page is the
+    last resort.
+    """
+    handle = response.get("result_handle")
+    if not handle:
+        return response.get("results") or []
+
+    rows, _ = read_page(handle["id"], user_id, 0, handle["total_rows"])
+    if rows is not None:
+        return rows
+
+    database_id = response.get("database_id")
+    if database_id:
+        cached = get_cached_results(make_result_key(database_id, response["query"]))
+        if cached is not None:
+            return cached["rows"]
+
+        db_obj = DatabaseConnection.query.filter_by(database_id=database_id, user_id=user_id).first()
+        if db_obj:
+            try:
+                rows, err = execute_query(response["query"], get_engine(db_obj.database_id, db_obj.database_string))
+                if not err:
+                    return rows
+            except Exception as e:
+                print(f"[Figures] Could not re-run query for figure: {e}")
+    return response.get("results") or []
+
+
+# 📊 GET /api/messages/<message_id>/figure - Render (or fetch the cached) chart for a message
+@figures_bp.route("/api/messages/<string:message_id>/figure", methods=["GET"])
+def get_message_figure(message_id):
+    """
+    Query parameters matching the spec fields (type, x_axis, y_axis, color,
+    names_axis, values_axis, title) override the stored spec.
+    """
+    user_id = get_request_user_id()
+    try:
+        message_uuid = uuid.UUID(message_id)
+    except ValueError:
+        return jsonify({"error": "Message not found"}), 404
+
+    message = Message.query.filter_by(message_id=message_uuid, user_id=user_id).first()
+    if not message:
+        return jsonify({"error": "Message not found"}), 404
+
+    try:
+        response = json.loads(message.response or "")
+    except (json.JSONDecodeError, TypeError):
+        response = None
+    spec = response.get("visualization") if isinstance(response, dict) else None
+    if not spec:
+        return jsonify({"error": "This message has no visualization"}), 404
+
+    if spec.get("figure_json"):
+        # Messages saved before figures were deferred carry their figure inline
+        return jsonify({
+            "message_id": message_id,
+            "figure_json": spec["figure_json"],
+            "sampling": spec.get("sampling", {"applied": False}),
+            "cached": True
+        })
+
+    spec = {**spec, **{field: request.args[field] for field in SPEC_FIELDS if field in request.args}}
+    figure, cache_hit = get_figure(message_id, spec, lambda: _load_rows(response, user_id))
+    if figure["figure_json"] is None:
+        return jsonify({"error": "Could not build a figure for this message"}), 422
+
+    return jsonify({
+        "message_id": message_id,
+        "spec_hash": spec_hash(spec),
+        "figure_json": figure["figure_json"],
+        "sampling": figure["sampling"],
+        "cached": cache_hit
+    })
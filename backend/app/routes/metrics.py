@@ -0,0 +1,17 @@
+import hmac
+from flask import Blueprint, jsonify, request
+from config import Config
+from app.utils import metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# 📊 GET /api/metrics - Cache, pool and latency stats for this worker
+# Process-wide, so it is for operators only (METRICS_TOKEN), not Clerk users
+@metrics_bp.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    if not Config.METRICS_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    token = request.headers.get("X-Metrics-Token", "")
+    if not hmac.compare_digest(token.encode(), Config.METRICS_TOKEN.encode()):
+        return jsonify({"error": "Invalid metrics token"}), 401
+    return jsonify(metrics.snapshot())
@@ -1,148 +1,358 @@
-import uuid
-import os, json
+import json
+from types import SimpleNamespace
+from config import Config
 from app import db
-from sqlalchemy import create_engine
-from datetime import datetime, date
 from app.utils.api_verification_utils import verify_api_key
-from app.models.messageModel import Message
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from app.models.database_connection import DatabaseConnection
-from app.models.apiModel import ApiKey
 from app.utils.clerk_auth import verify_clerk_token, get_authorization_type
-from app.utils.nl2sql_utils import get_openai_response, execute_query, get_db_schema , create_visualization
-from app.utils.nl2sql_utils import get_openai_response, execute_query, get_db_schema, create_visualization, is_query_safe
+from app.utils.engine_registry import get_engine
+from app.utils.schema_jobs import introspection_pending, mark_introspecting, submit_introspection
+from app.utils.query_pipeline import run_query_pipeline, convert_dates
+from app.utils.query_batch import run_batch
+from app.utils.rate_limits import rate_limit_identity, take_requests, rate_limited_response
+from app.utils.admission import query_admission, AdmissionRejected
+from app.utils.result_format import (
+    FORMAT_RECORDS, FORMAT_COLUMNAR, FORMAT_ARROW, ARROW_MIMETYPE,
+    negotiate_format, arrow_available, to_columnar, to_arrow_ipc
+)
 
 llm_bp = Blueprint("llm", __name__)
-def convert_dates(obj):
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    return obj
 
-@llm_bp.route("/api/query", methods=["POST"])
-def handle_llm_query():
 
+def _authenticate():
+    """ Returns (user_id, auth_type, None) or (None, None, error_response). """
     auth = get_authorization_type()
     if auth == "token":
-        user = verify_clerk_token() 
-        user_id = user["sub"]
-
-        data = request.get_json()
-        prompt = data.get("prompt")
-        database_id = data.get("database_id")
-        history = data.get("history", [])
+        user = verify_clerk_token()
+        return user["sub"], auth, None
     elif auth == "key":
         db_key = verify_api_key()
-        data = request.get_json()
-        prompt = data.get("prompt")
-        database_name = data.get("database_name")        
-        user_id = db_key.user_id
-        db_obj = DatabaseConnection.query.filter_by(database_name=database_name, user_id=user_id).first()
-        if not db_obj:
-            return jsonify({"error": "Database not found"}), 404
+        return db_key.user_id, auth, None
+    return None, None, (jsonify({"error" : "Invalid Authentication Header"}), 400)
+
 
-        database_id = db_obj.database_id
-        history = data.get("history", [])
+def _target_database_id(auth, user_id, data):
+    """ API-key clients name the database, token clients send its id. Returns (id, error_response). """
+    if auth == "key":
+        db_obj = DatabaseConnection.query.filter_by(database_name=data.get("database_name"), user_id=user_id).first()
+        if not db_obj:
+            return None, (jsonify({"error": "Database not found"}), 404)
+        return db_obj.database_id, None
+    return data.get("database_id"), None
 
-    elif not auth:
-        return jsonify({"error" : "Invalid Authentication Header"}), 400
 
+def _schema_pending():
+    return jsonify({"error": "Database schema is still being fetched, please try again shortly"}), 409
 
-    if not prompt or not database_id:
-        return jsonify({"error": "Missing prompt or database_id"}), 400
 
+def _load_database(user_id, database_id, prompt=None):
+    """ Loads the database row, its engine and schema. Returns (target, None) or (None, error_response). """
     db_obj = DatabaseConnection.query.filter_by(database_id=database_id, user_id=user_id).first()
     if not db_obj:
-        return jsonify({"error": "Database not found"}), 404
+        return None, (jsonify({"error": "Database not found"}), 404)
+    if introspection_pending(db_obj):
+        return None, _schema_pending()
+    if not db_obj.database_schema_json or db_obj.database_schema_json == "{}":
+        # Never introspect inline; a background job fetches the schema
+        mark_introspecting(db_obj)
+        db.session.commit()
+        submit_introspection(current_app._get_current_object(), db_obj.database_id, user_id)
+        return None, _schema_pending()
 
     try:
-        engine = create_engine(db_obj.database_string)
+        engine = get_engine(db_obj.database_id, db_obj.database_string)
     except Exception as e:
-        return jsonify({"error": f"Failed to connect to database: {str(e)}"}), 500
+        return None, (jsonify({"error": f"Failed to connect to database: {str(e)}"}), 500)
 
     try:
-        if db_obj.database_schema_json and db_obj.database_schema_json != "{}":
-            schema = json.loads(db_obj.database_schema_json)
-        else:
-            schema = get_db_schema(engine)
-            db_obj.database_schema_json = json.dumps(schema)
-            db.session.commit()
+        schema = json.loads(db_obj.database_schema_json)
     except Exception as e:
-        return jsonify({"message": {
+        return None, (jsonify({"message": {
             "prompt": prompt,
-            "response": f"Failed to load or fetch database schema: {e}"
-        }}), 500
+            "response": f"Failed to load database schema: {e}"
+        }}), 500)
 
+    return {"db_obj": db_obj, "engine": engine, "schema": schema}, None
 
-    llm_response, error = get_openai_response(prompt, schema, history, api_key=os.getenv("OPENAI_API_KEY"))
-    if error:
-        return jsonify({"message": {
-            "prompt": prompt,
-            "response": f"LLM Error: {error}"
-        }}), 200
-        
-    generated_sql = llm_response.get("sql_query", "")
-    
-    # --- MODIFIED ERROR RESPONSE ---
-    # This section is changed to return the simple text message you wanted.
-    if not is_query_safe(generated_sql) or not generated_sql:
+
+def _detach_database(ctx):
+    """ Swaps ctx["db_obj"] for the plain fields the pipeline reads, for use outside this request's session. """
+    db_obj = ctx["db_obj"]
+    ctx["db_obj"] = SimpleNamespace(
+        database_id=db_obj.database_id,
+        database_schema_prompt=db_obj.database_schema_prompt,
+    )
+    return ctx
+
+
+def _request_options(data):
+    return {
+        # LLM tokens are charged to this caller (see rate_limits)
+        "identity": rate_limit_identity(),
+        "chat_id": data.get("chat_id", None),
+        # "use_cache": false skips cached answers for this request and refreshes them
+        "use_cache": data.get("use_cache", True) is not False,
+        # "visualization": false leaves out the chart spec (e.g. API-key clients)
+        "include_visualization": data.get("visualization", True) is not False,
+    }
+
+
+def _prepare_query():
+    """
+    Authenticates the request and loads the target database and its schema.
+    Returns (ctx, None) on success or (None, error_response).
+    """
+    user_id, auth, error_response = _authenticate()
+    if error_response:
+        return None, error_response
+
+    data = request.get_json()
+    prompt = data.get("prompt")
+    database_id, error_response = _target_database_id(auth, user_id, data)
+    if error_response:
+        return None, error_response
+
+    if not prompt or not database_id:
+        return None, (jsonify({"error": "Missing prompt or database_id"}), 400)
+
+    target, error_response = _load_database(user_id, database_id, prompt)
+    if error_response:
+        return None, error_response
+
+    return {
+        "user_id": user_id,
+        "prompt": prompt,
+        "history": data.get("history", []),
+        **_request_options(data),
+        **target,
+    }, None
+
+
+def _encode_query_response(prompt, payload, result_format):
+    if result_format == FORMAT_RECORDS:
         return jsonify({"message": {
+            "message_id": payload["message_id"],
             "prompt": prompt,
-            "response": "Your query is too broad, please provide a valid prompt."
+            "response": payload["response"]
         }}), 200
-    
-    df, err = execute_query(generated_sql, engine)
-    if err:
+
+    result = payload["result"]
+    if result_format == FORMAT_ARROW:
+        metadata = {key: value for key, value in result.items() if key != "results"}
+        metadata.update({"prompt": prompt, "message_id": payload["message_id"]})
+        return Response(to_arrow_ipc(result["results"], metadata=metadata), mimetype=ARROW_MIMETYPE)
+
+    result = {**result, "results": to_columnar(result["results"]), "results_format": FORMAT_COLUMNAR}
+    return jsonify({"message": {
+        "message_id": payload["message_id"],
+        "prompt": prompt,
+        "response": json.dumps(result, default=convert_dates)
+    }}), 200
+
+
+def _admit(ctx):
+    """ Waits for a query slot (see admission). Returns (ticket, None) or (None, 429 response). """
+    try:
+        return query_admission.acquire(ctx["identity"]), None
+    except AdmissionRejected as e:
+        return None, rate_limited_response(e.retry_after, "Too many queries in flight")
+
+
+def _query_format():
+    """ Returns (result_format, None) or (None, error_response) for this request. """
+    body = request.get_json(silent=True) or {}
+    result_format = negotiate_format(body.get("format") or request.args.get("format"), request.accept_mimetypes)
+    if result_format is None:
+        return None, (jsonify({"error": "format must be one of records, columnar, arrow"}), 400)
+    if result_format == FORMAT_ARROW and not arrow_available():
+        return None, (jsonify({"error": "Arrow output is not available on this server"}), 406)
+    return result_format, None
+
+
+def _query_event_response(ctx, event, payload, result_format):
+    """ The /api/query reply for the pipeline's terminal event ("error" or "done"). """
+    if event == "error":
+        headers = {"Retry-After": str(payload["retry_after"])} if payload.get("retry_after") else {}
         return jsonify({"message": {
-            "prompt": prompt,
-            "response": json.dumps({
-                "query": generated_sql,
-                "explanation": f"An error occurred while executing the query: {err}",
-                "results": [],
-                "visualization": {"type": "none"}
-            })
-        }}), 200
-    
-    visualization = create_visualization(df, llm_response)
-    visualization_json = None
-
-    print(visualization)
-    print(llm_response)
-    
-    if visualization and not (isinstance(visualization, dict) and 'error' in visualization):
+            "prompt": ctx["prompt"],
+            "response": payload["response"]
+        }}), payload.get("status", 200), headers
+    return _encode_query_response(ctx["prompt"], payload, result_format)
+
+
+@llm_bp.route("/api/query", methods=["POST"])
+def handle_llm_query():
+    """
+    Results default to a list of row objects. Pass "format": "columnar" or
+    "arrow" (in the body or query string), or an Accept header for the
+    columnar/Arrow media types, to get a more compact encoding.
+    """
+    result_format, error_response = _query_format()
+    if error_response:
+        return error_response
+
+    ctx, error_response = _prepare_query()
+    if error_response:
+        return error_response
+
+    ticket, error_response = _admit(ctx)
+    if error_response:
+        return error_response
+    try:
+        for event, payload in run_query_pipeline(ctx):
+            if event in ("error", "done"):
+                return _query_event_response(ctx, event, payload, result_format)
+    finally:
+        query_admission.release(ticket)
+
+
+@llm_bp.route("/api/query/stream", methods=["POST"])
+def handle_llm_query_stream():
+    """
+    Same request body as /api/query, answered as Server-Sent Events:
+    llm, rows (repeated), visualization (unless opted out), then done (or error).
+    With "Accept: application/x-ndjson" each event is one JSON line instead.
+    """
+    ctx, error_response = _prepare_query()
+    if error_response:
+        return error_response
+
+    ticket, error_response = _admit(ctx)
+    if error_response:
+        return error_response
+    released = []
+
+    def release():
+        # Called by the generator and on response close; only the first call counts
+        if not released:
+            released.append(True)
+            query_admission.release(ticket)
+
+    def generate():
         try:
-            visualization_json = visualization.to_json()
-        except Exception as e:
-            print(f"Error serializing visualization to JSON: {e}")
-            # Keep visualization_json as None if serialization fails
-
-
-
-    response_dict = {
-        "query": llm_response["sql_query"],
-        "explanation": llm_response["explanation"],
-        "results": df,
-        "visualization": {
-            "type": llm_response["visualization"],
-            "x_axis": llm_response.get("x_axis"),
-            "y_axis": llm_response.get("y_axis"),
-            "color": llm_response.get("color"),
-            "title": llm_response.get("title"),
-            "why": llm_response.get("visualization_explanation"),
-            "figure_json": visualization_json  
-        }
-    }
+            for event, payload in run_query_pipeline(ctx):
+                if event == "done":
+                    # The client already has every other piece
+                    payload = {"message_id": payload["message_id"], "figure_url": payload["figure_url"]}
+                yield event, payload
+        finally:
+            release()
+
+    response = _event_stream(generate())
+    # The generator's finally never runs if the response is closed before the first chunk
+    response.call_on_close(release)
+    return response
 
-    new_message = Message(
-        message_id=str(uuid.uuid4()),
-        chat_id=data.get("chat_id", None),
-        user_id=user_id,
-        prompt=prompt,
-        response=json.dumps(response_dict, default=convert_dates),
+
+def _event_stream(events):
+    """ Streams (event, payload) pairs as Server-Sent Events, or NDJSON if the client accepts it. """
+    ndjson = request.accept_mimetypes.best == "application/x-ndjson"
+
+    def generate():
+        for event, payload in events:
+            if ndjson:
+                yield json.dumps({"event": event, "data": payload}, default=convert_dates) + "\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(payload, default=convert_dates)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    db.session.add(new_message)
-    db.session.commit()
 
-    return jsonify({"message": {
-        "prompt": prompt,
-        "response": json.dumps(response_dict, default=convert_dates)
-    }})
+
+def _run_batch_item(ctx):
+    """ Runs one batch item through the pipeline; errors are returned, not raised. """
+    if not ctx["prompt"]:
+        return {"prompt": ctx["prompt"], "error": "Missing prompt"}
+    try:
+        ticket = query_admission.acquire(ctx["identity"])
+    except AdmissionRejected as e:
+        return {"prompt": ctx["prompt"], "error": f"Too many queries in flight, retry in {e.retry_after} seconds"}
+    try:
+        for event, payload in run_query_pipeline(ctx):
+            if event == "error":
+                return {"prompt": ctx["prompt"], "error": payload["response"]}
+            if event == "done":
+                return {"prompt": ctx["prompt"], "message_id": payload["message_id"], "response": payload["response"]}
+    except Exception as e:
+        db.session.rollback()
+        return {"prompt": ctx["prompt"], "error": f"Failed to run query: {e}"}
+    finally:
+        query_admission.release(ticket)
+
+
+@llm_bp.route("/api/query/batch", methods=["POST"])
+def handle_llm_query_batch():
+    """
+    Runs many prompts against one database. Same body as /api/query, with
+    "prompts" (strings, or {"prompt", "history"} objects) instead of "prompt"
+    and an optional "concurrency" (at most QUERY_BATCH_CONCURRENCY).
+    Authentication and the schema are loaded once for the whole batch.
+
+    Returns {"results": [...]} in request order, one entry per prompt with
+    either "message_id"/"response" or "error". With "stream": true each item
+    is sent as an "item" event (with its "index") as soon as it finishes,
+    followed by "done"; see /api/query/stream for the encodings.
+    """
+    user_id, auth, error_response = _authenticate()
+    if error_response:
+        return error_response
+
+    data = request.get_json()
+    prompts = data.get("prompts")
+    if not isinstance(prompts, list) or not prompts:
+        return jsonify({"error": "prompts must be a non-empty list"}), 400
+    if len(prompts) > Config.QUERY_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"A batch can hold at most {Config.QUERY_BATCH_MAX_ITEMS} prompts"}), 400
+    try:
+        concurrency = int(data.get("concurrency") or Config.QUERY_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    concurrency = max(1, min(concurrency, Config.QUERY_BATCH_CONCURRENCY))
+
+    # One request token per prompt; the request itself already took one
+    error_response = take_requests(len(prompts) - 1)
+    if error_response:
+        return error_response
+
+    database_id, error_response = _target_database_id(auth, user_id, data)
+    if error_response:
+        return error_response
+    if not database_id:
+        return jsonify({"error": "Missing database_id"}), 400
+
+    target, error_response = _load_database(user_id, database_id)
+    if error_response:
+        return error_response
+
+    # Items run on other threads, each with its own app context and session
+    base_ctx = _detach_database({"user_id": user_id, **_request_options(data), **target})
+    item_ctxs = []
+    for item in prompts:
+        item = item if isinstance(item, dict) else {"prompt": item}
+        item_ctxs.append({**base_ctx, "prompt": item.get("prompt"), "history": item.get("history", [])})
+
+    app = current_app._get_current_object()
+
+    def run_item(ctx):
+        with app.app_context():
+            return _run_batch_item(ctx)
+
+    completed = run_batch(item_ctxs, run_item, concurrency)
+    if data.get("stream"):
+        def generate():
+            errors = 0
+            for index, result in completed:
+                errors += "error" in result
+                yield "item", {"index": index, **result}
+            yield "done", {"count": len(item_ctxs), "errors": errors}
+
+        return _event_stream(generate())
+
+    results = [None] * len(item_ctxs)
+    for index, result in completed:
+        results[index] = {"index": index, **result}
+    return jsonify({"database_id": str(base_ctx["db_obj"].database_id), "results": results}), 200
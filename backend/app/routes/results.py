@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify, Response
+from config import Config
+from app.utils.api_verification_utils import get_request_user_id
+from app.utils.result_store import read_page
+from app.utils.result_format import (
+    FORMAT_COLUMNAR, FORMAT_ARROW, ARROW_MIMETYPE,
+    negotiate_format, arrow_available, to_columnar, to_arrow_ipc
+)
+
+results_bp = Blueprint("results", __name__)
+
+# 📄 GET /api/results/<result_id>?offset=&limit= - Page through a spilled query result
+@results_bp.route("/api/results/<string:result_id>", methods=["GET"])
+def get_result_page(result_id):
+    user_id = get_request_user_id()
+    result_format = negotiate_format(request.args.get("format"), request.accept_mimetypes)
+    if result_format is None:
+        return jsonify({"error": "format must be one of records, columnar, arrow"}), 400
+    if result_format == FORMAT_ARROW and not arrow_available():
+        return jsonify({"error": "Arrow output is not available on this server"}), 406
+
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = min(int(request.args.get("limit", Config.QUERY_PAGE_SIZE)), Config.QUERY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    if offset < 0 or limit <= 0:
+        return jsonify({"error": "offset must be >= 0 and limit > 0"}), 400
+
+    rows, index = read_page(result_id, user_id, offset, limit)
+    if rows is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+
+    next_offset = offset + len(rows)
+    page = {
+        "result_id": result_id,
+        "columns": index["columns"],
+        "rows": rows,
+        "offset": offset,
+        "total_rows": index["total_rows"],
+        "truncated": index["truncated"],
+        "next_offset": next_offset if next_offset < index["total_rows"] else None
+    }
+    if result_format == FORMAT_ARROW:
+        metadata = {key: value for key, value in page.items() if key not in ("rows", "columns")}
+        return Response(to_arrow_ipc(rows, index["columns"], metadata), mimetype=ARROW_MIMETYPE)
+    if result_format == FORMAT_COLUMNAR:
+        page["rows"] = to_columnar(rows, index["columns"])
+        page["rows_format"] = FORMAT_COLUMNAR
+    return jsonify(page)
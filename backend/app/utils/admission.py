@@ -0,0 +1,195 @@
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from config import Config
+from app.utils import metrics
+
+# --- Query Admission Control ---
+# Caps NL -> SQL queries in flight (LLM call + SQL execution) per process:
+#
+#   QUERY_MAX_IN_FLIGHT             across all tenants
+#   QUERY_MAX_IN_FLIGHT_PER_TENANT  per API key / Clerk user (the rate limit
+#                                   identity, see rate_limits)
+#
+# A query that cannot start waits in a bounded queue (QUERY_QUEUE_MAX, at most
+# QUERY_QUEUE_MAX_PER_TENANT per tenant) for up to QUERY_QUEUE_TIMEOUT
+# seconds. Freed slots go to tenants round-robin, FIFO within a tenant, so a
+# tenant with a deep backlog cannot hold everybody else back. When the queue
+# is full, or the wait times out, AdmissionRejected is raised right away with
+# a Retry-After estimate based on recent query durations.
+#
+# acquire() blocks a worker thread; acquire_async() waits on the event loop
+# (app.asgi). Both share the same slots. Under ASGI, /api/query/stream and
+# /api/query/batch still use acquire(), which blocks one of the
+# ASYNC_WSGI_WORKERS pool threads rather than the event loop or the other
+# WSGI routes.
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("tenant", "granted", "event", "loop", "future")
+
+    def __init__(self, tenant, loop=None):
+        self.tenant = tenant
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight, max_per_tenant, queue_max, queue_max_per_tenant, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_per_tenant = max_per_tenant
+        self.queue_max = queue_max
+        self.queue_max_per_tenant = queue_max_per_tenant
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._tenant_in_flight = {}
+        self._queues = OrderedDict()  # tenant -> deque of waiters, in round-robin order
+        self._avg_duration = 1.0      # EWMA of query seconds, for Retry-After
+        self._lock = threading.Lock()
+
+    def _can_start(self, tenant):
+        return self.in_flight < self.max_in_flight and self._tenant_in_flight.get(tenant, 0) < self.max_per_tenant
+
+    def _start(self, tenant):
+        self.in_flight += 1
+        self._tenant_in_flight[tenant] = self._tenant_in_flight.get(tenant, 0) + 1
+
+    def _retry_after(self):
+        backlog = (self.queued + 1) / max(1, self.max_in_flight)
+        return max(1, math.ceil(self._avg_duration * backlog))
+
+    def _enqueue(self, tenant, loop=None):
+        """ Starts the query now (None) or queues it (waiter); raises when the queue is full. """
+        with self._lock:
+            if tenant not in self._queues and self._can_start(tenant):
+                self._start(tenant)
+                return None
+            queue = self._queues.get(tenant)
+            if self.queued >= self.queue_max or (queue and len(queue) >= self.queue_max_per_tenant):
+                metrics.incr("admission.rejected_queue_full")
+                raise AdmissionRejected("queue full", self._retry_after())
+            waiter = _Waiter(tenant, loop)
+            self._queues.setdefault(tenant, deque()).append(waiter)
+            self.queued += 1
+            return waiter
+
+    def _dispatch(self):
+        """ Hands free slots to queued waiters, one tenant at a time (caller holds the lock). """
+        while self._queues and self.in_flight < self.max_in_flight:
+            for tenant in self._queues:
+                if self._tenant_in_flight.get(tenant, 0) < self.max_per_tenant:
+                    break
+            else:
+                return
+            queue = self._queues.pop(tenant)
+            waiter = queue.popleft()
+            if queue:
+                # Back of the rotation
+                self._queues[tenant] = queue
+            self.queued -= 1
+            self._start(tenant)
+            waiter.wake()
+
+    def _abandon(self, waiter):
+        """ Takes a waiter that gave up out of the queue. Returns True if it was granted meanwhile. """
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue = self._queues.get(waiter.tenant)
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.tenant]
+            self.queued -= 1
+            return False
+
+    def _admitted(self, tenant, queued_at):
+        metrics.incr("admission.admitted")
+        metrics.observe("admission.wait_ms", (time.monotonic() - queued_at) * 1000)
+        return tenant, time.monotonic()
+
+    def _timed_out(self):
+        metrics.incr("admission.rejected_timeout")
+        with self._lock:
+            return AdmissionRejected("queue timeout", self._retry_after())
+
+    def acquire(self, tenant):
+        """ Waits for a slot for `tenant`; returns a ticket for release(). """
+        queued_at = time.monotonic()
+        waiter = self._enqueue(tenant)
+        if waiter is not None and not waiter.event.wait(self.queue_timeout) and not self._abandon(waiter):
+            raise self._timed_out()
+        return self._admitted(tenant, queued_at)
+
+    async def acquire_async(self, tenant):
+        """ acquire() for the event loop. """
+        queued_at = time.monotonic()
+        waiter = self._enqueue(tenant, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                # Client went away while queued; hand back a slot granted meanwhile
+                if self._abandon(waiter):
+                    self.release((tenant, time.monotonic()))
+                raise
+        return self._admitted(tenant, queued_at)
+
+    def release(self, ticket):
+        tenant, started_at = ticket
+        with self._lock:
+            self.in_flight -= 1
+            remaining = self._tenant_in_flight[tenant] - 1
+            if remaining:
+                self._tenant_in_flight[tenant] = remaining
+            else:
+                del self._tenant_in_flight[tenant]
+            self._avg_duration += 0.1 * ((time.monotonic() - started_at) - self._avg_duration)
+            self._dispatch()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "tenants_in_flight": len(self._tenant_in_flight),
+                "tenants_queued": len(self._queues),
+                "avg_query_s": round(self._avg_duration, 3),
+            }
+
+
+query_admission = AdmissionController(
+    Config.QUERY_MAX_IN_FLIGHT,
+    Config.QUERY_MAX_IN_FLIGHT_PER_TENANT,
+    Config.QUERY_QUEUE_MAX,
+    Config.QUERY_QUEUE_MAX_PER_TENANT,
+    Config.QUERY_QUEUE_TIMEOUT,
+)
+
+metrics.register_gauge("admission", query_admission.stats)
@@ -0,0 +1,82 @@
+import time
+import threading
+from datetime import datetime
+from collections import OrderedDict, namedtuple
+from config import Config
+from app import db
+from app.models.apiModel import ApiKey
+from app.utils import metrics
+from app.utils.key_utils import hash_api_key
+
+# --- Verified API Key Cache ---
+# Caches the result of the active-key lookup under the SHA-256 of the
+# presented key, so API-key requests normally skip the database:
+#
+#   found      kept for API_KEY_CACHE_TTL seconds, never past expires_at
+#   not found  kept for API_KEY_NEGATIVE_TTL seconds, so clients retrying a
+#              bad key do not hit Postgres on every call
+#
+# delete_api_key/reset_api_key invalidate the entry in this worker; other
+# workers see the change once their entry's TTL runs out.
+ApiKeyRecord = namedtuple("ApiKeyRecord", ["key_id", "user_id", "key_name", "expires_at", "is_active"])
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _lookup(raw_key):
+    row = (
+        db.session.query(ApiKey.key_id, ApiKey.user_id, ApiKey.key_name, ApiKey.expires_at)
+        .filter(ApiKey.key_hash == raw_key, ApiKey.is_active.is_(True))
+        .first()
+    )
+    if row is None:
+        return None
+    return ApiKeyRecord(row.key_id, row.user_id, row.key_name, row.expires_at, True)
+
+
+def get_key_record(raw_key):
+    """ Returns the ApiKeyRecord for an active key, or None if there is no such key. """
+    key_hash = hash_api_key(raw_key)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key_hash)
+        if entry and entry[1] > now:
+            _entries.move_to_end(key_hash)
+            metrics.incr("api_key_cache.hits")
+            return entry[0]
+    metrics.incr("api_key_cache.misses")
+
+    # Keys are stored as issued (see api_keys.create_api_key), so the lookup
+    # uses the raw key; the cache itself only ever holds its hash.
+    record = _lookup(raw_key)
+    if record is None:
+        cached_until = now + Config.API_KEY_NEGATIVE_TTL
+    else:
+        cached_until = now + Config.API_KEY_CACHE_TTL
+        if record.expires_at:
+            # expires_at is naive UTC, like datetime.utcnow() in is_key_valid
+            expires_in = (record.expires_at - datetime.utcnow()).total_seconds()
+            if expires_in > 0:
+                cached_until = min(cached_until, now + expires_in)
+            else:
+                # Already expired: remember it like a missing key
+                cached_until = now + Config.API_KEY_NEGATIVE_TTL
+
+    with _lock:
+        _entries[key_hash] = (record, cached_until)
+        _entries.move_to_end(key_hash)
+        while len(_entries) > Config.API_KEY_CACHE_MAX:
+            _entries.popitem(last=False)
+    return record
+
+
+def invalidate_api_key(raw_key):
+    """ Drops the cached lookup for a key (call after deleting or rotating it). """
+    if not raw_key:
+        return
+    with _lock:
+        _entries.pop(hash_api_key(raw_key), None)
+
+
+metrics.register_gauge("api_key_cache", lambda: {"entries": len(_entries)})
@@ -1,19 +1,16 @@
-from datetime import datetime
 from flask import request, abort
-from app.models.apiModel import ApiKey
-from app.utils.key_utils import hash_api_key
 from app.routes.api_keys import is_key_valid
-from app import db
+from app.utils.api_key_cache import get_key_record
+from app.utils.usage_recorder import record_usage
+from app.utils.clerk_auth import verify_clerk_token, get_authorization_type
 
 def verify_api_key():
     api_key = request.headers.get("x-api-key", None)
     if not api_key:
         abort(401, "Missing API Key")
 
-    # hashed_key = hash_api_key(api_key)
-    hashed_key = api_key
-    
-    db_key = ApiKey.query.filter_by(key_hash=hashed_key, is_active=True).first()
+    # Served from the verified-key cache; only misses query the database
+    db_key = get_key_record(api_key)
     if not db_key:
         abort(401, "Invalid or Inactive API Key")
         
@@ -22,4 +19,19 @@ def verify_api_key():
     if not is_key_valid(db_key):
         abort(401, "API key is expired or inactive")
 
+    # usage_count/last_used_at are written in batches by the usage recorder
+    record_usage(db_key.key_id)
     return db_key 
+
+
+def get_request_user_id():
+    """
+    Resolves the caller's user id from either a Clerk bearer token or an
+    x-api-key header, aborting with 401 when neither is valid.
+    """
+    auth = get_authorization_type()
+    if auth == "token":
+        return verify_clerk_token()["sub"]
+    if auth == "key":
+        return verify_api_key().user_id
+    abort(401, "Missing or invalid Authorization header")
@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from app.utils import metrics
+
+# --- Cache Backends ---
+# Both backends store serialized values (str or bytes) under string keys of the
+# form "<database_id>:<digest>", so a whole database can be dropped with
+# delete_prefix(). Entries expire after their TTL and the least recently used
+# entries are evicted once the byte budget is exceeded.
+
+
+def _size(value):
+    """ Size of a cached value in bytes; str values count as UTF-8, as stored. """
+    return len(value.encode()) if isinstance(value, str) else len(value)
+
+
+class MemoryCache:
+    """ In-process LRU cache with per-entry TTL and a byte budget. """
+
+    def __init__(self, name, max_bytes, max_entries=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.incr(f"{self.name}.{'hits' if entry is not None else 'misses'}")
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl, size)
+            self._bytes += size
+            evicted = 0
+            while self._bytes > self.max_bytes or (
+                self.max_entries and len(self._entries) > self.max_entries
+            ):
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            metrics.incr(f"{self.name}.evictions", evicted)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+class SQLiteCache:
+    """ Cache shared by all worker processes on a host, stored in a local SQLite file. """
+
+    def __init__(self, name, path, max_bytes):
+        self.name = name
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"[Cache Error] {self.name}: {e}")
+            row = None
+        metrics.incr(f"{self.name}.{'hits' if row is not None else 'misses'}")
+        return row[0] if row is not None else None
+
+    def set(self, key, value, ttl):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + ttl, now),
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+        except sqlite3.Error as e:
+            print(f"[Cache Error] {self.name}: {e}")
+
+    def _evict(self, conn, overflow):
+        freed, keys = 0, []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY last_access"):
+            keys.append(key)
+            freed += size
+            if freed >= overflow:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+        metrics.incr(f"{self.name}.evictions", len(keys))
+
+    def delete(self, key):
+        try:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"[Cache Error] {self.name}: {e}")
+
+    def delete_prefix(self, prefix):
+        try:
+            self._connect().execute(
+                "DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+        except sqlite3.Error as e:
+            print(f"[Cache Error] {self.name}: {e}")
+
+    def stats(self):
+        entries, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        return {"backend": "sqlite", "entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+
+def create_cache(name, backend, max_bytes, path=None):
+    """ Builds a cache backend by name ("memory" or "sqlite"); "none" disables caching. """
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return SQLiteCache(name, path, max_bytes)
+    if backend == "memory":
+        return MemoryCache(name, max_bytes)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -1,28 +1,103 @@
 import os
+import json
+import time
+import hashlib
+import threading
 import requests
+from collections import OrderedDict
 from flask import request, abort
 from jose import jwt, jwk
-from jose.utils import base64url_decode
-import time
-import requests
+from config import Config
+from app.utils import metrics
 
-# --- JWKS Cache ---
-_jwks_cache = None
-_jwks_expiry = 0
+CLERK_ISSUER = os.getenv("CLERK_ISSUER")
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL")
+# Local JWKS JSON file used instead of CLERK_JWKS_URL (tests, offline development)
+CLERK_JWKS_FILE = os.getenv("CLERK_JWKS_FILE")
 
-def get_cached_jwks(ttl=300):  # TTL = 5 minutes
-    global _jwks_cache, _jwks_expiry
-    now = time.time()
-    if _jwks_cache is None or now > _jwks_expiry:
-        res = requests.get(CLERK_JWKS_URL, timeout=2)
-        res.raise_for_status()
-        _jwks_cache = res.json()
-        _jwks_expiry = now + ttl
-    return _jwks_cache
+# --- JWKS Keys ---
+# Signing keys are kept as constructed key objects keyed by kid. After
+# CLERK_JWKS_TTL seconds the current keys keep being served while a single
+# background thread refetches them (stale-while-revalidate); only with no keys,
+# or keys older than CLERK_JWKS_MAX_STALE, does a request wait for the fetch.
+# Concurrent fetches collapse into one. An unknown kid (key rotation) forces a
+# refetch at most once per CLERK_JWKS_MIN_REFRESH seconds.
+_keys = {}
+_keys_fetched_at = 0.0
+_last_forced_refresh = 0.0
+_fetch_lock = threading.Lock()
+_state_lock = threading.Lock()
+_refreshing = False
 
+# --- Verified Token Cache ---
+# The SPA sends the same session token many times a minute, so verified
+# payloads are cached by token hash until the token's own exp.
+_tokens = OrderedDict()
+_tokens_lock = threading.Lock()
+
+
+def _load_jwks():
+    if CLERK_JWKS_FILE:
+        with open(CLERK_JWKS_FILE) as f:
+            return json.load(f)
+    res = requests.get(CLERK_JWKS_URL, timeout=2)
+    res.raise_for_status()
+    return res.json()
+
+
+def _refresh_keys():
+    """ Fetches the JWKS and swaps in a new kid -> key map. """
+    global _keys, _keys_fetched_at
+    requested_at = time.time()
+    with _fetch_lock:
+        if _keys_fetched_at >= requested_at:
+            # Another thread finished a fetch while this one waited
+            return
+        keys = {}
+        for key in _load_jwks().get("keys", []):
+            try:
+                keys[key["kid"]] = jwk.construct(key, key.get("alg", "RS256"))
+            except Exception as e:
+                print(f"[Clerk] Skipping JWK {key.get('kid')}: {e}")
+        _keys = keys
+        _keys_fetched_at = time.time()
+    metrics.incr("clerk.jwks_refreshes")
+
+
+def _refresh_in_background():
+    global _refreshing
+    with _state_lock:
+        if _refreshing:
+            return
+        _refreshing = True
+
+    def run():
+        global _refreshing
+        try:
+            _refresh_keys()
+        except Exception as e:
+            print(f"[Clerk] Background JWKS refresh failed, keeping current keys: {e}")
+        finally:
+            with _state_lock:
+                _refreshing = False
+
+    threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+
+def get_signing_keys():
+    """ Returns the kid -> key map, refreshing it as described above. """
+    age = time.time() - _keys_fetched_at
+    if not _keys or age > Config.CLERK_JWKS_MAX_STALE:
+        try:
+            _refresh_keys()
+        except Exception as e:
+            print(f"[Clerk] JWKS fetch failed: {e}")
+            if not _keys:
+                abort(503, "Unable to fetch token signing keys")
+    elif age > Config.CLERK_JWKS_TTL:
+        _refresh_in_background()
+    return _keys
 
-CLERK_ISSUER = os.getenv("CLERK_ISSUER")
-CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL")
 
 def get_authorization_type():
     auth = request.headers.get("Authorization", None)
@@ -43,16 +118,59 @@ def get_token_from_header():
     return auth.split(" ")[1]
 
 def get_public_key(token):
-    jwks = get_cached_jwks()
-    unverified_header = jwt.get_unverified_header(token)
+    global _last_forced_refresh
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except Exception:
+        abort(401, "Malformed token")
+
+    key = get_signing_keys().get(kid)
+    now = time.time()
+    if key is None and now - _last_forced_refresh > Config.CLERK_JWKS_MIN_REFRESH:
+        # The kid may belong to a freshly rotated key
+        _last_forced_refresh = now
+        try:
+            _refresh_keys()
+        except Exception as e:
+            print(f"[Clerk] JWKS fetch failed: {e}")
+        key = _keys.get(kid)
+    if key is None:
+        abort(401, "Public key not found in JWKS")
+    return key
+
+
+def _cached_payload(token_hash):
+    with _tokens_lock:
+        entry = _tokens.get(token_hash)
+        if entry is None:
+            return None
+        payload, exp = entry
+        if exp <= time.time():
+            del _tokens[token_hash]
+            return None
+        _tokens.move_to_end(token_hash)
+        return dict(payload)
+
+
+def _cache_payload(token_hash, payload):
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)):
+        return
+    with _tokens_lock:
+        _tokens[token_hash] = (dict(payload), exp)
+        while len(_tokens) > Config.CLERK_TOKEN_CACHE_MAX:
+            _tokens.popitem(last=False)
 
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            return key
-    abort(401, "Public key not found in JWKS")
 
 def verify_clerk_token():
     token = get_token_from_header()
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    payload = _cached_payload(token_hash)
+    if payload is not None:
+        metrics.incr("clerk.token_cache.hits")
+        return payload
+    metrics.incr("clerk.token_cache.misses")
+
     public_key = get_public_key(token)
 
     try:
@@ -65,7 +183,6 @@ def verify_clerk_token():
                 "verify_aud": False  # Optional, set to True if using audience
             }
         )
-        return payload  # contains user_id in `sub`
     except jwt.ExpiredSignatureError:
         abort(401, "Token has expired")
     except jwt.JWTClaimsError as e:
@@ -73,3 +190,13 @@ def verify_clerk_token():
     except Exception as e:
         print("JWT verification failed:", e)
         abort(401, "Token verification failed")
+
+    _cache_payload(token_hash, payload)
+    return payload  # contains user_id in `sub`
+
+
+metrics.register_gauge("clerk_auth", lambda: {
+    "signing_keys": len(_keys),
+    "jwks_age_s": round(time.time() - _keys_fetched_at) if _keys_fetched_at else None,
+    "cached_tokens": len(_tokens),
+})
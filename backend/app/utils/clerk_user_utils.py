@@ -1,18 +1,62 @@
-import requests
 import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from app.utils import metrics
 
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
 
-def get_clerk_user_email(user_id):
+# --- Clerk User Profiles ---
+# Profile lookups share one pooled HTTP session with connect/read timeouts.
+# Results are cached per user for USER_PROFILE_TTL seconds; failed lookups
+# are remembered for USER_PROFILE_ERROR_TTL seconds so a Clerk outage is not
+# retried on every call.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=Config.CLERK_API_POOL_SIZE))
+
+_profiles = {}
+_lock = threading.Lock()
+
+
+def _fetch_profile(user_id):
     url = f"https://api.clerk.dev/v1/users/{user_id}"
     headers = {
         "Authorization": f"Bearer {CLERK_SECRET_KEY}"
     }
 
-    response = requests.get(url, headers=headers)
+    try:
+        response = _session.get(url, headers=headers, timeout=(Config.CLERK_API_CONNECT_TIMEOUT, Config.CLERK_API_READ_TIMEOUT))
+    except requests.RequestException as e:
+        print("[Clerk API Error]", e)
+        return None
     if response.status_code == 200:
         user_data = response.json()
-        return user_data["email_addresses"][0]["email_address"]
+        addresses = user_data.get("email_addresses") or []
+        return {"email": addresses[0]["email_address"] if addresses else None}
     else:
         print("[Clerk API Error]", response.text)
         return None
+
+
+def get_user_profile(user_id):
+    """ Returns {"email": ...} for a Clerk user, or None if the lookup failed. """
+    now = time.time()
+    with _lock:
+        entry = _profiles.get(user_id)
+        if entry and entry[1] > now:
+            metrics.incr("user_profile_cache.hits")
+            return entry[0]
+    metrics.incr("user_profile_cache.misses")
+
+    profile = _fetch_profile(user_id)
+    ttl = Config.USER_PROFILE_TTL if profile else Config.USER_PROFILE_ERROR_TTL
+    with _lock:
+        _profiles[user_id] = (profile, now + ttl)
+    return profile
+
+
+def get_clerk_user_email(user_id):
+    profile = get_user_profile(user_id)
+    return profile["email"] if profile else None
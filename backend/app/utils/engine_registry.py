@@ -0,0 +1,146 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from config import Config
+from app.utils import metrics
+
+# --- Engine Registry ---
+# One pooled engine per (database_id, connection string hash), shared by all
+# requests in the worker. Entries are evicted LRU-first when the registry is
+# full and after ENGINE_IDLE_TIMEOUT seconds without use; evicted engines are
+# disposed so their pooled connections are closed.
+_engines = OrderedDict()
+_lock = threading.Lock()
+
+
+def _string_hash(database_string):
+    return hashlib.sha256((database_string or "").encode()).hexdigest()
+
+
+def _engine_options(database_id, database_string):
+    options = {"pool_pre_ping": True}
+    if make_url(database_string).get_backend_name() == "sqlite":
+        return options
+
+    overrides = Config.ENGINE_POOL_OVERRIDES.get(str(database_id), {})
+    options.update({
+        "pool_size": overrides.get("pool_size", Config.ENGINE_POOL_SIZE),
+        "max_overflow": overrides.get("max_overflow", Config.ENGINE_MAX_OVERFLOW),
+        "pool_recycle": overrides.get("pool_recycle", Config.ENGINE_POOL_RECYCLE),
+    })
+    return options
+
+
+def _evict_idle(now):
+    """ Pops idle and over-capacity entries. Must be called with _lock held. """
+    evicted = []
+    for key, entry in list(_engines.items()):
+        if now - entry["last_used"] > Config.ENGINE_IDLE_TIMEOUT:
+            evicted.append(_engines.pop(key)["engine"])
+    while len(_engines) > Config.ENGINE_REGISTRY_MAX:
+        _, entry = _engines.popitem(last=False)
+        evicted.append(entry["engine"])
+    return evicted
+
+
+def _dispose(engines):
+    for engine in engines:
+        try:
+            engine.dispose()
+        except Exception as e:
+            print(f"[Engine Registry] Failed to dispose engine: {e}")
+    if engines:
+        metrics.incr("engine_registry.evictions", len(engines))
+
+
+def get_engine(database_id, database_string):
+    """
+    Returns the shared engine for a user database, creating it on first use.
+    A changed connection string produces a new entry; the stale one is disposed.
+    """
+    key = (str(database_id), _string_hash(database_string))
+    now = time.monotonic()
+
+    with _lock:
+        entry = _engines.get(key)
+        if entry is not None:
+            entry["last_used"] = now
+            _engines.move_to_end(key)
+            evicted = _evict_idle(now)
+            metrics.incr("engine_registry.hits")
+            engine = entry["engine"]
+        else:
+            evicted = []
+            engine = None
+
+    if engine is not None:
+        _dispose(evicted)
+        return engine
+
+    metrics.incr("engine_registry.misses")
+    engine = create_engine(database_string, **_engine_options(database_id, database_string))
+
+    with _lock:
+        existing = _engines.get(key)
+        if existing is not None:
+            # Another thread registered the same engine while we were creating ours.
+            evicted = [engine]
+            engine = existing["engine"]
+        else:
+            evicted = [
+                _engines.pop(other)["engine"]
+                for other in list(_engines)
+                if other[0] == key[0]
+            ]
+            _engines[key] = {"engine": engine, "last_used": now}
+        evicted += _evict_idle(now)
+
+    _dispose(evicted)
+    return engine
+
+
+def invalidate_engine(database_id):
+    """ Drops and disposes every engine registered for a database. """
+    database_id = str(database_id)
+    with _lock:
+        evicted = [
+            _engines.pop(key)["engine"]
+            for key in list(_engines)
+            if key[0] == database_id
+        ]
+    _dispose(evicted)
+
+
+@contextmanager
+def checkout(engine):
+    """ engine.connect() that records pool checkout latency. """
+    start = time.perf_counter()
+    conn = engine.connect()
+    metrics.observe("engine_registry.checkout_ms", (time.perf_counter() - start) * 1000)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def registry_stats():
+    """ Pool status for each registered engine, without connection strings or database ids. """
+    now = time.monotonic()
+    with _lock:
+        entries = list(_engines.items())
+    stats = []
+    for _, entry in entries:
+        pool = entry["engine"].pool
+        stats.append({
+            "idle_seconds": round(now - entry["last_used"], 1),
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "pool_status": pool.status(),
+        })
+    return {"size": len(stats), "engines": stats}
+
+
+metrics.register_gauge("engine_registry", registry_stats)
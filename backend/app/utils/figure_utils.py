@@ -0,0 +1,115 @@
+import json
+import time
+import hashlib
+import threading
+from config import Config
+from app.utils import metrics
+from app.utils.cache_utils import create_cache
+from app.utils.nl2sql_utils import create_visualization
+
+# --- Deferred Figures ---
+# /api/query only returns the visualization spec (chart type, axes, title).
+# The Plotly figure is built on demand by GET /api/messages/<id>/figure and
+# cached under "<message_id>:<spec hash>", so a chart is rendered at most
+# once per spec and never for callers that do not ask for it.
+#
+# Renders are CPU-bound; at most FIGURE_RENDER_CONCURRENCY run at once so a
+# burst of figure requests cannot starve the other worker threads.
+_cache = None
+_cache_lock = threading.Lock()
+_render_slots = threading.BoundedSemaphore(Config.FIGURE_RENDER_CONCURRENCY)
+
+SPEC_FIELDS = ("type", "x_axis", "y_axis", "color", "names_axis", "values_axis", "title")
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache(
+                    "figure_cache",
+                    Config.FIGURE_CACHE_BACKEND,
+                    Config.FIGURE_CACHE_MAX_BYTES,
+                    path=Config.FIGURE_CACHE_PATH,
+                )
+    return _cache
+
+
+def visualization_spec(llm_response):
+    """ The chart spec stored in the response, taken from the LLM answer. """
+    return {
+        "type": llm_response.get("visualization", "none"),
+        "x_axis": llm_response.get("x_axis"),
+        "y_axis": llm_response.get("y_axis"),
+        "color": llm_response.get("color"),
+        "names_axis": llm_response.get("names_axis"),
+        "values_axis": llm_response.get("values_axis"),
+        "title": llm_response.get("title"),
+        "why": llm_response.get("visualization_explanation"),
+    }
+
+
+def spec_hash(spec):
+    fields = {field: spec.get(field) for field in SPEC_FIELDS}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def render_figure(rows, spec):
+    """ Builds the Plotly figure for a spec. Returns {"figure_json", "sampling"}. """
+    viz_info = {
+        "visualization": spec.get("type", "none"),
+        "x_axis": spec.get("x_axis"),
+        "y_axis": spec.get("y_axis"),
+        "color": spec.get("color"),
+        "names_axis": spec.get("names_axis"),
+        "values_axis": spec.get("values_axis"),
+        "title": spec.get("title") or "Data Visualization",
+    }
+    if viz_info["visualization"] == "none" or not rows:
+        return {"figure_json": None, "sampling": {"applied": False}}
+
+    # viz_prep pulls in pandas/numpy, so it is imported on the first render
+    from app.utils.viz_prep import prepare_visualization_data
+    plot_df, viz_info, sampling = prepare_visualization_data(rows, viz_info)
+    visualization = create_visualization(plot_df, viz_info)
+    figure_json = None
+
+    if visualization and not (isinstance(visualization, dict) and 'error' in visualization):
+        try:
+            figure_json = visualization.to_json()
+        except Exception as e:
+            print(f"Error serializing visualization to JSON: {e}")
+            # Keep figure_json as None if serialization fails
+
+    return {"figure_json": figure_json, "sampling": sampling}
+
+
+def get_figure(message_id, spec, load_rows):
+    """
+    Returns ({"figure_json", "sampling"}, cache_hit) for a message and spec.
+    `load_rows` is only called on a cache miss.
+    """
+    key = f"{message_id}:{spec_hash(spec)}"
+    cache = _get_cache()
+    if cache is not None:
+        value = cache.get(key)
+        if value is not None:
+            return json.loads(value), True
+
+    rows = load_rows()
+    with _render_slots:
+        start = time.perf_counter()
+        figure = render_figure(rows, spec)
+        metrics.observe("figure.render_ms", (time.perf_counter() - start) * 1000)
+    if cache is not None and figure["figure_json"] is not None:
+        cache.set(key, json.dumps(figure), Config.FIGURE_CACHE_TTL)
+    return figure, False
+
+
+def _cache_stats():
+    cache = _get_cache()
+    return cache.stats() if cache is not None else {"backend": "none"}
+
+
+metrics.register_gauge("figure_cache", _cache_stats)
@@ -0,0 +1,72 @@
+import json
+from config import Config
+from app.utils import metrics
+from app.utils.token_utils import estimate_tokens
+
+# --- Conversation History for Prompts ---
+# Each prior turn is sent once, as a user message plus an assistant message
+# holding only the explanation and SQL (never the result rows). Turns are
+# kept newest-first until HISTORY_TOKEN_BUDGET is used up; older questions
+# are folded into a one-line summary when there is room for it.
+_SUMMARY_PROMPT_CHARS = 120
+_NON_JSON_RESPONSE_CHARS = 300
+
+
+def _assistant_content(response):
+    try:
+        response_json = json.loads(response)
+        return json.dumps({
+            "explanation": response_json.get("explanation", ""),
+            "sql_query": response_json.get("query", ""),
+        })
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        # Plain-text replies (errors, refusals) are kept short
+        return str(response or "")[:_NON_JSON_RESPONSE_CHARS]
+
+
+def build_history_messages(history, token_budget=None):
+    """
+    Converts stored chat turns into chat messages within a token budget.
+    Returns (messages, stats).
+    """
+    token_budget = Config.HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    turns = [
+        msg for msg in (history or [])
+        if isinstance(msg, dict) and 'prompt' in msg and 'response' in msg
+    ]
+
+    kept, used = [], 0
+    for position in range(len(turns) - 1, -1, -1):
+        msg = turns[position]
+        pair = [
+            {"role": "user", "content": msg['prompt'] or ""},
+            {"role": "assistant", "content": _assistant_content(msg['response'])},
+        ]
+        cost = sum(estimate_tokens(m["content"]) for m in pair)
+        if used + cost > token_budget:
+            break
+        kept = pair + kept
+        used += cost
+    dropped = turns[:len(turns) - len(kept) // 2]
+
+    summarized = 0
+    if dropped:
+        summary = "Earlier in this conversation the user also asked: " + "; ".join(
+            (msg['prompt'] or "")[:_SUMMARY_PROMPT_CHARS] for msg in dropped
+        )
+        cost = estimate_tokens(summary)
+        if used + cost <= token_budget:
+            kept = [{"role": "user", "content": summary}] + kept
+            used += cost
+            summarized = len(dropped)
+
+    stats = {
+        "turns_total": len(turns),
+        "turns_sent": len(turns) - len(dropped),
+        "turns_summarized": summarized,
+        "history_tokens": used,
+    }
+    metrics.observe("llm.history_tokens", used)
+    if summarized:
+        metrics.incr("llm.history_turns_summarized", summarized)
+    return kept, stats
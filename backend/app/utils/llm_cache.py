@@ -0,0 +1,91 @@
+import re
+import json
+import hashlib
+import threading
+from config import Config
+from app.utils import metrics
+from app.utils.cache_utils import create_cache
+
+# --- NL -> SQL Response Cache ---
+# Caches the parsed LLM JSON (SQL plus visualization spec) so repeated questions
+# against the same database skip the OpenAI round trip. The key covers the
+# schema hash, so any schema change produces new keys; invalidate_database()
+# additionally frees the stale entries right away.
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache(
+                    "llm_cache",
+                    Config.LLM_CACHE_BACKEND,
+                    Config.LLM_CACHE_MAX_BYTES,
+                    path=Config.LLM_CACHE_PATH,
+                )
+    return _cache
+
+
+def schema_hash(schema):
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt or "").strip().rstrip("?.!").strip()
+
+
+def history_digest(history):
+    """ Digest of the prompt, SQL and explanation of each prior turn. """
+    turns = []
+    for msg in history or []:
+        if not isinstance(msg, dict):
+            continue
+        try:
+            response_json = json.loads(msg.get("response") or "")
+            turn = [msg.get("prompt"), response_json.get("query", ""), response_json.get("explanation", "")]
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            turn = [msg.get("prompt"), msg.get("response")]
+        turns.append(turn)
+    return hashlib.sha256(json.dumps(turns).encode()).hexdigest()
+
+
+def make_cache_key(database_id, schema, prompt, history):
+    digest = hashlib.sha256("\0".join([
+        schema_hash(schema),
+        normalize_prompt(prompt),
+        history_digest(history),
+    ]).encode()).hexdigest()
+    return f"{database_id}:{digest}"
+
+
+def get_cached_response(key):
+    """ Returns the cached LLM response dict for a key, or None. """
+    cache = _get_cache()
+    if cache is None:
+        return None
+    value = cache.get(key)
+    return json.loads(value) if value is not None else None
+
+
+def cache_response(key, llm_response):
+    cache = _get_cache()
+    if cache is not None:
+        cache.set(key, json.dumps(llm_response), Config.LLM_CACHE_TTL)
+
+
+def invalidate_database(database_id):
+    """ Drops every cached response for a database. """
+    cache = _get_cache()
+    if cache is not None:
+        cache.delete_prefix(f"{database_id}:")
+
+
+def _cache_stats():
+    cache = _get_cache()
+    return cache.stats() if cache is not None else {"backend": "none"}
+
+
+metrics.register_gauge("llm_cache", _cache_stats)
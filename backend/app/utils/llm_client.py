@@ -0,0 +1,305 @@
+import time
+import random
+import asyncio
+import threading
+from config import Config
+from app.utils import metrics
+from app.utils.rate_limits import charge_llm_tokens
+
+# --- LLM Client Layer ---
+# One shared client per provider/API key (so HTTP connections are reused),
+# called through complete_json() which adds:
+#
+#   deadline   LLM_DEADLINE seconds for the whole call, each attempt capped
+#              at LLM_TIMEOUT and at whatever is left of the deadline
+#   retries    up to LLM_MAX_RETRIES on 429/5xx/timeouts/connection errors,
+#              full-jitter exponential backoff (Retry-After is honoured)
+#   breaker    after LLM_BREAKER_FAILURES consecutive failed calls the
+#              provider is skipped for LLM_BREAKER_COOLDOWN seconds; then
+#              one trial call decides whether it closes again
+#
+# Providers implement LLMProvider; LLM_PROVIDER picks one and LLM_MODEL sets
+# the model. acomplete_json() is the same call for the asyncio query path
+# (app.asgi); providers without a native async client run it in a thread.
+
+
+class LLMError(Exception):
+    """ The provider call failed (after any retries). """
+
+
+class LLMUnavailableError(LLMError):
+    """ The circuit breaker is open; the call was not attempted. """
+
+
+class LLMProvider:
+    """ Interface for chat-completion providers returning a JSON object as text. """
+    name = "base"
+
+    def complete_json(self, messages, model, timeout):
+        """ Returns (content, usage) where usage is {"prompt_tokens", "completion_tokens"}. """
+        raise NotImplementedError
+
+    async def acomplete_json(self, messages, model, timeout):
+        """ Async complete_json(); by default the blocking call runs in a worker thread. """
+        return await asyncio.to_thread(self.complete_json, messages, model, timeout)
+
+    def is_retryable(self, error):
+        return False
+
+    def retry_after(self, error):
+        """ Seconds the provider asked us to wait, if it said. """
+        return None
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key):
+        from openai import OpenAI
+        # Retries are handled by complete_json(), not inside the SDK
+        self.api_key = api_key
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        # Created on first async use; it binds its connection pool to that loop
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return self._async_client
+
+    def _request(self, messages, model, timeout):
+        return dict(
+            model=model,
+            messages=messages,
+            temperature=0.0,  # Set to 0 for deterministic and accurate SQL generation
+            response_format={"type": "json_object"},  # Enforce JSON output
+            timeout=timeout,
+        )
+
+    def _result(self, response):
+        usage = response.usage
+        return response.choices[0].message.content, {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+
+    def complete_json(self, messages, model, timeout):
+        return self._result(self.client.chat.completions.create(**self._request(messages, model, timeout)))
+
+    async def acomplete_json(self, messages, model, timeout):
+        response = await self.async_client.chat.completions.create(**self._request(messages, model, timeout))
+        return self._result(response)
+
+    def is_retryable(self, error):
+        import openai
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    def retry_after(self, error):
+        response = getattr(error, "response", None)
+        try:
+            return float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+
+_PROVIDERS = {"openai": OpenAIProvider}
+
+
+def register_provider(name, provider_class):
+    _PROVIDERS[name] = provider_class
+
+
+class CircuitBreaker:
+    """ Consecutive-failure breaker with a single half-open trial call. """
+
+    def __init__(self, name, failure_threshold, cooldown):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        """ Returns (allowed, trial); a trial call must finish with end_trial(). """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True, False
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True, True
+            return False, False
+
+    def end_trial(self):
+        """ Frees the half-open trial slot, whatever ended the call (no-op once recorded). """
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    print(f"[LLM] Circuit breaker for {self.name} opened after {self.failures} failures")
+                    metrics.incr("llm.breaker_opened")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+_clients = {}
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_provider(api_key, provider=None):
+    """ Shared provider client for (provider, api_key). """
+    provider = provider or Config.LLM_PROVIDER
+    key = (provider, api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if provider not in _PROVIDERS:
+                    raise LLMError(f"Unknown LLM provider '{provider}'")
+                client = _clients[key] = _PROVIDERS[provider](api_key)
+    return client
+
+
+def get_breaker(provider=None):
+    provider = provider or Config.LLM_PROVIDER
+    with _lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(
+                provider, Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_COOLDOWN
+            )
+    return breaker
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(Config.LLM_BACKOFF_MAX, Config.LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _open_call(api_key):
+    """ Provider, breaker and whether this is the trial call; raises LLMUnavailableError if the breaker is open. """
+    provider = get_provider(api_key)
+    breaker = get_breaker(provider.name)
+    allowed, trial = breaker.allow()
+    if not allowed:
+        metrics.incr("llm.breaker_rejections")
+        raise LLMUnavailableError(f"{provider.name} is temporarily unavailable")
+    return provider, breaker, trial
+
+
+def _retry_wait(provider, breaker, error, attempt, attempt_start, deadline_at):
+    """ Seconds to wait before retrying a failed attempt; raises LLMError when giving up. """
+    metrics.observe("llm.attempt_ms", (time.monotonic() - attempt_start) * 1000)
+    retryable = provider.is_retryable(error)
+    wait = provider.retry_after(error) or _backoff(attempt)
+    if retryable and attempt < Config.LLM_MAX_RETRIES and time.monotonic() + wait < deadline_at:
+        metrics.incr("llm.retries")
+        print(f"[LLM] Attempt {attempt + 1} failed ({type(error).__name__}), retrying in {wait:.2f}s")
+        return wait
+
+    metrics.incr("llm.errors")
+    # Bad requests/auth errors say nothing about provider health; the breaker is left as it is
+    if retryable or isinstance(error, TimeoutError):
+        breaker.record_failure()
+    raise LLMError(str(error)) from error
+
+
+def _record_success(breaker, usage, start, attempt_start):
+    """ Records a successful call; returns the tokens it used. """
+    breaker.record_success()
+    metrics.observe("llm.attempt_ms", (time.monotonic() - attempt_start) * 1000)
+    metrics.observe("llm.latency_ms", (time.monotonic() - start) * 1000)
+    metrics.incr("llm.calls")
+    metrics.incr("llm.prompt_tokens", usage["prompt_tokens"])
+    metrics.incr("llm.completion_tokens", usage["completion_tokens"])
+    return usage["prompt_tokens"] + usage["completion_tokens"]
+
+
+def complete_json(messages, api_key, model=None, deadline=None, quota_key=None):
+    """
+    Sends a chat completion expecting a JSON object and returns its text.
+    Raises LLMUnavailableError when the breaker is open, LLMError otherwise.
+    The tokens used are charged to `quota_key`'s LLM token bucket.
+    """
+    model = model or Config.LLM_MODEL
+    provider, breaker, trial = _open_call(api_key)
+    try:
+        start = time.monotonic()
+        deadline_at = start + (deadline or Config.LLM_DEADLINE)
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            attempt_start = time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError("LLM deadline exceeded")
+                content, usage = provider.complete_json(messages, model, min(Config.LLM_TIMEOUT, remaining))
+            except Exception as e:
+                time.sleep(_retry_wait(provider, breaker, e, attempt, attempt_start, deadline_at))
+                attempt += 1
+                continue
+
+            charge_llm_tokens(quota_key, _record_success(breaker, usage, start, attempt_start))
+            return content
+    finally:
+        if trial:
+            breaker.end_trial()
+
+
+async def acomplete_json(messages, api_key, model=None, deadline=None, quota_key=None):
+    """ complete_json() for the asyncio path: same deadline, retries and breaker, awaited. """
+    model = model or Config.LLM_MODEL
+    provider, breaker, trial = _open_call(api_key)
+    try:
+        start = time.monotonic()
+        deadline_at = start + (deadline or Config.LLM_DEADLINE)
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            attempt_start = time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError("LLM deadline exceeded")
+                content, usage = await asyncio.wait_for(
+                    provider.acomplete_json(messages, model, min(Config.LLM_TIMEOUT, remaining)),
+                    timeout=remaining,
+                )
+            except Exception as e:
+                await asyncio.sleep(_retry_wait(provider, breaker, e, attempt, attempt_start, deadline_at))
+                attempt += 1
+                continue
+
+            tokens = _record_success(breaker, usage, start, attempt_start)
+            if quota_key:
+                await asyncio.to_thread(charge_llm_tokens, quota_key, tokens)
+            return content
+    finally:
+        # A cancelled (or otherwise interrupted) trial must not keep the breaker half-open forever
+        if trial:
+            breaker.end_trial()
+
+
+metrics.register_gauge("llm_breakers", lambda: {name: b.state for name, b in _breakers.items()})
@@ -0,0 +1,74 @@
+import threading
+from collections import defaultdict, deque
+
+# --- Process-wide metrics ---
+# Counters and timing samples are kept per worker process and exposed through
+# the /api/metrics endpoint.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+_gauges = {}
+
+_SAMPLE_WINDOW = 1024
+
+
+def incr(name, value=1):
+    """ Increments a named counter. """
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value):
+    """ Records a sample (e.g. a latency in ms) for a named timing. """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "samples": deque(maxlen=_SAMPLE_WINDOW),
+            }
+        timing["count"] += 1
+        timing["total"] += value
+        timing["max"] = max(timing["max"], value)
+        timing["samples"].append(value)
+
+
+def register_gauge(name, fn):
+    """ Registers a callable whose return value is reported on every snapshot. """
+    with _lock:
+        _gauges[name] = fn
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(round(pct / 100.0 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def snapshot():
+    """ Returns a JSON-serializable view of all counters, timings and gauges. """
+    with _lock:
+        counters = dict(_counters)
+        timings = {}
+        for name, timing in _timings.items():
+            samples = sorted(timing["samples"])
+            timings[name] = {
+                "count": timing["count"],
+                "avg": timing["total"] / timing["count"] if timing["count"] else None,
+                "max": timing["max"],
+                "p50": _percentile(samples, 50),
+                "p95": _percentile(samples, 95),
+            }
+        gauges = list(_gauges.items())
+
+    gauge_values = {}
+    for name, fn in gauges:
+        try:
+            gauge_values[name] = fn()
+        except Exception as e:
+            gauge_values[name] = {"error": str(e)}
+
+    return {"counters": counters, "timings": timings, "gauges": gauge_values}
@@ -1,22 +1,33 @@
 import json
 import re
-import pandas as pd
 from sqlalchemy import text, inspect
-from openai import OpenAI
+from sqlalchemy.engine.default import DefaultDialect
+from concurrent.futures import ThreadPoolExecutor
 import os
-import plotly.express as px
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
+import math
 from decimal import Decimal
 import uuid
+from config import Config
+from app.utils.engine_registry import checkout
+from app.utils.schema_render import schema_prompt_text
+from app.utils.history_utils import build_history_messages
+from app.utils.llm_client import complete_json, acomplete_json, LLMUnavailableError
 
 def safe_serialize(obj):
     """ Safely serializes complex data types to be JSON-compatible. """
-    if isinstance(obj, (datetime, date)):
+    if isinstance(obj, (datetime, date, time)):
         return obj.isoformat()
     if isinstance(obj, Decimal):
         return float(obj)
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
     if isinstance(obj, uuid.UUID):
         return str(obj)
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).hex()
     if isinstance(obj, dict):
         return {key: safe_serialize(value) for key, value in obj.items()}
     if isinstance(obj, list):
@@ -24,74 +35,240 @@ def safe_serialize(obj):
     # Add other types if necessary
     return obj
 
-def get_db_schema(engine):
+def _table_schema(columns, foreign_keys):
+    """ Builds the stored schema entry for one table from reflected columns and FKs. """
+    return {
+        "columns": [
+            {
+                "name": col["name"],
+                "type": str(col["type"]),
+                "description": "" # Placeholder for user annotations
+            }
+            for col in columns
+        ],
+        # Foreign keys for join information
+        "foreign_keys": [
+            {
+                "constrained_columns": fk['constrained_columns'],
+                "referred_table": fk['referred_table'],
+                "referred_columns": fk['referred_columns']
+            }
+            for fk in foreign_keys
+        ],
+        "description": "" # Placeholder for user annotations
+    }
+
+
+def _has_bulk_reflection(engine):
+    """ True when the dialect reflects all tables' columns and FKs in single catalog queries. """
+    dialect_cls = type(engine.dialect)
+    return (
+        hasattr(DefaultDialect, "get_multi_columns")
+        and dialect_cls.get_multi_columns is not DefaultDialect.get_multi_columns
+        and dialect_cls.get_multi_foreign_keys is not DefaultDialect.get_multi_foreign_keys
+    )
+
+
+# --- Catalog queries for dialects without multi-table reflection ---
+# SQLite and MySQL only reflect table by table in SQLAlchemy, so their
+# columns and foreign keys are read here with one query each instead.
+_SQLITE_COLUMNS = text("""
+    SELECT m.name AS table_name, c.name AS column_name, upper(c.type) AS column_type, c.pk AS pk
+    FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS c
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+    ORDER BY m.name, c.cid
+""")
+_SQLITE_FOREIGN_KEYS = text("""
+    SELECT m.name AS table_name, f.id AS fk_id, f."from" AS column_name,
+           f."table" AS referred_table, f."to" AS referred_column
+    FROM sqlite_master AS m JOIN pragma_foreign_key_list(m.name) AS f
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+    ORDER BY m.name, f.id, f.seq
+""")
+_MYSQL_COLUMNS = text("""
+    SELECT table_name AS table_name, column_name AS column_name, upper(column_type) AS column_type
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+    ORDER BY table_name, ordinal_position
+""")
+_MYSQL_FOREIGN_KEYS = text("""
+    SELECT table_name AS table_name, constraint_name AS fk_id, column_name AS column_name,
+           referenced_table_name AS referred_table, referenced_column_name AS referred_column
+    FROM information_schema.key_column_usage
+    WHERE table_schema = DATABASE() AND referenced_table_name IS NOT NULL
+    ORDER BY table_name, constraint_name, ordinal_position
+""")
+
+
+def _group_foreign_keys(rows, primary_keys=None):
+    """ Folds one row per FK column into reflection-style FK dicts per table. """
+    foreign_keys = {}
+    for row in rows:
+        fks = foreign_keys.setdefault(row.table_name, {})
+        fk = fks.setdefault(row.fk_id, {
+            "constrained_columns": [], "referred_table": row.referred_table, "referred_columns": [],
+        })
+        fk["constrained_columns"].append(row.column_name)
+        if row.referred_column is not None:
+            fk["referred_columns"].append(row.referred_column)
+    for fks in foreign_keys.values():
+        for fk in fks.values():
+            # SQLite leaves the referred columns out when the FK points at the primary key
+            if not fk["referred_columns"] and primary_keys:
+                fk["referred_columns"] = primary_keys.get(fk["referred_table"], [])
+    return {table_name: list(fks.values()) for table_name, fks in foreign_keys.items()}
+
+
+def _sqlite_catalog(conn):
+    """ ({table: columns}, {table: foreign keys}) from sqlite_master joined to the table pragmas. """
+    columns, primary_keys = {}, {}
+    for row in conn.execute(_SQLITE_COLUMNS):
+        columns.setdefault(row.table_name, []).append({"name": row.column_name, "type": row.column_type})
+        if row.pk:
+            primary_keys.setdefault(row.table_name, []).append((row.pk, row.column_name))
+    primary_keys = {table_name: [name for _, name in sorted(pk)] for table_name, pk in primary_keys.items()}
+    return columns, _group_foreign_keys(conn.execute(_SQLITE_FOREIGN_KEYS), primary_keys)
+
+
+def _mysql_catalog(conn):
+    """ ({table: columns}, {table: foreign keys}) from information_schema for the current database. """
+    columns = {}
+    for row in conn.execute(_MYSQL_COLUMNS):
+        columns.setdefault(row.table_name, []).append({"name": row.column_name, "type": row.column_type})
+    return columns, _group_foreign_keys(conn.execute(_MYSQL_FOREIGN_KEYS))
+
+
+_CATALOG_READERS = {"sqlite": _sqlite_catalog, "mysql": _mysql_catalog, "mariadb": _mysql_catalog}
+
+
+def _reflect_tables(engine, table_names):
+    """ Reflects a batch of tables one at a time with its own inspector. """
+    inspector = inspect(engine)
+    return {
+        table_name: _table_schema(
+            inspector.get_columns(table_name),
+            inspector.get_foreign_keys(table_name),
+        )
+        for table_name in table_names
+    }
+
+
+def get_db_schema(engine, max_workers=None):
     """
     Introspects the database to get schema information, including table names,
     columns, types, and foreign keys.
+
+    Dialects with multi-table reflection (e.g. PostgreSQL) are read with a
+    couple of catalog queries in total, as are SQLite and MySQL/MariaDB
+    through their own catalogs (_CATALOG_READERS). Any other dialect falls
+    back to per-table reflection, spread over `max_workers` threads when
+    more than one.
     """
+    if max_workers is None:
+        max_workers = Config.SCHEMA_INTROSPECTION_WORKERS
     schema = {}
     try:
         inspector = inspect(engine)
-        for table_name in inspector.get_table_names():
-            columns = []
-            for col in inspector.get_columns(table_name):
-                columns.append({
-                    "name": col["name"],
-                    "type": str(col["type"]),
-                    "description": "" # Placeholder for user annotations
-                })
-            
-            # Get foreign keys for join information
-            foreign_keys = []
-            for fk in inspector.get_foreign_keys(table_name):
-                foreign_keys.append({
-                    "constrained_columns": fk['constrained_columns'],
-                    "referred_table": fk['referred_table'],
-                    "referred_columns": fk['referred_columns']
-                })
-
-            schema[table_name] = {
-                "columns": columns,
-                "foreign_keys": foreign_keys,
-                "description": "" # Placeholder for user annotations
-            }
+        table_names = inspector.get_table_names()
+
+        if _has_bulk_reflection(engine):
+            columns = inspector.get_multi_columns()
+            foreign_keys = inspector.get_multi_foreign_keys()
+            for table_name in table_names:
+                schema[table_name] = _table_schema(
+                    columns.get((None, table_name), []),
+                    foreign_keys.get((None, table_name), []),
+                )
+        elif engine.dialect.name in _CATALOG_READERS:
+            with checkout(engine) as conn:
+                columns, foreign_keys = _CATALOG_READERS[engine.dialect.name](conn)
+            for table_name in table_names:
+                schema[table_name] = _table_schema(columns.get(table_name, []), foreign_keys.get(table_name, []))
+        elif max_workers > 1 and len(table_names) > 1:
+            batches = [table_names[i::max_workers] for i in range(max_workers)]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                reflected = {}
+                for batch_schema in executor.map(lambda batch: _reflect_tables(engine, batch), batches):
+                    reflected.update(batch_schema)
+            schema = {table_name: reflected[table_name] for table_name in table_names}
+        else:
+            schema = _reflect_tables(engine, table_names)
     except Exception as e:
         raise RuntimeError(f"Failed to introspect schema: {str(e)}")
     return schema
 
 
-def execute_query(sql_query, engine):
-    """ Executes a SQL query and returns the results as a DataFrame. """
-    try:
+class RowStream:
+    """
+    Streams a query's rows from a server-side cursor in chunks of JSON-ready
+    dicts, stopping once max_rows or max_bytes is reached. After iteration,
+    `columns`, `row_count`, `byte_count` and `truncated` describe the result.
+    """
+
+    def __init__(self, sql_query, engine, chunk_size=None, max_rows=None, max_bytes=None):
         # Basic check to prevent multiple statements
         if ';' in sql_query.strip().rstrip(';'):
-            return None, "Only one SQL statement is allowed."
-        with engine.connect() as conn:
-            df = pd.read_sql_query(text(sql_query), conn)
-        # Serialize DataFrame to handle complex types before sending to frontend
-        return json.loads(df.to_json(orient='records', default_handler=str)), None
+            raise ValueError("Only one SQL statement is allowed.")
+        self.sql_query = sql_query
+        self.engine = engine
+        self.chunk_size = chunk_size or Config.QUERY_CHUNK_SIZE
+        self.max_rows = max_rows or Config.QUERY_MAX_ROWS
+        self.max_bytes = max_bytes or Config.QUERY_MAX_BYTES
+        self.columns = []
+        self.row_count = 0
+        self.byte_count = 0
+        self.truncated = False
+
+    def __iter__(self):
+        with checkout(self.engine) as conn:
+            result = conn.execution_options(
+                stream_results=True, yield_per=self.chunk_size
+            ).execute(text(self.sql_query))
+            try:
+                self.columns = list(result.keys())
+                for partition in result.partitions():
+                    chunk = []
+                    for row in partition:
+                        if self.row_count >= self.max_rows or self.byte_count >= self.max_bytes:
+                            self.truncated = True
+                            break
+                        record = {col: safe_serialize(value) for col, value in zip(self.columns, row)}
+                        self.byte_count += len(json.dumps(record, default=str))
+                        self.row_count += 1
+                        chunk.append(record)
+                    if chunk:
+                        yield chunk
+                    if self.truncated:
+                        break
+            finally:
+                result.close()
+
+
+def stream_query(sql_query, engine, **limits):
+    """ Returns a RowStream for the query; see RowStream for the limits. """
+    return RowStream(sql_query, engine, **limits)
+
+
+def iter_ndjson(rows):
+    """ Encodes an iterable of row chunks as newline-delimited JSON lines. """
+    for chunk in rows:
+        yield "".join(json.dumps(record, default=str) + "\n" for record in chunk)
+
+
+def execute_query(sql_query, engine):
+    """ Executes a SQL query and returns the results as a list of row dicts. """
+    try:
+        rows = []
+        for chunk in stream_query(sql_query, engine):
+            rows.extend(chunk)
+        return rows, None
     except Exception as e:
         return None, str(e)
 
-def get_openai_response(question, schema_info, history=[], api_key=None):
-    """
-    Generates a SQL query by sending a structured request to the OpenAI API.
-    """
-    api_key = api_key or os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return {"error": "OpenAI API key is not configured."}, None
-    
-    formatted_history = ""
-    if history:
-        for msg in history:
-            formatted_history += f"User: {msg['prompt']}\n"
-            try:
-                response_json = json.loads(msg['response'])
-                explanation = response_json.get('explanation', '')
-                sql = response_json.get('query', '')
-                formatted_history += f"Assistant:\nExplanation: {explanation}\nSQL: {sql}\n\n"
-            except (json.JSONDecodeError, TypeError):
-                 formatted_history += f"Assistant: {msg['response']}\n\n"
+def build_llm_messages(question, schema_info, history=[]):
+    """ Chat messages for one NL -> SQL request: instructions, history, schema and question. """
+    # Schema arrives pre-rendered by the caller, or as a schema dict to render here
+    schema_text = schema_info if isinstance(schema_info, str) else schema_prompt_text(schema_info)
 
     # --- REVISED AND SIMPLIFIED PROMPT ENGINEERING ---
 
@@ -99,8 +276,8 @@ def get_openai_response(question, schema_info, history=[], api_key=None):
     system_prompt = """You are an expert SQL analyst. Your task is to generate a SQL query to answer a user's question based on the provided database schema.
 
     **Instructions:**
-    1.  **Analyze the Schema**: The user will provide a schema with table names, column names, types, and descriptions. Use the `description` fields to understand the business context.
-    2.  **Plan Joins**: If the user's question requires data from multiple tables, use the `foreign_keys` information in the schema to construct the correct JOIN clauses.
+    1.  **Analyze the Schema**: The user will provide the schema one table per line as `table(column TYPE, ...) -- table description`. Column descriptions appear as `/* ... */` after the column type. Use the descriptions to understand the business context.
+    2.  **Plan Joins**: If the user's question requires data from multiple tables, use the foreign key references in the schema (`column TYPE -> other_table.column`) to construct the correct JOIN clauses.
     3.  **Safety First**: Never generate queries that modify the database (UPDATE, INSERT, DELETE, DROP, etc.). If the user asks for something unsafe or outside the schema's scope, respond that you cannot fulfill the request.
     4.  **Strict JSON Output**: You MUST respond ONLY with a single, valid JSON object in the specified format. Do not include any other text, greetings, or explanations outside of the JSON structure.
     5.  **Pay Attention to Aliases (Very Important)**: When you select a column, you MUST use the correct table alias. For example, if `PaymentMethod` is in the `payments` table aliased as `pay`, you must use `pay.PaymentMethod`, not an alias from a different table.
@@ -108,7 +285,7 @@ def get_openai_response(question, schema_info, history=[], api_key=None):
 
     **HOW TO HANDLE CONVERSATION HISTORY (VERY IMPORTANT):**
     - The user may ask follow-up questions.To tackle this, you must:
-    - Look at the `CONVERSATION HISTORY` section below to understand the context of the user's question. And then refer to the results of the previous queries.
+    - Look at the previous messages in this conversation to understand the context of the user's question. Each earlier answer shows the explanation and SQL query you produced.
     - Modify the last SQL query from the history to answer the new question if you think the new question fits in the context of the previous one, rather than treating the new question in isolation.
     - If the last query is not relevant, then treat the new question in isolation and generate a new query from scratch.
     - If the last query is relevant, you can modify it to answer the new question.
@@ -132,10 +309,8 @@ def get_openai_response(question, schema_info, history=[], api_key=None):
     # 2. The User Prompt: Contains the data (schema) and the specific question.
     user_prompt = f"""
     DATABASE SCHEMA:
-    {json.dumps(schema_info, indent=2)}
+    {schema_text}
 
-    CONVERSATION HISTORY:
-    {formatted_history}
     USER QUESTION:
     {question}
     """
@@ -143,34 +318,62 @@ def get_openai_response(question, schema_info, history=[], api_key=None):
     # 3. Construct the message list for the API
     messages = [{"role": "system", "content": system_prompt}]
     
-    # Add the past conversation history
-    for message in history:
-        if isinstance(message, dict) and 'prompt' in message and 'response' in message:
-            messages.append({"role": "user", "content": message['prompt']})
-            # The assistant's response should be the JSON string it previously generated
-            messages.append({"role": "assistant", "content": message['response']})
+    # Add the past conversation history, once, within the history token budget
+    history_messages, _ = build_history_messages(history)
+    messages.extend(history_messages)
 
     # Add the final user prompt with the schema and new question
     messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+def _llm_error(e):
+    if isinstance(e, LLMUnavailableError):
+        return "The language model is temporarily unavailable, please try again shortly."
+    return f"Error communicating with the LLM provider: {str(e)}"
+
 
+def get_openai_response(question, schema_info, history=[], api_key=None, quota_key=None):
+    """
+    Generates a SQL query by sending a structured request to the configured
+    LLM provider (LLM_PROVIDER / LLM_MODEL).
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None, "OpenAI API key is not configured."
+
+    messages = build_llm_messages(question, schema_info, history)
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.0,  # Set to 0 for deterministic and accurate SQL generation
-            response_format={"type": "json_object"} # Enforce JSON output
-        )
-        
+        # Shared client with deadline, retries and circuit breaker (see llm_client)
+        content = complete_json(messages, api_key=api_key, quota_key=quota_key)
         # The response content should already be a valid JSON object
-        json_result = json.loads(response.choices[0].message.content)
+        json_result = json.loads(content)
         return json_result, None
 
     except Exception as e:
-        return None, f"Error communicating with OpenAI API: {str(e)}"
+        return None, _llm_error(e)
+
+
+async def get_openai_response_async(question, schema_info, history=[], api_key=None, quota_key=None):
+    """ get_openai_response() for the asyncio pipeline; awaits the provider instead of blocking. """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None, "OpenAI API key is not configured."
+
+    messages = build_llm_messages(question, schema_info, history)
+    try:
+        content = await acomplete_json(messages, api_key=api_key, quota_key=quota_key)
+        return json.loads(content), None
+
+    except Exception as e:
+        return None, _llm_error(e)
 
 def create_visualization(df, viz_info):
     """ Creates a Plotly figure from a DataFrame and visualization info. """
+    # pandas and plotly take over a second to import; only figure requests need them
+    import pandas as pd
+    import plotly.express as px
+
     if not isinstance(df, pd.DataFrame):
         df = pd.DataFrame(df)
     
@@ -185,7 +388,7 @@ def create_visualization(df, viz_info):
     title = viz_info.get("title", "Data Visualization")
     color = viz_info.get("color")
     
-    if not color:
+    if not color or color not in df.columns:
         color = None
         
     try:
@@ -193,6 +396,8 @@ def create_visualization(df, viz_info):
             if x_axis not in df.columns or y_axis not in df.columns:
                 return {"error": f"Required columns 'x_axis' or 'y_axis' not found for bar plot."}
             fig = px.bar(data_frame=df, x=x_axis, y=y_axis, color=color, title=title)
+            if viz_info.get("bargap") is not None:
+                fig.update_layout(bargap=viz_info["bargap"])
         
         elif viz_type == "line":
             if x_axis not in df.columns or y_axis not in df.columns:
@@ -207,7 +412,7 @@ def create_visualization(df, viz_info):
         elif viz_type == "scatter":
             if x_axis not in df.columns or y_axis not in df.columns:
                 return {"error": f"Required columns 'x_axis' or 'y_axis' not found for scatter plot."}
-            fig = px.scatter(data_frame=df, x=x_axis, y=y_axis, color=color, title=title)
+            fig = px.scatter(data_frame=df, x=x_axis, y=y_axis, color=color, size=viz_info.get("size"), title=title)
         
         elif viz_type == "histogram":
             if x_axis not in df.columns:
@@ -0,0 +1,41 @@
+import time
+import importlib
+import threading
+from app.utils import metrics
+
+# --- Startup Pre-warming ---
+# Heavy modules and external clients are imported lazily on first use. With
+# PREWARM=background they are loaded on a daemon thread right after
+# create_app(), so the first request does not pay for them; with
+# PREWARM=blocking create_app() waits (useful with a preloading server that
+# forks workers after the app is built).
+_MODULES = ("pandas", "plotly.express", "openai", "pyarrow")
+
+
+def prewarm():
+    """ Imports the lazily loaded modules and builds the external clients. """
+    start = time.perf_counter()
+    for module in _MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"[Prewarm] Skipped {module}: {e}")
+
+    from app.utils.supabase_utils import get_supabase
+    try:
+        get_supabase()
+    except Exception as e:
+        print(f"[Prewarm] Supabase client not created: {e}")
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics.observe("startup.prewarm_ms", elapsed_ms)
+    print(f"[Prewarm] Done in {elapsed_ms:.0f} ms")
+
+
+def start_prewarm(mode):
+    if mode == "blocking":
+        prewarm()
+    elif mode == "background":
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+    elif mode not in ("", "off"):
+        print(f"[Prewarm] Unknown PREWARM mode '{mode}', skipping")
@@ -0,0 +1,40 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import Config
+from app.utils import metrics
+
+# --- Batch Fan-out ---
+# /api/query/batch runs its items on one shared pool of QUERY_BATCH_WORKERS
+# threads. Each batch keeps at most its own concurrency limit of items
+# submitted at a time, so one large batch cannot take over the pool (or the
+# LLM rate limit and the target database's connections).
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(Config.QUERY_BATCH_WORKERS, thread_name_prefix="query-batch")
+    return _executor
+
+
+def run_batch(items, fn, concurrency):
+    """
+    Calls fn(item) for every item, at most `concurrency` at a time, and yields
+    (index, result) in completion order. fn should return errors rather than
+    raise them.
+    """
+    executor = _get_executor()
+    metrics.observe("query_batch.items", len(items))
+    pending = {}
+    next_index = 0
+    while next_index < len(items) or pending:
+        while next_index < len(items) and len(pending) < concurrency:
+            pending[executor.submit(fn, items[next_index])] = next_index
+            next_index += 1
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
@@ -0,0 +1,329 @@
+import os
+import json
+import math
+import uuid
+from datetime import datetime, date
+from config import Config
+from app import db
+from app.models.messageModel import Message
+from app.utils.llm_cache import make_cache_key, get_cached_response, cache_response
+from app.utils.result_cache import make_result_key, get_cached_results, cache_results
+from app.utils.result_store import spill_results
+from app.utils.schema_retrieval import select_relevant_schema
+from app.utils.schema_render import schema_prompt_text
+from app.utils.nl2sql_utils import get_openai_response, get_openai_response_async, stream_query, is_query_safe
+from app.utils.figure_utils import visualization_spec
+from app.utils.rate_limits import llm_quota_wait
+from app.utils.single_flight import llm_flight, sql_flight
+
+# --- NL -> SQL Query Pipeline ---
+# run_query_pipeline() yields (event, payload) pairs as each stage completes:
+#
+#   ("llm", {...})            explanation and SQL, as soon as the LLM answers
+#   ("rows", {"rows": [...]}) first page of result rows, in chunks from the cursor
+#   ("visualization", {...})  visualization spec
+#   ("done", {...})           persisted message id, the URL of its figure (if
+#                             any), full response JSON and the unserialized
+#                             response dict ("result")
+#   ("error", {...})          terminal; "response" text plus HTTP status
+#                             (429 with "retry_after" when the caller's LLM
+#                             token quota is used up, see rate_limits)
+#
+# Results longer than QUERY_PAGE_SIZE rows are spilled to the result store;
+# the response carries the first page plus a "result_handle" for
+# GET /api/results/<id>, so neither the API reply nor Message.response grows
+# with the result size.
+#
+# The Plotly figure itself is rendered later by GET /api/messages/<id>/figure
+# (see figure_utils); "visualization": false in the request skips the spec.
+#
+# Concurrent requests with the same LLM cache key (database, schema version,
+# prompt, history) share one LLM call, and the same result cache key (database,
+# normalized SQL) one SQL execution; see single_flight.
+#
+# /api/query collects the events into a single JSON response and
+# /api/query/stream forwards them as Server-Sent Events. Under ASGI (app.asgi)
+# /api/query runs run_query_pipeline_async(), which shares every stage.
+
+
+def convert_dates(obj):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return obj
+
+
+def _cached_llm_response(ctx):
+    """ Returns (cache_key, cached LLM answer or None). """
+    cache_key = make_cache_key(ctx["db_obj"].database_id, ctx["schema"], ctx["prompt"], ctx["history"])
+    return cache_key, get_cached_response(cache_key) if ctx["use_cache"] else None
+
+
+def _llm_schema_text(ctx):
+    """ Schema text for the LLM prompt, narrowed to the tables relevant to the question. """
+    db_obj = ctx["db_obj"]
+    prompt_schema = select_relevant_schema(db_obj.database_id, ctx["schema"], ctx["prompt"], ctx["history"])
+    return schema_prompt_text(prompt_schema, db_obj.database_schema_prompt)
+
+
+def _llm_quota_error(ctx):
+    """ Error payload when the caller's LLM token bucket is overdrawn, else None. """
+    wait = llm_quota_wait(ctx.get("identity"))
+    if wait <= 0:
+        return None
+    seconds = max(1, math.ceil(wait))
+    return {"status": 429, "retry_after": seconds,
+            "response": f"LLM token quota exceeded, please try again in {seconds} seconds."}
+
+
+def _checked_sql(llm_response):
+    """ Returns (sql, None), or (None, error payload) when the LLM answer must not run. """
+    generated_sql = llm_response.get("sql_query", "")
+    if not is_query_safe(generated_sql) or not generated_sql:
+        return None, {"status": 200, "response": "Your query is too broad, please provide a valid prompt."}
+    return generated_sql, None
+
+
+def _llm_event(llm_response, generated_sql, llm_cache_hit):
+    return {
+        "query": generated_sql,
+        "explanation": llm_response.get("explanation"),
+        "cache": {"llm": llm_cache_hit},
+    }
+
+
+def _execution_error(generated_sql, err):
+    return {"status": 200, "response": json.dumps({
+        "query": generated_sql,
+        "explanation": f"An error occurred while executing the query: {err}",
+        "results": [],
+        "visualization": {"type": "none"}
+    })}
+
+
+def _cached_results(ctx, generated_sql):
+    """ Returns (result_key, cached {"rows", "truncated"} or None). """
+    result_key = make_result_key(ctx["db_obj"].database_id, generated_sql)
+    return result_key, get_cached_results(result_key) if ctx["use_cache"] else None
+
+
+def _collect_rows(generated_sql, engine):
+    """ Runs the query to completion; returns (rows, truncated). """
+    rows = []
+    stream = stream_query(generated_sql, engine)
+    for chunk in stream:
+        rows.extend(chunk)
+    return rows, stream.truncated
+
+
+def _page_chunks(df):
+    first_page = df[:Config.QUERY_PAGE_SIZE]
+    for start in range(0, len(first_page), Config.QUERY_CHUNK_SIZE):
+        yield first_page[start:start + Config.QUERY_CHUNK_SIZE]
+
+
+def _visualization(ctx, llm_response):
+    if not ctx.get("include_visualization", True):
+        return None
+    return visualization_spec(llm_response)
+
+
+def _finalize(ctx, llm_response, df, truncated, visualization, message_id, cache_hits):
+    """ Spills long results, saves the Message and returns the "done" payload. """
+    page_size = Config.QUERY_PAGE_SIZE
+    figure_url = None
+    if visualization is not None and visualization["type"] != "none" and df:
+        # Only announced once the Message it renders from is committed
+        figure_url = f"/api/messages/{message_id}/figure"
+        visualization = {**visualization, "figure_url": figure_url}
+    response_dict = {
+        "database_id": str(ctx["db_obj"].database_id),
+        "query": llm_response["sql_query"],
+        "explanation": llm_response["explanation"],
+        "results": df[:page_size],
+        "truncated": truncated,
+        "visualization": visualization,
+        "cache": cache_hits
+    }
+    if len(df) > page_size:
+        try:
+            handle_id = spill_results(ctx["user_id"], df, truncated=truncated)
+            response_dict["result_handle"] = {
+                "id": handle_id,
+                "total_rows": len(df),
+                "page_size": page_size,
+                "has_more": True
+            }
+        except OSError as e:
+            # Without the spill store the reply still carries the first page
+            print(f"[Result Store] Failed to spill results: {e}")
+    response_json = json.dumps(response_dict, default=convert_dates)
+
+    new_message = Message(
+        message_id=message_id,
+        chat_id=ctx.get("chat_id"),
+        user_id=ctx["user_id"],
+        prompt=ctx["prompt"],
+        response=response_json,
+    )
+    db.session.add(new_message)
+    db.session.commit()
+
+    return {
+        "message_id": str(new_message.message_id),
+        "figure_url": figure_url,
+        "response": response_json,
+        "result": response_dict,
+    }
+
+
+def run_query_pipeline(ctx):
+    """
+    Runs one NL -> SQL request. `ctx` holds the resolved request: user_id,
+    prompt, history, chat_id, use_cache, include_visualization, db_obj,
+    engine and schema.
+    """
+    cache_key, llm_response = _cached_llm_response(ctx)
+    llm_cache_hit = llm_response is not None
+    if not llm_cache_hit:
+        quota_error = _llm_quota_error(ctx)
+        if quota_error:
+            yield "error", quota_error
+            return
+
+        def ask_llm():
+            llm_response, error = get_openai_response(
+                ctx["prompt"], _llm_schema_text(ctx), ctx["history"],
+                api_key=os.getenv("OPENAI_API_KEY"), quota_key=ctx.get("identity")
+            )
+            # Only usable answers are cached; anything else is asked again next time
+            if not error and llm_response.get("sql_query"):
+                cache_response(cache_key, llm_response)
+            return llm_response, error
+
+        # Identical questions in flight at the same time share one LLM call
+        llm_response, error = llm_flight.do(cache_key, ask_llm)
+        if error:
+            yield "error", {"status": 200, "response": f"LLM Error: {error}"}
+            return
+
+    generated_sql, error = _checked_sql(llm_response)
+    if error:
+        yield "error", error
+        return
+
+    yield "llm", _llm_event(llm_response, generated_sql, llm_cache_hit)
+
+    result_key, cached = _cached_results(ctx, generated_sql)
+    result_cache_hit = cached is not None
+    page_size = Config.QUERY_PAGE_SIZE
+    if result_cache_hit:
+        df, truncated = cached["rows"], cached["truncated"]
+        for chunk in _page_chunks(df):
+            yield "rows", {"rows": chunk}
+    else:
+        call = None
+        try:
+            # The same SQL already running for another request shares its rows
+            call, shared = sql_flight.lead_or_wait(result_key)
+            if call is not None:
+                # Rows go out chunk by chunk as the server-side cursor produces them
+                df = []
+                stream = stream_query(generated_sql, ctx["engine"])
+                for chunk in stream:
+                    sent = len(df)
+                    df.extend(chunk)
+                    if sent < page_size:
+                        yield "rows", {"rows": chunk[:page_size - sent]}
+                truncated = stream.truncated
+                cache_results(result_key, ctx["db_obj"].database_id, {"rows": df, "truncated": truncated})
+                call.resolve((df, truncated))
+            else:
+                df, truncated = shared
+                for chunk in _page_chunks(df):
+                    yield "rows", {"rows": chunk}
+        except Exception as err:
+            if call is not None:
+                call.fail(err)
+            yield "error", _execution_error(generated_sql, err)
+            return
+        finally:
+            if call is not None:
+                call.abandon()
+
+    message_id = str(uuid.uuid4())
+    visualization = _visualization(ctx, llm_response)
+    if visualization is not None:
+        yield "visualization", visualization
+
+    yield "done", _finalize(
+        ctx, llm_response, df, truncated, visualization, message_id,
+        {"llm": llm_cache_hit, "results": result_cache_hit}
+    )
+
+
+async def run_query_pipeline_async(ctx, run_blocking):
+    """
+    run_query_pipeline() as an async generator with the same events. The LLM
+    call is awaited on the event loop; everything that blocks (caches, schema
+    retrieval, SQL execution, saving the Message) goes through
+    `await run_blocking(fn, *args)`, which the caller runs in a bounded
+    worker pool inside an app context (see app.asgi).
+    """
+    cache_key, llm_response = await run_blocking(_cached_llm_response, ctx)
+    llm_cache_hit = llm_response is not None
+    if not llm_cache_hit:
+        quota_error = await run_blocking(_llm_quota_error, ctx)
+        if quota_error:
+            yield "error", quota_error
+            return
+
+        async def ask_llm():
+            schema_text = await run_blocking(_llm_schema_text, ctx)
+            llm_response, error = await get_openai_response_async(
+                ctx["prompt"], schema_text, ctx["history"],
+                api_key=os.getenv("OPENAI_API_KEY"), quota_key=ctx.get("identity")
+            )
+            if not error and llm_response.get("sql_query"):
+                await run_blocking(cache_response, cache_key, llm_response)
+            return llm_response, error
+
+        llm_response, error = await llm_flight.do_async(cache_key, ask_llm)
+        if error:
+            yield "error", {"status": 200, "response": f"LLM Error: {error}"}
+            return
+
+    generated_sql, error = _checked_sql(llm_response)
+    if error:
+        yield "error", error
+        return
+
+    yield "llm", _llm_event(llm_response, generated_sql, llm_cache_hit)
+
+    result_key, cached = await run_blocking(_cached_results, ctx, generated_sql)
+    result_cache_hit = cached is not None
+    if result_cache_hit:
+        df, truncated = cached["rows"], cached["truncated"]
+    else:
+
+        async def run_sql():
+            df, truncated = await run_blocking(_collect_rows, generated_sql, ctx["engine"])
+            await run_blocking(cache_results, result_key, ctx["db_obj"].database_id, {"rows": df, "truncated": truncated})
+            return df, truncated
+
+        try:
+            df, truncated = await sql_flight.do_async(result_key, run_sql)
+        except Exception as err:
+            yield "error", _execution_error(generated_sql, err)
+            return
+    for chunk in _page_chunks(df):
+        yield "rows", {"rows": chunk}
+
+    message_id = str(uuid.uuid4())
+    visualization = _visualization(ctx, llm_response)
+    if visualization is not None:
+        yield "visualization", visualization
+
+    yield "done", await run_blocking(
+        _finalize, ctx, llm_response, df, truncated, visualization, message_id,
+        {"llm": llm_cache_hit, "results": result_cache_hit}
+    )
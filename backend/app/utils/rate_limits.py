@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from flask import request, jsonify, g
+from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import HTTPException
+from config import Config
+from app.utils import metrics
+
+# --- Rate Limits ---
+# Token buckets per caller identity: "key:<key_id>" for API keys,
+# "user:<clerk sub>" for session tokens and "ip:<address>" otherwise, so
+# users behind one NAT no longer share a bucket.
+#
+#   requests    RATE_LIMIT_PER_MINUTE refill, RATE_LIMIT_BURST capacity; one
+#               token per request (a batch takes one per prompt), checked
+#               before every request
+#   llm_tokens  LLM_TOKENS_PER_HOUR refill, LLM_TOKENS_BURST capacity; the
+#               prompt + completion tokens of each LLM call are charged
+#               afterwards and may overdraw the bucket, after which the
+#               identity's LLM calls wait until it is positive again
+#
+# Buckets live in RATE_LIMIT_BACKEND: "sqlite" (shared by all worker
+# processes on a host and kept across restarts), "memory" (per process) or
+# "none" (limits off).
+_store = None
+_store_lock = threading.Lock()
+_PRUNE_EVERY = 1000
+
+
+class MemoryBuckets:
+    """ Bucket levels for this process only. """
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated_at, full_at)
+        self._lock = threading.Lock()
+        self._updates = 0
+
+    def update(self, key, fn):
+        """ Atomically applies fn(tokens, updated_at, now) -> (tokens, full_at, result). """
+        now = time.time()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (None, None, None))
+            tokens, full_at, result = fn(tokens, updated_at, now)
+            self._buckets[key] = (tokens, now, full_at)
+            self._updates += 1
+            if self._updates % _PRUNE_EVERY == 0:
+                # Full buckets are the same as missing ones
+                for stale in [k for k, v in self._buckets.items() if v[2] <= now]:
+                    del self._buckets[stale]
+        return result
+
+    def stats(self):
+        return {"backend": "memory", "buckets": len(self._buckets)}
+
+
+class SQLiteBuckets:
+    """ Bucket levels shared by all worker processes on a host, in a local SQLite file. """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._updates = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    full_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, fn):
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front, so the read-modify-write
+        # cannot interleave with another process
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, full_at, result = fn(row[0] if row else None, row[1] if row else None, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, full_at),
+            )
+            self._updates += 1
+            if self._updates % _PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def stats(self):
+        count = self._connect().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {"backend": "sqlite", "buckets": count}
+
+
+def _get_store():
+    global _store
+    if _store is None and Config.RATE_LIMIT_BACKEND != "none":
+        with _store_lock:
+            if _store is None:
+                if Config.RATE_LIMIT_BACKEND == "sqlite":
+                    _store = SQLiteBuckets(Config.RATE_LIMIT_PATH)
+                elif Config.RATE_LIMIT_BACKEND == "memory":
+                    _store = MemoryBuckets()
+                else:
+                    raise ValueError(f"Unknown rate limit backend: {Config.RATE_LIMIT_BACKEND}")
+    return _store
+
+
+class TokenBucket:
+    """ One kind of limit: `capacity` tokens, refilled at `per_second`. """
+
+    def __init__(self, name, capacity, per_second):
+        self.name = name
+        self.capacity = capacity
+        self.per_second = per_second
+
+    def _level(self, tokens, updated_at, now):
+        if tokens is None:
+            return self.capacity
+        return min(self.capacity, tokens + (now - updated_at) * self.per_second)
+
+    def _full_at(self, tokens, now):
+        return now + (self.capacity - tokens) / self.per_second
+
+    def _update(self, identity, fn):
+        store = _get_store()
+        if store is None or not identity:
+            return 0.0
+        try:
+            return store.update(f"{self.name}:{identity}", fn)
+        except sqlite3.Error as e:
+            # A broken limiter store must not take the API down with it
+            print(f"[Rate Limits] {self.name} bucket update failed: {e}")
+            return 0.0
+
+    def take(self, identity, cost=1):
+        """ Takes `cost` tokens if the bucket has them. Returns 0, or the seconds to wait. """
+        cost = min(cost, self.capacity)
+
+        def fn(tokens, updated_at, now):
+            level = self._level(tokens, updated_at, now)
+            if level >= cost:
+                return level - cost, self._full_at(level - cost, now), 0.0
+            return level, self._full_at(level, now), (cost - level) / self.per_second
+        return self._update(identity, fn)
+
+    def charge(self, identity, cost):
+        """ Deducts `cost` tokens unconditionally; the bucket may go negative. """
+        def fn(tokens, updated_at, now):
+            level = self._level(tokens, updated_at, now) - cost
+            return level, self._full_at(level, now), None
+        self._update(identity, fn)
+
+    def wait_time(self, identity):
+        """ Seconds until the bucket is positive again (0 if it is now). """
+        def fn(tokens, updated_at, now):
+            level = self._level(tokens, updated_at, now)
+            return level, self._full_at(level, now), max(0.0, -level / self.per_second)
+        return self._update(identity, fn)
+
+
+request_buckets = TokenBucket("requests", Config.RATE_LIMIT_BURST, Config.RATE_LIMIT_PER_MINUTE / 60)
+llm_token_buckets = TokenBucket("llm_tokens", Config.LLM_TOKENS_BURST, Config.LLM_TOKENS_PER_HOUR / 3600)
+
+
+def rate_limit_identity():
+    """ The caller's bucket identity; never aborts (unverifiable callers fall back to their IP). """
+    identity = g.get("rate_limit_identity")
+    if identity is not None:
+        return identity
+
+    from app.utils.clerk_auth import verify_clerk_token, get_authorization_type
+    from app.utils.api_key_cache import get_key_record
+
+    identity = None
+    try:
+        auth = get_authorization_type()
+        if auth == "token":
+            identity = f"user:{verify_clerk_token()['sub']}"
+        elif auth == "key":
+            record = get_key_record(request.headers["x-api-key"])
+            if record is not None:
+                identity = f"key:{record.key_id}"
+    except HTTPException:
+        pass
+    g.rate_limit_identity = identity = identity or f"ip:{get_remote_address()}"
+    return identity
+
+
+def rate_limited_response(wait, message="Rate limit exceeded"):
+    seconds = max(1, math.ceil(wait))
+    return jsonify({"error": f"{message}, retry in {seconds} seconds"}), 429, {"Retry-After": str(seconds)}
+
+
+def take_requests(cost=1):
+    """ Takes request tokens for the current caller; returns a 429 response when out of tokens, else None. """
+    wait = request_buckets.take(rate_limit_identity(), cost)
+    if wait > 0:
+        metrics.incr("rate_limit.requests_rejected")
+        return rate_limited_response(wait)
+    return None
+
+
+def llm_quota_wait(identity):
+    """ Seconds until `identity` may call the LLM again (0 if it may now). """
+    return llm_token_buckets.wait_time(identity)
+
+
+def charge_llm_tokens(identity, tokens):
+    if identity and tokens:
+        llm_token_buckets.charge(identity, tokens)
+
+
+def init_rate_limits(app):
+    """ Checks the request bucket before every request (CORS preflights excepted). """
+    @app.before_request
+    def _check_request_limit():
+        if request.method == "OPTIONS":
+            return None
+        return take_requests()
+
+
+def _stats():
+    store = _get_store()
+    return store.stats() if store is not None else {"backend": "none"}
+
+
+metrics.register_gauge("rate_limits", _stats)
@@ -0,0 +1,101 @@
+import re
+import json
+import hashlib
+import threading
+from config import Config
+from app.utils import metrics
+from app.utils.cache_utils import create_cache
+
+# --- Query Result Cache ---
+# Stores the serialized rows of executed queries under
+# "<database_id>:v<format>:<sql hash>" so identical SQL (follow-ups, reloads)
+# is answered without touching the customer database. Evicted LRU-first once
+# RESULT_CACHE_MAX_BYTES is reached.
+_cache = None
+_cache_lock = threading.Lock()
+
+# Bump when the cached value changes shape; entries in the old format are
+# then never read again and age out (2: {"rows", "truncated"} instead of a list)
+_FORMAT_VERSION = 2
+
+_SQL_TOKENS = re.compile(
+    r"""'(?:[^']|'')*'"""      # single-quoted string
+    r'''|"(?:[^"]|"")*"'''     # double-quoted identifier
+    r"|`[^`]*`"                # backtick identifier
+    r"|--[^\n]*"               # line comment
+    r"|/\*.*?\*/"              # block comment
+    r"|\s+",                   # whitespace
+    re.DOTALL,
+)
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache(
+                    "result_cache",
+                    Config.RESULT_CACHE_BACKEND,
+                    Config.RESULT_CACHE_MAX_BYTES,
+                    path=Config.RESULT_CACHE_PATH,
+                )
+    return _cache
+
+
+def normalize_sql(sql_query):
+    """
+    Collapses whitespace and drops comments and trailing semicolons outside of
+    quoted strings and identifiers, so formatting differences share a cache entry.
+    """
+    parts = []
+    position = 0
+    for match in _SQL_TOKENS.finditer(sql_query):
+        if match.start() > position:
+            parts.append(sql_query[position:match.start()])
+        token = match.group(0)
+        if token[0] in "'\"`":
+            parts.append(token)
+        elif parts and parts[-1] != " ":
+            parts.append(" ")
+        position = match.end()
+    parts.append(sql_query[position:])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def make_result_key(database_id, sql_query):
+    digest = hashlib.sha256(normalize_sql(sql_query).encode()).hexdigest()
+    return f"{database_id}:v{_FORMAT_VERSION}:{digest}"
+
+
+def get_cached_results(key):
+    """ Returns the cached {"rows": [...], "truncated": bool} for a key, or None. """
+    cache = _get_cache()
+    if cache is None:
+        return None
+    value = cache.get(key)
+    return json.loads(value) if value is not None else None
+
+
+def cache_results(key, database_id, result):
+    cache = _get_cache()
+    if cache is None:
+        return
+    ttl = Config.RESULT_CACHE_TTL_OVERRIDES.get(str(database_id), Config.RESULT_CACHE_TTL)
+    if ttl > 0:
+        cache.set(key, json.dumps(result, default=str), ttl)
+
+
+def invalidate_database(database_id):
+    """ Drops every cached result for a database. """
+    cache = _get_cache()
+    if cache is not None:
+        cache.delete_prefix(f"{database_id}:")
+
+
+def _cache_stats():
+    cache = _get_cache()
+    return cache.stats() if cache is not None else {"backend": "none"}
+
+
+metrics.register_gauge("result_cache", _cache_stats)
@@ -0,0 +1,114 @@
+import json
+from app.utils import metrics
+
+# --- Result Encodings ---
+# Query results can be returned in three shapes, picked per request with a
+# "format" body/query parameter or the Accept header:
+#
+#   records   [{"col": value, ...}, ...]                 (default, unchanged)
+#   columnar  {"columns": [...], "types": [...], "data": [[col values], ...]}
+#   arrow     Apache Arrow IPC stream bytes; the query, explanation,
+#             visualization and result handle travel as schema metadata
+#
+# Message.response always stores the records shape, so chat history and the
+# frontend do not depend on what a client negotiated.
+FORMAT_RECORDS = "records"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_ARROW = "arrow"
+FORMATS = (FORMAT_RECORDS, FORMAT_COLUMNAR, FORMAT_ARROW)
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_MIMETYPE = "application/vnd.infera.columnar+json"
+
+
+def negotiate_format(requested=None, accept_mimetypes=None):
+    """
+    Picks the result format from an explicit parameter, falling back to the
+    Accept header. Returns None for an unknown explicit format.
+    """
+    if requested:
+        requested = str(requested).lower()
+        return requested if requested in FORMATS else None
+    if accept_mimetypes:
+        best = accept_mimetypes.best_match(["application/json", COLUMNAR_MIMETYPE, ARROW_MIMETYPE])
+        if best == ARROW_MIMETYPE:
+            return FORMAT_ARROW
+        if best == COLUMNAR_MIMETYPE:
+            return FORMAT_COLUMNAR
+    return FORMAT_RECORDS
+
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def result_columns(rows, columns=None):
+    if columns:
+        return list(columns)
+    return list(rows[0].keys()) if rows else []
+
+
+def _column_type(values):
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add("boolean")
+        elif isinstance(value, int):
+            kinds.add("integer")
+        elif isinstance(value, float):
+            kinds.add("number")
+        else:
+            kinds.add("string")
+    if not kinds:
+        return "null"
+    if kinds == {"integer", "number"}:
+        return "number"
+    return kinds.pop() if len(kinds) == 1 else "mixed"
+
+
+def to_columnar(rows, columns=None):
+    """ Column names once, then one array of values per column. """
+    columns = result_columns(rows, columns)
+    data = [[row.get(col) for row in rows] for col in columns]
+    return {
+        "columns": columns,
+        "types": [_column_type(values) for values in data],
+        "data": data,
+    }
+
+
+def _arrow_array(pa, values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type columns are sent as text rather than failing the request
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+
+def to_arrow_ipc(rows, columns=None, metadata=None):
+    """
+    Encodes rows as an Arrow IPC stream. `metadata` values are stored as JSON
+    strings in the schema metadata.
+    """
+    import pyarrow as pa
+
+    columns = result_columns(rows, columns)
+    arrays = [_arrow_array(pa, [row.get(col) for row in rows]) for col in columns]
+    schema_metadata = {
+        key: json.dumps(value, default=str)
+        for key, value in (metadata or {}).items()
+    }
+    table = pa.Table.from_arrays(arrays, names=columns).replace_schema_metadata(schema_metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    payload = sink.getvalue().to_pybytes()
+    metrics.observe("result_format.arrow_bytes", len(payload))
+    return payload
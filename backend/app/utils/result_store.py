@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import uuid
+import threading
+from config import Config
+from app.utils import metrics
+
+# --- Result Spill Store ---
+# Full query results are written to RESULT_SPILL_DIR as NDJSON (one row per
+# line) next to a small index file, so /api/query and Message.response only
+# carry the first page. The index records the byte offset of every
+# _INDEX_STRIDE-th row, which lets a page be read without scanning the file.
+# The directory is bounded by RESULT_SPILL_MAX_BYTES (least recently read
+# results go first) and results expire after RESULT_SPILL_TTL idle seconds.
+_INDEX_STRIDE = 256
+_lock = threading.Lock()
+
+
+def _paths(handle_id):
+    base = os.path.join(Config.RESULT_SPILL_DIR, handle_id)
+    return base + ".ndjson", base + ".json"
+
+
+def _valid_handle(handle_id):
+    try:
+        return str(uuid.UUID(handle_id)) == handle_id
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+def spill_results(user_id, rows, columns=None, truncated=False):
+    """ Writes a result set to the spill store and returns its handle id. """
+    os.makedirs(Config.RESULT_SPILL_DIR, exist_ok=True)
+    handle_id = str(uuid.uuid4())
+    data_path, index_path = _paths(handle_id)
+
+    offsets = []
+    with open(data_path, "wb") as f:
+        for position, row in enumerate(rows):
+            if position % _INDEX_STRIDE == 0:
+                offsets.append(f.tell())
+            f.write(json.dumps(row, default=str).encode() + b"\n")
+        size = f.tell()
+
+    index = {
+        "user_id": user_id,
+        "total_rows": len(rows),
+        "columns": columns if columns is not None else (list(rows[0].keys()) if rows else []),
+        "truncated": truncated,
+        "offsets": offsets,
+        "created_at": time.time(),
+    }
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+
+    metrics.incr("result_store.spilled_bytes", size)
+    _enforce_budget()
+    return handle_id
+
+
+def read_page(handle_id, user_id, offset=0, limit=None):
+    """
+    Returns (rows, index) for rows [offset, offset + limit) of a spilled result,
+    or (None, None) when the handle is unknown, expired or owned by someone else.
+    """
+    if not _valid_handle(handle_id):
+        return None, None
+    data_path, index_path = _paths(handle_id)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        idle = time.time() - os.path.getmtime(index_path)
+    except (OSError, ValueError):
+        return None, None
+    if index["user_id"] != user_id or idle > Config.RESULT_SPILL_TTL:
+        return None, None
+
+    limit = limit or Config.QUERY_PAGE_SIZE
+    offset = max(0, offset)
+    rows = []
+    if offset < index["total_rows"]:
+        stride_index = offset // _INDEX_STRIDE
+        try:
+            with open(data_path, "rb") as f:
+                f.seek(index["offsets"][stride_index])
+                position = stride_index * _INDEX_STRIDE
+                for line in f:
+                    if position >= offset + limit:
+                        break
+                    if position >= offset:
+                        rows.append(json.loads(line))
+                    position += 1
+        except OSError:
+            return None, None
+        # Reading a result keeps it from being evicted first
+        os.utime(index_path)
+    metrics.incr("result_store.pages_served")
+    return rows, index
+
+
+def _enforce_budget():
+    with _lock:
+        try:
+            names = os.listdir(Config.RESULT_SPILL_DIR)
+        except OSError:
+            return
+        now = time.time()
+        results = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            handle_id = name[:-len(".json")]
+            data_path, index_path = _paths(handle_id)
+            try:
+                size = os.path.getsize(data_path) + os.path.getsize(index_path)
+                last_used = os.path.getmtime(index_path)
+            except OSError:
+                continue
+            results.append((last_used, size, handle_id))
+
+        total = sum(size for _, size, _ in results)
+        evicted = 0
+        for last_used, size, handle_id in sorted(results):
+            if total <= Config.RESULT_SPILL_MAX_BYTES and now - last_used <= Config.RESULT_SPILL_TTL:
+                continue
+            for path in _paths(handle_id):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            evicted += 1
+        if evicted:
+            metrics.incr("result_store.evictions", evicted)
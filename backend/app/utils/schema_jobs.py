@@ -0,0 +1,180 @@
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from config import Config
+from app import db
+from app.models.database_connection import DatabaseConnection
+from app.utils.engine_registry import get_engine, checkout, invalidate_engine
+from app.utils.nl2sql_utils import get_db_schema
+from app.utils import llm_cache, result_cache, schema_retrieval
+
+# --- Background Schema Introspection ---
+# add_database / update_database mark the database "Introspecting" and return
+# immediately; a worker thread tests the connection, reflects the schema and
+# moves database_status to "Active" or "Failed". A failed job keeps the last
+# good schema. Rows a dead worker left "Introspecting" for longer than
+# SCHEMA_JOB_STALE_AFTER are reset to "Failed" at startup and are no longer
+# reported as busy by introspection_pending().
+STATUS_INTROSPECTING = "Introspecting"
+STATUS_ACTIVE = "Active"
+STATUS_FAILED = "Failed"
+
+_executor = ThreadPoolExecutor(max_workers=Config.SCHEMA_JOB_WORKERS, thread_name_prefix="schema-job")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def mark_introspecting(db_conn):
+    """ Sets the "Introspecting" status (caller commits, then submits the job). """
+    db_conn.database_status = STATUS_INTROSPECTING
+    db_conn.introspection_started_at = datetime.utcnow()
+
+
+def _stale_before():
+    return datetime.utcnow() - timedelta(seconds=Config.SCHEMA_JOB_STALE_AFTER)
+
+
+def introspection_pending(db_conn):
+    """ True while a (not stale) introspection job owns the database. """
+    if db_conn.database_status != STATUS_INTROSPECTING:
+        return False
+    started_at = db_conn.introspection_started_at
+    return started_at is not None and started_at > _stale_before()
+
+
+def submit_introspection(app, database_id, user_id):
+    """
+    Queues introspection for a database. A newer job for the same database
+    supersedes an older one still running, whose result is then discarded.
+    """
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "status": "queued",
+        "submitted_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "error": None,
+    }
+    with _lock:
+        _jobs[str(database_id)] = job
+    _executor.submit(_run_introspection, app, database_id, user_id, job["job_id"])
+    return job
+
+
+def get_job(database_id):
+    with _lock:
+        job = _jobs.get(str(database_id))
+        return dict(job) if job else None
+
+
+def _is_current(database_id, job_id):
+    with _lock:
+        job = _jobs.get(str(database_id))
+        return job is not None and job["job_id"] == job_id
+
+
+def _update_job(database_id, job_id, **fields):
+    with _lock:
+        job = _jobs.get(str(database_id))
+        if job is not None and job["job_id"] == job_id:
+            job.update(fields)
+
+
+def _run_introspection(app, database_id, user_id, job_id):
+    with app.app_context():
+        try:
+            _update_job(database_id, job_id, status="running", started_at=time.time())
+            db_conn = DatabaseConnection.query.filter_by(database_id=database_id, user_id=user_id).first()
+            if not db_conn:
+                _update_job(database_id, job_id, status="failed", finished_at=time.time(), error="Database not found")
+                return
+            if db_conn.database_status == STATUS_INTROSPECTING:
+                # Staleness counts from when the job runs, not from when it was queued
+                db_conn.introspection_started_at = datetime.utcnow()
+                db.session.commit()
+
+            error = None
+            try:
+                engine = get_engine(db_conn.database_id, db_conn.database_string)
+                with checkout(engine) as conn:
+                    conn.execute(text("SELECT 1"))
+                schema = get_db_schema(engine)
+            except Exception as e:
+                error = str(e)
+                invalidate_engine(database_id)
+                print(f"[Schema Job Error] {database_id}: {e}")
+
+            if not _is_current(database_id, job_id):
+                return
+
+            if error is None:
+                db_conn.database_status = STATUS_ACTIVE
+                db_conn.set_schema(schema)
+            else:
+                # Keep the last good schema (and its annotations) on failure
+                db_conn.database_status = STATUS_FAILED
+            db.session.commit()
+            if error is None:
+                schema_retrieval.build_index(database_id, schema)
+                llm_cache.invalidate_database(database_id)
+                result_cache.invalidate_database(database_id)
+
+            _update_job(
+                database_id, job_id,
+                status="succeeded" if error is None else "failed",
+                finished_at=time.time(),
+                error=error,
+            )
+        except Exception as e:
+            db.session.rollback()
+            _update_job(database_id, job_id, status="failed", finished_at=time.time(), error=str(e))
+            print(f"[Schema Job Error] {database_id}: {e}")
+            if _is_current(database_id, job_id):
+                _mark_failed(database_id, user_id)
+        finally:
+            db.session.remove()
+
+
+def _mark_failed(database_id, user_id):
+    """ Best effort: a failed job must not leave the database "Introspecting" (queries get 409). """
+    try:
+        DatabaseConnection.query.filter_by(
+            database_id=database_id, user_id=user_id, database_status=STATUS_INTROSPECTING
+        ).update({"database_status": STATUS_FAILED})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Schema Job Error] {database_id}: could not reset status: {e}")
+
+
+def reset_stuck_introspections(app):
+    """
+    Marks databases left "Introspecting" by a worker that died mid-job as
+    "Failed" (their stored schema is kept). Only rows older than
+    SCHEMA_JOB_STALE_AFTER are touched, so jobs other worker processes are
+    still running are left alone. Runs once per process start on the job pool.
+    """
+    return _executor.submit(_reset_stale_introspections, app)
+
+
+def _reset_stale_introspections(app):
+    with app.app_context():
+        try:
+            count = DatabaseConnection.query.filter(
+                DatabaseConnection.database_status == STATUS_INTROSPECTING,
+                db.or_(
+                    DatabaseConnection.introspection_started_at.is_(None),
+                    DatabaseConnection.introspection_started_at < _stale_before(),
+                ),
+            ).update({"database_status": STATUS_FAILED}, synchronize_session=False)
+            db.session.commit()
+            if count:
+                print(f"[Schema Jobs] Reset {count} database(s) stuck in {STATUS_INTROSPECTING}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[Schema Jobs] Could not reset stuck introspections: {e}")
+        finally:
+            db.session.remove()
@@ -0,0 +1,84 @@
+import json
+
+# --- Compact Schema Rendering ---
+# Renders each table as one DDL-like line for the LLM prompt instead of
+# pretty-printed JSON:
+#
+#   orders(id INTEGER, customer_id INTEGER -> customers.id, total NUMERIC /* incl. tax */) -- Customer orders
+#
+# Empty descriptions are dropped and foreign keys become inline references.
+
+
+def _is_text(value):
+    return value is None or isinstance(value, str)
+
+
+def schema_shape_error(schema):
+    """ Why `schema` cannot be stored and rendered (user-supplied JSON), or None if it can. """
+    if not isinstance(schema, dict):
+        return "Schema must be an object of tables"
+    for table_name, info in schema.items():
+        if not isinstance(info, dict):
+            return f"Table {table_name} must be an object"
+        if not _is_text(info.get("description")):
+            return f"Description of table {table_name} must be a string"
+        columns = info.get("columns", [])
+        if not isinstance(columns, list):
+            return f"Columns of table {table_name} must be a list"
+        for col in columns:
+            if not isinstance(col, dict) or not isinstance(col.get("name"), str) or not col["name"]:
+                return f"Every column of table {table_name} needs a name"
+            if not _is_text(col.get("type")) or not _is_text(col.get("description")):
+                return f"Type and description of column {table_name}.{col['name']} must be strings"
+        foreign_keys = info.get("foreign_keys", [])
+        if not isinstance(foreign_keys, list) or not all(
+            isinstance(fk, dict)
+            and isinstance(fk.get("constrained_columns", []), list)
+            and isinstance(fk.get("referred_columns", []), list)
+            for fk in foreign_keys
+        ):
+            return f"Foreign keys of table {table_name} must be a list of objects with column lists"
+    return None
+
+
+def render_table(table_name, table_info):
+    references = {}
+    for fk in table_info.get("foreign_keys", []):
+        for constrained, referred in zip(fk.get("constrained_columns", []), fk.get("referred_columns", [])):
+            references[constrained] = f"{fk.get('referred_table')}.{referred}"
+
+    columns = []
+    for col in table_info.get("columns", []):
+        column = f"{col['name']} {col.get('type', '')}".rstrip()
+        if col["name"] in references:
+            column += f" -> {references[col['name']]}"
+        if col.get("description"):
+            column += f" /* {col['description'].strip()} */"
+        columns.append(column)
+
+    line = f"{table_name}({', '.join(columns)})"
+    if table_info.get("description"):
+        line += f" -- {table_info['description'].strip()}"
+    return line
+
+
+def render_schema(schema):
+    """ Renders every table; the result is stored as JSON next to the schema. """
+    return {table_name: render_table(table_name, info) for table_name, info in schema.items()}
+
+
+def schema_prompt_text(schema, stored_rendering=None):
+    """
+    Prompt text for the given (possibly retrieval-filtered) schema, reusing the
+    stored per-table rendering and rendering any table missing from it.
+    """
+    rendered = {}
+    if stored_rendering:
+        try:
+            rendered = json.loads(stored_rendering)
+        except (json.JSONDecodeError, TypeError):
+            rendered = {}
+    return "\n".join(
+        rendered.get(table_name) or render_table(table_name, info)
+        for table_name, info in schema.items()
+    )
@@ -0,0 +1,166 @@
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from config import Config
+from app.utils import metrics
+from app.utils.llm_cache import schema_hash
+from app.utils.token_utils import estimate_tokens
+from app.utils.schema_render import render_table
+
+# --- Relevant-Table Retrieval ---
+# A BM25 index over table names, column names and user-written descriptions,
+# built when a schema is saved. For each question only the top-K tables plus
+# their foreign-key neighbours are sent to the LLM, within a token budget.
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+# Field weights: a match on a table name says more than one on a column
+_TABLE_NAME_WEIGHT = 3
+_TABLE_DESCRIPTION_WEIGHT = 2
+_COLUMN_WEIGHT = 1
+
+_MAX_INDEXES = 256
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    """ Splits identifiers and prose into lowercase terms (snake_case, camelCase, plurals). """
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(term) > 4 and term.endswith("ies"):
+            term = term[:-3] + "y"
+        elif len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def _table_document(table_name, table_info):
+    terms = Counter()
+    for term in tokenize(table_name):
+        terms[term] += _TABLE_NAME_WEIGHT
+    for term in tokenize(table_info.get("description", "")):
+        terms[term] += _TABLE_DESCRIPTION_WEIGHT
+    for col in table_info.get("columns", []):
+        for term in tokenize(col.get("name", "")) + tokenize(col.get("description", "")):
+            terms[term] += _COLUMN_WEIGHT
+    return terms
+
+
+def _table_tokens(table_name, table_info):
+    return estimate_tokens(render_table(table_name, table_info))
+
+
+def _build(schema):
+    documents = {name: _table_document(name, info) for name, info in schema.items()}
+    document_frequency = Counter()
+    for terms in documents.values():
+        document_frequency.update(terms.keys())
+
+    neighbours = {name: set() for name in schema}
+    for name, info in schema.items():
+        for fk in info.get("foreign_keys", []):
+            referred = fk.get("referred_table")
+            if referred in neighbours and referred != name:
+                neighbours[name].add(referred)
+                neighbours[referred].add(name)
+
+    lengths = {name: sum(terms.values()) for name, terms in documents.items()}
+    return {
+        "documents": documents,
+        "lengths": lengths,
+        "avg_length": (sum(lengths.values()) / len(lengths)) if lengths else 0,
+        "document_frequency": document_frequency,
+        "neighbours": neighbours,
+        "tokens": {name: _table_tokens(name, info) for name, info in schema.items()},
+    }
+
+
+def build_index(database_id, schema):
+    """ (Re)builds and stores the retrieval index for a saved schema. """
+    index = _build(schema)
+    with _lock:
+        _indexes[str(database_id)] = (schema_hash(schema), index)
+        _indexes.move_to_end(str(database_id))
+        while len(_indexes) > _MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _get_index(database_id, schema):
+    with _lock:
+        entry = _indexes.get(str(database_id))
+    if entry is not None and entry[0] == schema_hash(schema):
+        return entry[1]
+    # Saved by another worker, or evicted: build it now
+    return build_index(database_id, schema)
+
+
+def _score(index, query_terms):
+    documents = index["documents"]
+    total = len(documents)
+    scores = {}
+    for name, terms in documents.items():
+        score = 0.0
+        length_norm = 1 - _BM25_B + _BM25_B * index["lengths"][name] / (index["avg_length"] or 1)
+        for term in query_terms:
+            frequency = terms.get(term)
+            if not frequency:
+                continue
+            df = index["document_frequency"][term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            score += idf * frequency * (_BM25_K1 + 1) / (frequency + _BM25_K1 * length_norm)
+        if score > 0:
+            scores[name] = score
+    return scores
+
+
+def select_relevant_schema(database_id, schema, question, history=None, top_k=None, token_budget=None):
+    """
+    Returns the subset of the schema relevant to a question: the top-K tables
+    by BM25 score plus their foreign-key neighbours, capped by a token budget.
+    Small schemas that already fit are returned unchanged.
+    """
+    top_k = top_k or Config.SCHEMA_TOP_K
+    token_budget = token_budget or Config.SCHEMA_TOKEN_BUDGET
+    index = _get_index(database_id, schema)
+    available_tokens = sum(index["tokens"].values())
+
+    if len(schema) <= top_k and available_tokens <= token_budget:
+        selected = list(schema)
+    else:
+        # Follow-up questions often omit the subject, so recent prompts are part of the query
+        query_text = " ".join(
+            [msg.get("prompt", "") for msg in (history or [])[-2:] if isinstance(msg, dict)] + [question]
+        )
+        scores = _score(index, tokenize(query_text))
+        ranked = sorted(scores, key=lambda name: -scores[name])
+        if not ranked:
+            # No lexical overlap at all: fall back to the schema in stored order
+            ranked = list(schema)
+
+        candidates = ranked[:top_k]
+        for name in ranked[:top_k]:
+            candidates += sorted(index["neighbours"][name] - set(candidates), key=lambda n: -scores.get(n, 0))
+
+        selected, used = [], 0
+        for name in candidates:
+            if name in selected:
+                continue
+            cost = index["tokens"][name]
+            if selected and used + cost > token_budget:
+                continue
+            selected.append(name)
+            used += cost
+
+    sent_tokens = sum(index["tokens"][name] for name in selected)
+    metrics.observe("schema_retrieval.tables_sent", len(selected))
+    metrics.observe("schema_retrieval.tokens_sent", sent_tokens)
+    print(f"[Schema Retrieval] Sent {len(selected)}/{len(schema)} tables, "
+          f"~{sent_tokens}/{available_tokens} schema tokens")
+
+    selected = set(selected)
+    return {name: info for name, info in schema.items() if name in selected}
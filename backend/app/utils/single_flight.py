@@ -0,0 +1,168 @@
+import copy
+import asyncio
+import threading
+from app.utils import metrics
+
+# --- Single-Flight Coalescing ---
+# Concurrent identical requests share one execution: the first caller for a
+# key (the leader) does the work, callers arriving while it runs (followers)
+# wait for its outcome and each get their own deep copy of the result, or a
+# CoalescedError chained to the leader's exception. If the leader stops
+# without settling (client gone, generator closed), its followers begin()
+# again and one of them takes over the work. Nothing is kept once the call
+# settles; caching finished results is left to llm_cache/result_cache.
+#
+# Threads (WSGI workers, batch items) and coroutines (app.asgi) share the
+# same in-flight calls, so a request on either path can follow the other.
+
+
+class CoalescedError(Exception):
+    """ A follower's copy of the leader's exception (its __cause__); same message. """
+
+
+class LeaderAbandoned(Exception):
+    """ The leader stopped without an outcome; the follower should begin() again. """
+
+
+_ABANDONED = object()
+
+
+class _Call:
+    def __init__(self, flight, key):
+        self._flight = flight
+        self._key = key
+        self._done = threading.Event()
+        self._futures = []  # (loop, future) of async followers
+        self._value = None
+        self._error = None
+
+    def _settle(self, value, error):
+        with self._flight._lock:
+            if self._done.is_set():
+                return
+            self._value, self._error = value, error
+            self._done.set()
+            self._flight._calls.pop(self._key, None)
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def resolve(self, value):
+        self._settle(value, None)
+
+    def fail(self, error):
+        self._settle(None, error)
+
+    def abandon(self):
+        """ Sends waiting followers back to begin() if the leader stopped without settling (no-op otherwise). """
+        self._settle(None, _ABANDONED)
+
+    def _outcome(self):
+        if self._error is _ABANDONED:
+            raise LeaderAbandoned()
+        if self._error is not None:
+            # One exception object must not be raised in several threads at once
+            raise CoalescedError(str(self._error)) from self._error
+        return copy.deepcopy(self._value)
+
+    def wait(self):
+        self._done.wait()
+        return self._outcome()
+
+    async def wait_async(self):
+        future = None
+        with self._flight._lock:
+            if not self._done.is_set():
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._futures.append((loop, future))
+        if future is not None:
+            await asyncio.shield(future)
+        return self._outcome()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        metrics.register_gauge(f"single_flight.{name}", lambda: {"in_flight": len(self._calls)})
+
+    def begin(self, key):
+        """
+        Returns (call, leading). A leader must settle the call with resolve()
+        or fail() (and abandon() in a finally); followers wait()/wait_async().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call(self, key)
+                metrics.incr(f"single_flight.{self.name}.leaders")
+                return call, True
+        metrics.incr(f"single_flight.{self.name}.followers")
+        return call, False
+
+    def lead_or_wait(self, key):
+        """
+        Returns (call, None) once the caller leads (settle the call as after
+        begin()), or (None, value) with a leader's result.
+        """
+        while True:
+            call, leading = self.begin(key)
+            if leading:
+                return call, None
+            try:
+                return None, call.wait()
+            except LeaderAbandoned:
+                metrics.incr(f"single_flight.{self.name}.retries")
+
+    async def lead_or_wait_async(self, key):
+        """ lead_or_wait() for coroutines. """
+        while True:
+            call, leading = self.begin(key)
+            if leading:
+                return call, None
+            try:
+                return None, await call.wait_async()
+            except LeaderAbandoned:
+                metrics.incr(f"single_flight.{self.name}.retries")
+
+    def do(self, key, fn):
+        """ fn() once for all concurrent callers with the same key. """
+        call, value = self.lead_or_wait(key)
+        if call is None:
+            return value
+        try:
+            value = fn()
+            call.resolve(value)
+            return value
+        except Exception as e:
+            call.fail(e)
+            raise
+        finally:
+            call.abandon()
+
+    async def do_async(self, key, coro_fn):
+        """ do() for coroutines: `await coro_fn()` once for all concurrent callers. """
+        call, value = await self.lead_or_wait_async(key)
+        if call is None:
+            return value
+        try:
+            value = await coro_fn()
+            call.resolve(value)
+            return value
+        except Exception as e:
+            call.fail(e)
+            raise
+        finally:
+            # Cancelled leader: a follower takes over instead of being cancelled too
+            call.abandon()
+
+
+llm_flight = SingleFlight("llm")
+sql_flight = SingleFlight("sql")
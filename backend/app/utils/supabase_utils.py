@@ -1,5 +1,5 @@
 import os
-from supabase import create_client, Client
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,19 +7,32 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# The client (and the supabase package) is created on first use, so importing
+# the app neither pays for it nor fails when the Supabase env vars are unset.
+_supabase = None
+_supabase_lock = threading.Lock()
+
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
 
 def ensure_user_in_supabase(user_id, email):
     try:
-        response = supabase.table("User").select("user_id").eq("user_id", user_id).execute()
-        if response.data:
-            return  # Already exists
-        print(f"Email found is {email}")
-        supabase.table("User").insert({
+        supabase = get_supabase()
+        # One round trip: insert the user, leaving an existing row untouched
+        supabase.table("User").upsert({
             "user_id": user_id,
             "email_id": email,
-           
-        }).execute()
+        }, on_conflict="user_id", ignore_duplicates=True, returning="minimal").execute()
     except Exception as e:
         print(f"[Supabase Error] {e}")
         raise
@@ -0,0 +1,14 @@
+import math
+
+# Rough average for English text and SQL identifiers with OpenAI tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """
+    Approximate number of LLM tokens in a string. Deliberately offline and
+    cheap: it is used for prompt budgeting on every request.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
@@ -0,0 +1,164 @@
+import time
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import bindparam, func
+from config import Config
+from app import db
+from app.models.apiModel import ApiKey
+from app.utils import metrics
+
+# --- API Key Usage Recorder ---
+# API-key requests are counted in memory and written to api_keys.usage_count
+# and last_used_at in one batched UPDATE every USAGE_FLUSH_INTERVAL seconds,
+# or sooner once USAGE_FLUSH_MAX_KEYS keys are pending, and once more at
+# shutdown. A failed flush keeps its counts for the next attempt.
+#
+# Per-key request rates over the last USAGE_RATE_WINDOW seconds are kept in
+# one-second buckets for quota checks and reporting (key_rate()).
+_pending = {}          # key_id -> [count, last_used_at]
+_rates = {}            # key_id -> deque of [epoch_second, count]
+_lock = threading.Lock()
+_flush_now = threading.Event()
+_flush_lock = threading.Lock()
+_app = None
+_worker = None
+
+_table = ApiKey.__table__
+_UPDATE = (
+    _table.update()
+    .where(_table.c.key_id == bindparam("b_key_id"))
+    .values(
+        usage_count=func.coalesce(_table.c.usage_count, 0) + bindparam("b_count"),
+        last_used_at=bindparam("b_last_used_at"),
+    )
+)
+
+
+def init_usage_recorder(app):
+    """ Remembers the app for flushes outside a request and flushes at exit. """
+    global _app
+    _app = app
+    atexit.register(flush)
+
+
+def _prune(buckets, now_second):
+    while buckets and buckets[0][0] <= now_second - Config.USAGE_RATE_WINDOW:
+        buckets.popleft()
+
+
+def record_usage(key_id):
+    """ Counts one request for a key; never touches the database. """
+    now = time.time()
+    second = int(now)
+    with _lock:
+        entry = _pending.get(key_id)
+        if entry:
+            entry[0] += 1
+            entry[1] = datetime.utcnow()
+        else:
+            _pending[key_id] = [1, datetime.utcnow()]
+
+        buckets = _rates.setdefault(key_id, deque())
+        if buckets and buckets[-1][0] == second:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([second, 1])
+        _prune(buckets, second)
+        pending_keys = len(_pending)
+
+    _ensure_worker()
+    if pending_keys >= Config.USAGE_FLUSH_MAX_KEYS:
+        _flush_now.set()
+
+
+def key_rate(key_id):
+    """ Requests per second for a key, averaged over USAGE_RATE_WINDOW seconds. """
+    with _lock:
+        buckets = _rates.get(key_id)
+        if not buckets:
+            return 0.0
+        _prune(buckets, int(time.time()))
+        return sum(count for _, count in buckets) / Config.USAGE_RATE_WINDOW
+
+
+def pending_usage(key_id):
+    """ Requests counted for a key but not yet written to the database. """
+    with _lock:
+        entry = _pending.get(key_id)
+        return entry[0] if entry else 0
+
+
+def flush():
+    """ Writes all pending counts in one batched UPDATE. Returns the keys written. """
+    with _flush_lock:
+        with _lock:
+            batch = dict(_pending)
+            _pending.clear()
+        if not batch:
+            return 0
+
+        params = [
+            {"b_key_id": key_id, "b_count": count, "b_last_used_at": last_used_at}
+            for key_id, (count, last_used_at) in batch.items()
+        ]
+        try:
+            if _app is not None:
+                with _app.app_context():
+                    _write(params)
+            else:
+                _write(params)
+        except Exception as e:
+            print(f"[Usage Recorder] Flush of {len(batch)} keys failed: {e}")
+            metrics.incr("usage_recorder.flush_errors")
+            _requeue(batch)
+            return 0
+
+    metrics.incr("usage_recorder.flushed_keys", len(batch))
+    return len(batch)
+
+
+def _write(params):
+    try:
+        db.session.execute(_UPDATE, params)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.remove()
+
+
+def _requeue(batch):
+    with _lock:
+        for key_id, (count, last_used_at) in batch.items():
+            entry = _pending.get(key_id)
+            if entry:
+                entry[0] += count
+            else:
+                _pending[key_id] = [count, last_used_at]
+
+
+def _run():
+    while True:
+        _flush_now.wait(Config.USAGE_FLUSH_INTERVAL)
+        _flush_now.clear()
+        flush()
+        with _lock:
+            # Forget rate windows of keys that have gone quiet
+            now_second = int(time.time())
+            for key_id in [k for k, b in _rates.items() if not b or b[-1][0] <= now_second - Config.USAGE_RATE_WINDOW]:
+                del _rates[key_id]
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None:
+        with _lock:
+            if _worker is None:
+                _worker = threading.Thread(target=_run, name="usage-recorder", daemon=True)
+                _worker.start()
+
+
+metrics.register_gauge("usage_recorder", lambda: {"pending_keys": len(_pending), "tracked_keys": len(_rates)})
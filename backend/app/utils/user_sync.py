@@ -0,0 +1,48 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from app.utils import metrics
+from app.utils.clerk_user_utils import get_clerk_user_email
+from app.utils.supabase_utils import ensure_user_in_supabase
+
+# --- Supabase User Sync ---
+# Every signed-in user must have a row in Supabase's "User" table. Instead of
+# checking on each page load, users synced within USER_PROFILE_TTL seconds are
+# remembered in a known-users set; anyone else is synced on a background
+# thread (at most one sync per user in flight), so requests never wait on
+# Clerk or Supabase.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="user-sync")
+_known_users = {}      # user_id -> synced_at
+_in_flight = set()
+_lock = threading.Lock()
+
+
+def ensure_user_known(user_id):
+    """ Schedules a Supabase sync for the user unless one is recent or running. """
+    now = time.time()
+    with _lock:
+        synced_at = _known_users.get(user_id)
+        if (synced_at and now - synced_at < Config.USER_PROFILE_TTL) or user_id in _in_flight:
+            return
+        _in_flight.add(user_id)
+    _executor.submit(_sync_user, user_id)
+
+
+def _sync_user(user_id):
+    try:
+        email = get_clerk_user_email(user_id)
+        ensure_user_in_supabase(user_id, email)
+        with _lock:
+            _known_users[user_id] = time.time()
+        metrics.incr("user_sync.synced")
+    except Exception as e:
+        # Not marked known, so the next request retries
+        print(f"[User Sync] Failed to sync user {user_id}: {e}")
+        metrics.incr("user_sync.errors")
+    finally:
+        with _lock:
+            _in_flight.discard(user_id)
+
+
+metrics.register_gauge("user_sync", lambda: {"known_users": len(_known_users), "in_flight": len(_in_flight)})
@@ -0,0 +1,250 @@
+import warnings
+import numpy as np
+import pandas as pd
+from config import Config
+from app.utils import metrics
+
+# --- Visualization Data Prep ---
+# Runs before figure construction so figure_json stays small no matter how
+# many rows the query returned. Above VIZ_MAX_POINTS rows:
+#
+#   line       LTTB (or min-max) downsampling, per color series
+#   scatter    2D binning; each occupied bin becomes one point sized by count
+#   histogram  counts are binned here and drawn as bars
+#   box/violin uniform random sample
+#
+# Bar and pie charts are aggregated per category and keep the top
+# VIZ_CATEGORY_MAX categories, folding the rest into "Other".
+#
+# prepare_visualization_data() returns the (possibly reduced) frame, the
+# chart settings to draw it with and a "sampling" dict for the response.
+OTHER_LABEL = "Other"
+_COUNT_COLUMN = "points"
+_PROBE_ROWS = 64
+
+
+def _datetime_ns(dates):
+    """ Datetimes as float ns since epoch, whatever the unit (pandas 3 parses to us). """
+    if getattr(dates.dt, "tz", None) is not None:
+        dates = dates.dt.tz_convert(None)
+    return dates.astype("datetime64[ns]").astype("int64").astype(float).to_numpy()
+
+
+def _numeric_axis(series):
+    """ Float values for an axis (datetimes as ns since epoch), or None. """
+    if pd.api.types.is_bool_dtype(series):
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float).to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return _datetime_ns(series)
+    # Probe a few values first; a failed full-column conversion is slow
+    head = series.head(_PROBE_ROWS)
+    if pd.to_numeric(head, errors="coerce").notna().all():
+        numbers = pd.to_numeric(series, errors="coerce")
+        if numbers.notna().all():
+            return numbers.astype(float).to_numpy()
+    try:
+        with warnings.catch_warnings():
+            # Non-date text makes pandas warn about per-element parsing
+            warnings.simplefilter("ignore", UserWarning)
+            if pd.to_datetime(head, errors="coerce").notna().all():
+                dates = pd.to_datetime(series, errors="coerce")
+                if dates.notna().all():
+                    return _datetime_ns(dates)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def lttb_indices(x, y, n_out):
+    """ Largest-Triangle-Three-Buckets: indices of n_out points that keep the shape of y(x). """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Buckets of the interior points; first and last points are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    # Each bucket looks ahead to the next bucket's average (the last one to the final point)
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - next_x[bucket]) * (by - y[a]) - (x[a] - bx) * (next_y[bucket] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """ Keeps the min and max of each of n_out / 2 equal-width buckets (plus both ends). """
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    buckets = np.arange(n) * max(1, n_out // 2) // n
+    series = pd.Series(y)
+    grouped = series.groupby(buckets)
+    picked = np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy(), [0, n - 1]])
+    return np.unique(picked)
+
+
+def _downsample_line(df, x_axis, y_axis, color):
+    groups = [df] if not color else [group for _, group in df.groupby(color, sort=False)]
+    per_series = max(3, Config.VIZ_MAX_POINTS // len(groups))
+    parts, method = [], Config.VIZ_LINE_METHOD
+
+    for group in groups:
+        x = _numeric_axis(group[x_axis])
+        y = pd.to_numeric(group[y_axis], errors="coerce").to_numpy(dtype=float)
+        if x is None or np.isnan(y).any():
+            # Without numeric axes fall back to an even stride through the rows
+            step = max(1, len(group) // per_series)
+            parts.append(group.iloc[::step])
+            method = "stride"
+            continue
+        order = np.argsort(x, kind="stable")
+        x, y = x[order], y[order]
+        if Config.VIZ_LINE_METHOD == "minmax":
+            keep = minmax_indices(y, per_series)
+        else:
+            keep = lttb_indices(x, y, per_series)
+        parts.append(group.iloc[order[keep]])
+
+    return pd.concat(parts), method
+
+
+def _bin_scatter(df, x_axis, y_axis, color):
+    x = _numeric_axis(df[x_axis])
+    y = _numeric_axis(df[y_axis])
+    if x is None or y is None:
+        return df.sample(n=Config.VIZ_MAX_POINTS, random_state=0), {}, "sample"
+
+    bins = Config.VIZ_SCATTER_BINS
+
+    def bin_index(values):
+        low, high = values.min(), values.max()
+        if high == low:
+            return np.zeros(len(values), dtype=int)
+        return np.minimum(((values - low) / (high - low) * bins).astype(int), bins - 1)
+
+    keys = ([color] if color else []) + ["_bin_x", "_bin_y"]
+    binned = (
+        df.assign(_bin_x=bin_index(x), _bin_y=bin_index(y), _x=x, _y=y)
+        .groupby(keys, sort=False)
+        .agg(_x=("_x", "mean"), _y=("_y", "mean"), **{_COUNT_COLUMN: ("_x", "size")})
+        .reset_index()
+    )
+    # Plot each bin at the mean of its points, in the original axis units
+    binned[x_axis] = _restore_axis(df[x_axis], binned["_x"])
+    binned[y_axis] = _restore_axis(df[y_axis], binned["_y"])
+    columns = [x_axis, y_axis, _COUNT_COLUMN] + ([color] if color else [])
+    return binned[columns], {"size": _COUNT_COLUMN}, "bin2d"
+
+
+def _restore_axis(original, values):
+    if pd.api.types.is_datetime64_any_dtype(original):
+        restored = pd.to_datetime(values.astype("int64"), unit="ns")
+        tz = getattr(original.dt, "tz", None)
+        return restored.dt.tz_localize("UTC").dt.tz_convert(tz) if tz is not None else restored
+    if pd.api.types.is_numeric_dtype(original):
+        return values
+    if pd.to_numeric(original, errors="coerce").notna().all():
+        return values
+    return pd.to_datetime(values.astype("int64"), unit="ns")
+
+
+def _bin_histogram(df, x_axis, color):
+    x = _numeric_axis(df[x_axis])
+    keys = [color] if color else []
+    if x is None:
+        counts = df.groupby([x_axis] + keys, sort=False).size().reset_index(name=_COUNT_COLUMN)
+        return counts, "value_counts"
+
+    edges = np.histogram_bin_edges(x, bins=Config.VIZ_HISTOGRAM_BINS)
+    bucket = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, len(edges) - 2)
+    centers = (edges[:-1] + edges[1:]) / 2
+    counts = (
+        df.assign(_bucket=bucket)
+        .groupby(["_bucket"] + keys)
+        .size()
+        .reset_index(name=_COUNT_COLUMN)
+    )
+    counts[x_axis] = _restore_axis(df[x_axis], pd.Series(centers[counts["_bucket"]]))
+    return counts[[x_axis, _COUNT_COLUMN] + keys], "histogram_bins"
+
+
+def _top_categories(df, category, value, color=None):
+    """ Sums value per category and folds all but the top VIZ_CATEGORY_MAX into "Other". """
+    df = df.assign(**{value: pd.to_numeric(df[value], errors="coerce")})
+    keys = [category] + ([color] if color else [])
+    totals = df.groupby(category, sort=False)[value].sum()
+    if len(totals) <= Config.VIZ_CATEGORY_MAX:
+        return df.groupby(keys, sort=False)[value].sum().reset_index(), False
+
+    top = set(totals.nlargest(Config.VIZ_CATEGORY_MAX).index)
+    labels = df[category].where(df[category].isin(top), OTHER_LABEL)
+    if not pd.api.types.is_object_dtype(labels):
+        labels = labels.astype(object)
+    folded = df.assign(**{category: labels})
+    return folded.groupby(keys, sort=False)[value].sum().reset_index(), True
+
+
+def prepare_visualization_data(df, viz_info):
+    """
+    Returns (df, viz_info, sampling). viz_info may gain overrides telling
+    create_visualization how to draw the reduced frame.
+    """
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame(df)
+    viz_type = viz_info.get("visualization", "none")
+    x_axis = viz_info.get("x_axis")
+    y_axis = viz_info.get("y_axis")
+    color = viz_info.get("color") or None
+    if color not in df.columns:
+        color = None
+
+    input_rows = len(df)
+    method, overrides = None, {}
+    large = input_rows > Config.VIZ_MAX_POINTS
+
+    try:
+        if viz_type in ("bar", "pie"):
+            category, value = (x_axis, y_axis) if viz_type == "bar" else (viz_info.get("names_axis"), viz_info.get("values_axis"))
+            if category in df.columns and value in df.columns:
+                reduced, folded = _top_categories(df, category, value, color if viz_type == "bar" else None)
+                if folded or large:
+                    df, method = reduced, "top_n" if folded else "aggregate"
+        elif large and viz_type == "line" and x_axis in df.columns and y_axis in df.columns:
+            df, method = _downsample_line(df, x_axis, y_axis, color)
+        elif large and viz_type == "scatter" and x_axis in df.columns and y_axis in df.columns:
+            df, overrides, method = _bin_scatter(df, x_axis, y_axis, color)
+        elif large and viz_type == "histogram" and x_axis in df.columns:
+            df, method = _bin_histogram(df, x_axis, color)
+            overrides = {"visualization": "bar", "y_axis": _COUNT_COLUMN, "bargap": 0}
+        elif large and viz_type in ("box", "violin"):
+            df, method = df.sample(n=Config.VIZ_MAX_POINTS, random_state=0), "sample"
+    except Exception as e:
+        # A failed reduction should not cost the user their chart
+        print(f"[Viz Prep] Skipped {viz_type} data prep: {e}")
+        method, overrides = None, {}
+
+    if not method:
+        return df, viz_info, {"applied": False}
+
+    sampling = {
+        "applied": True,
+        "method": method,
+        "input_rows": input_rows,
+        "output_rows": len(df),
+    }
+    metrics.incr(f"viz_prep.{method}")
+    print(f"[Viz Prep] {viz_type}: {method} {input_rows} -> {len(df)} rows")
+    return df, {**viz_info, **overrides}, sampling
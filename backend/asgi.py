@@ -0,0 +1,4 @@
+from app.asgi import create_asgi_app
+
+# ASGI entry point, e.g. `uvicorn asgi:app --workers 4`
+app = create_asgi_app()
@@ -0,0 +1,61 @@
+"""
+Concurrency of non-/api/query routes under the ASGI entry point.
+
+Wraps a throwaway Flask app whose route sleeps for --delay seconds in
+AsyncQueryApp and fires --requests of them at once through httpx's ASGI
+transport. With the WSGI routes on a thread pool the batch takes about one
+delay; run one at a time it takes requests x delay. Exits non-zero when the
+requests were not served concurrently.
+
+Run from backend/:
+    python -m benchmarks.bench_asgi_wsgi_concurrency
+    python -m benchmarks.bench_asgi_wsgi_concurrency --requests 32 --delay 0.2
+"""
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import httpx
+from flask import Flask
+from app.asgi import AsyncQueryApp
+
+
+def build_app(delay, threads):
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/sleep")
+    def sleep():
+        threads.add(threading.current_thread().name)
+        time.sleep(delay)
+        return {"ok": True}
+
+    return AsyncQueryApp(flask_app)
+
+
+async def run(asgi_app, requests):
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[client.get("/sleep") for _ in range(requests)])
+        elapsed = time.perf_counter() - start
+    return elapsed, {r.status_code for r in responses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    threads = set()
+    elapsed, statuses = asyncio.run(run(build_app(args.delay, threads), args.requests))
+    serial = args.requests * args.delay
+    print(f"{args.requests} requests x {args.delay:.2f}s: {elapsed:.2f}s "
+          f"(serial would be {serial:.2f}s), {len(threads)} threads, statuses {sorted(statuses)}")
+    if statuses != {200} or elapsed > serial / 2:
+        sys.exit("WSGI routes were not served concurrently")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Peak RSS of query execution for large results (default 10^6 rows).
+
+Each mode runs in a fresh subprocess against a SQLite fixture:
+  pandas   the previous path: read_sql_query -> to_json -> json.loads
+  execute  execute_query() with the configured QUERY_MAX_ROWS / QUERY_MAX_BYTES caps
+  ndjson   stream_query() with caps lifted, rows written out as NDJSON chunks
+
+Run from backend/:
+    python -m benchmarks.bench_execute_query
+    python -m benchmarks.bench_execute_query --rows 200000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import sqlite3
+import tempfile
+import subprocess
+
+
+def build_fixture(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, name TEXT, amount REAL, created_at TEXT)")
+    batch = 50000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO events VALUES (?, ?, ?, ?)",
+            ((i, f"event-{i % 1000}", i * 0.25, f"2024-01-{i % 28 + 1:02d}T12:00:00") for i in range(start, min(rows, start + batch))),
+        )
+    conn.commit()
+    conn.close()
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_mode(mode, path):
+    from sqlalchemy import create_engine, text
+    from app.utils.nl2sql_utils import execute_query, stream_query, iter_ndjson
+
+    engine = create_engine(f"sqlite:///{path}")
+    sql = "SELECT * FROM events"
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+
+    if mode == "pandas":
+        import pandas as pd
+        with engine.connect() as conn:
+            df = pd.read_sql_query(text(sql), conn)
+        rows = json.loads(df.to_json(orient='records', default_handler=str))
+        count = len(rows)
+    elif mode == "execute":
+        rows, err = execute_query(sql, engine)
+        if err:
+            raise RuntimeError(err)
+        count = len(rows)
+    else:
+        stream = stream_query(sql, engine, max_rows=sys.maxsize, max_bytes=sys.maxsize)
+        with open(os.devnull, "w") as out:
+            for lines in iter_ndjson(stream):
+                out.write(lines)
+        count = stream.row_count
+
+    print(json.dumps({
+        "mode": mode,
+        "rows": count,
+        "seconds": round(time.perf_counter() - start, 2),
+        "baseline_mb": round(baseline, 1),
+        "peak_mb": round(peak_rss_mb(), 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.path)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.db")
+        build_fixture(path, args.rows)
+        print(f"{'mode':<8} {'rows returned':>14} {'seconds':>8} {'baseline MB':>12} {'peak MB':>8}")
+        for mode in ("pandas", "execute", "ndjson"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_execute_query", "--mode", mode, "--path", path],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"{result['mode']:<8} {result['rows']:>14} {result['seconds']:>8} "
+                  f"{result['baseline_mb']:>12} {result['peak_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Payload size and encode/decode time of the result encodings (records,
+columnar, arrow) for a synthetic mostly-numeric result.
+
+Run from backend/:
+    python -m benchmarks.bench_result_formats
+    python -m benchmarks.bench_result_formats --rows 10000 --repeat 10
+"""
+import json
+import time
+import argparse
+
+from app.utils.result_format import to_columnar, to_arrow_ipc, arrow_available
+
+
+def build_rows(rows):
+    return [
+        {
+            "id": i,
+            "customer_id": i % 5000,
+            "quantity": i % 17,
+            "unit_price": round(i * 0.37 % 500, 2),
+            "discount": (i % 10) / 100,
+            "placed_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        }
+        for i in range(rows)
+    ]
+
+
+def encode_records(rows):
+    return json.dumps(rows).encode()
+
+
+def encode_columnar(rows):
+    return json.dumps(to_columnar(rows)).encode()
+
+
+def decode_json(payload):
+    return json.loads(payload)
+
+
+def decode_arrow(payload):
+    import pyarrow as pa
+    return pa.ipc.open_stream(payload).read_all()
+
+
+def timed(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = build_rows(args.rows)
+    formats = [("records", encode_records, decode_json), ("columnar", encode_columnar, decode_json)]
+    if arrow_available():
+        formats.append(("arrow", to_arrow_ipc, decode_arrow))
+    else:
+        print("pyarrow is not installed; skipping arrow")
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"{'format':<9} {'bytes':>12} {'vs records':>11} {'encode ms':>10} {'decode ms':>10}")
+    baseline = None
+    for name, encode, decode in formats:
+        payload, encode_ms = timed(encode, rows, args.repeat)
+        _, decode_ms = timed(decode, payload, args.repeat)
+        baseline = baseline or len(payload)
+        print(f"{name:<9} {len(payload):>12} {len(payload) / baseline:>10.2f}x {encode_ms:>10.1f} {decode_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Introspection time versus table count for get_db_schema.
+
+Compares the previous per-table reflection loop with the bulk / threaded path
+and checks that both produce identical schema JSON. SQLite fixtures have no
+network round trips, so they mostly verify parity; use --url against a remote
+PostgreSQL or MySQL database to see the latency savings.
+
+Run from backend/:
+    python -m benchmarks.bench_schema_introspection
+    python -m benchmarks.bench_schema_introspection --url postgresql+psycopg2://...
+"""
+import os
+import time
+import json
+import argparse
+import tempfile
+from sqlalchemy import create_engine, inspect, text
+from app.utils.nl2sql_utils import get_db_schema
+
+
+def legacy_get_db_schema(engine):
+    """ The original implementation: two catalog round trips per table. """
+    schema = {}
+    inspector = inspect(engine)
+    for table_name in inspector.get_table_names():
+        columns = []
+        for col in inspector.get_columns(table_name):
+            columns.append({"name": col["name"], "type": str(col["type"]), "description": ""})
+        foreign_keys = []
+        for fk in inspector.get_foreign_keys(table_name):
+            foreign_keys.append({
+                "constrained_columns": fk['constrained_columns'],
+                "referred_table": fk['referred_table'],
+                "referred_columns": fk['referred_columns']
+            })
+        schema[table_name] = {"columns": columns, "foreign_keys": foreign_keys, "description": ""}
+    return schema
+
+
+def build_sqlite_fixture(path, table_count):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for i in range(table_count):
+            parent = f", parent_id INTEGER REFERENCES table_{i - 1}(id)" if i else ""
+            conn.execute(text(
+                f"CREATE TABLE table_{i} (id INTEGER PRIMARY KEY, name VARCHAR(80), "
+                f"amount NUMERIC(12, 2), created_at TIMESTAMP, is_active BOOLEAN{parent})"
+            ))
+    return engine
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(engine, label):
+    legacy, legacy_time = timed(legacy_get_db_schema, engine)
+    sequential, sequential_time = timed(get_db_schema, engine, max_workers=1)
+    threaded, threaded_time = timed(get_db_schema, engine, max_workers=8)
+    identical = json.dumps(legacy) == json.dumps(sequential) == json.dumps(threaded)
+    print(f"{label:>12} {len(legacy):>8} {legacy_time:>10.3f}s {sequential_time:>10.3f}s "
+          f"{threaded_time:>10.3f}s {'yes' if identical else 'NO'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark an existing database instead of SQLite fixtures")
+    parser.add_argument("--sizes", default="10,100,500,1500", help="Fixture table counts")
+    args = parser.parse_args()
+
+    print(f"{'database':>12} {'tables':>8} {'legacy':>11} {'bulk/seq':>11} {'threaded':>11} identical")
+    if args.url:
+        run(create_engine(args.url), "url")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            engine = build_sqlite_fixture(os.path.join(tmp, f"fixture_{size}.db"), size)
+            run(engine, "sqlite")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
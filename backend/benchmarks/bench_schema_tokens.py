@@ -0,0 +1,50 @@
+"""
+Prompt token cost of the schema: pretty-printed JSON versus the compact rendering.
+
+Run from backend/:
+    python -m benchmarks.bench_schema_tokens
+    python -m benchmarks.bench_schema_tokens path/to/schema.json
+
+Counts use tiktoken when it is installed (and can load its encoding),
+otherwise the ~4 characters per token estimate used by the app.
+"""
+import os
+import sys
+import json
+from app.utils.schema_render import schema_prompt_text, render_schema
+from app.utils.token_utils import estimate_tokens
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "ecommerce_schema.json")
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return "tiktoken o200k_base", lambda text: len(encoding.encode(text))
+    except Exception:
+        return "estimate (chars / 4)", estimate_tokens
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else FIXTURE
+    with open(path) as f:
+        schema = json.load(f)
+
+    label, count = token_counter()
+    old_text = json.dumps(schema, indent=2)
+    new_text = schema_prompt_text(schema, json.dumps(render_schema(schema)))
+    old_tokens, new_tokens = count(old_text), count(new_text)
+
+    print(f"schema:    {os.path.basename(path)} ({len(schema)} tables)")
+    print(f"counter:   {label}")
+    print(f"{'rendering':<12} {'chars':>8} {'tokens':>8}")
+    print(f"{'json':<12} {len(old_text):>8} {old_tokens:>8}")
+    print(f"{'compact':<12} {len(new_text):>8} {new_tokens:>8}")
+    print(f"saved:     {old_tokens - new_tokens} tokens ({100 * (1 - new_tokens / old_tokens):.0f}%)")
+    print()
+    print(new_text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Cold-start time of `from app import create_app; create_app()`.
+
+Each run is a fresh interpreter. Reports the import time, the create_app()
+time and which heavy modules ended up loaded. Modes:
+  lazy      default settings (heavy modules load on first use)
+  prewarm   PREWARM=blocking, i.e. the cost of loading everything up front
+
+--before REV measures another revision (e.g. the commit before lazy loading)
+from a temporary git worktree, for a before/after comparison. The app reads
+its settings from the environment/.env as usual.
+
+Run from backend/:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --before HEAD~1 --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+HEAVY_MODULES = ("pandas", "numpy", "plotly", "openai", "supabase", "pyarrow")
+
+_PROBE = f"""
+import sys, json, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - start,
+    "create_app_s": done - imported,
+    "total_s": done - start,
+    "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(backend_dir, runs, extra_env=None):
+    env = {**os.environ, **(extra_env or {})}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE], cwd=backend_dir, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        samples.append(json.loads(output))
+    return {
+        "import_s": statistics.median(s["import_s"] for s in samples),
+        "create_app_s": statistics.median(s["create_app_s"] for s in samples),
+        "total_s": statistics.median(s["total_s"] for s in samples),
+        "loaded": samples[-1]["loaded"],
+    }
+
+
+def report(label, result):
+    print(f"{label:<26} {result['import_s']:>9.3f} {result['create_app_s']:>12.3f} "
+          f"{result['total_s']:>8.3f}  {', '.join(result['loaded']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--before", help="git revision to compare against")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"median of {args.runs} cold starts")
+    print(f"{'tree':<26} {'import s':>9} {'create_app s':>12} {'total s':>8}  heavy modules loaded")
+
+    if args.before:
+        repo_root = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel"], cwd=backend_dir,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        prefix = os.path.relpath(backend_dir, repo_root)
+        with tempfile.TemporaryDirectory() as tmp:
+            worktree = os.path.join(tmp, "before")
+            subprocess.run(["git", "worktree", "add", "--detach", worktree, args.before],
+                           cwd=repo_root, capture_output=True, check=True)
+            try:
+                report(f"before ({args.before})", measure(os.path.join(worktree, prefix), args.runs))
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", worktree],
+                               cwd=repo_root, capture_output=True)
+
+    report("after (lazy)", measure(backend_dir, args.runs))
+    report("after (PREWARM=blocking)", measure(backend_dir, args.runs, {"PREWARM": "blocking"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -12,4 +13,148 @@ class Config:
     # Construct the SQLAlchemy connection string
     DATABASE_URL = f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}?sslmode=require"
 
+    # --- User database engine registry ---
+    ENGINE_POOL_SIZE = int(os.getenv("ENGINE_POOL_SIZE", "2"))
+    ENGINE_MAX_OVERFLOW = int(os.getenv("ENGINE_MAX_OVERFLOW", "3"))
+    ENGINE_POOL_RECYCLE = int(os.getenv("ENGINE_POOL_RECYCLE", "1800"))
+    ENGINE_REGISTRY_MAX = int(os.getenv("ENGINE_REGISTRY_MAX", "64"))
+    ENGINE_IDLE_TIMEOUT = int(os.getenv("ENGINE_IDLE_TIMEOUT", "900"))
+    # Per-tenant pool sizing, e.g. {"<database_id>": {"pool_size": 5, "max_overflow": 10}}
+    ENGINE_POOL_OVERRIDES = json.loads(os.getenv("ENGINE_POOL_OVERRIDES", "{}"))
 
+    # --- NL -> SQL response cache ("memory", "sqlite" or "none") ---
+    LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "instance/llm_cache.sqlite3")
+
+    # --- Query result cache ("memory", "sqlite" or "none") ---
+    RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+    RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "300"))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+    RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "instance/result_cache.sqlite3")
+    # Per-database TTL in seconds (0 disables caching), e.g. {"<database_id>": 3600}
+    RESULT_CACHE_TTL_OVERRIDES = json.loads(os.getenv("RESULT_CACHE_TTL_OVERRIDES", "{}"))
+
+    # --- Schema introspection ---
+    # Threads used for per-table reflection on dialects without bulk reflection
+    SCHEMA_INTROSPECTION_WORKERS = int(os.getenv("SCHEMA_INTROSPECTION_WORKERS", "4"))
+    # Background threads running add/update introspection jobs
+    SCHEMA_JOB_WORKERS = int(os.getenv("SCHEMA_JOB_WORKERS", "2"))
+    # Seconds after which an "Introspecting" row counts as abandoned by a dead
+    # worker; keep it above the slowest expected introspection
+    SCHEMA_JOB_STALE_AFTER = int(os.getenv("SCHEMA_JOB_STALE_AFTER", "900"))
+
+    # --- Prompt schema retrieval ---
+    # Number of best-matching tables sent to the LLM (plus their FK neighbours)
+    SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "8"))
+    SCHEMA_TOKEN_BUDGET = int(os.getenv("SCHEMA_TOKEN_BUDGET", "6000"))
+
+    # --- Conversation history sent to the LLM ---
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+
+    # --- Query execution limits ---
+    QUERY_CHUNK_SIZE = int(os.getenv("QUERY_CHUNK_SIZE", "1000"))
+    QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100000"))
+    QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", str(32 * 1024 * 1024)))
+
+    # --- Paged results ---
+    QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+    QUERY_MAX_PAGE_SIZE = int(os.getenv("QUERY_MAX_PAGE_SIZE", "5000"))
+    RESULT_SPILL_DIR = os.getenv("RESULT_SPILL_DIR", "instance/results")
+    RESULT_SPILL_MAX_BYTES = int(os.getenv("RESULT_SPILL_MAX_BYTES", str(512 * 1024 * 1024)))
+    RESULT_SPILL_TTL = int(os.getenv("RESULT_SPILL_TTL", "86400"))
+
+    # --- Visualization data prep ---
+    VIZ_MAX_POINTS = int(os.getenv("VIZ_MAX_POINTS", "5000"))
+    VIZ_LINE_METHOD = os.getenv("VIZ_LINE_METHOD", "lttb")  # "lttb" or "minmax"
+    VIZ_SCATTER_BINS = int(os.getenv("VIZ_SCATTER_BINS", "100"))
+    VIZ_HISTOGRAM_BINS = int(os.getenv("VIZ_HISTOGRAM_BINS", "50"))
+    VIZ_CATEGORY_MAX = int(os.getenv("VIZ_CATEGORY_MAX", "20"))
+
+    # --- Deferred figure cache ("memory", "sqlite" or "none") ---
+    FIGURE_CACHE_BACKEND = os.getenv("FIGURE_CACHE_BACKEND", "memory")
+    FIGURE_CACHE_TTL = int(os.getenv("FIGURE_CACHE_TTL", "86400"))
+    FIGURE_CACHE_MAX_BYTES = int(os.getenv("FIGURE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    FIGURE_CACHE_PATH = os.getenv("FIGURE_CACHE_PATH", "instance/figure_cache.sqlite3")
+
+    # --- Startup ---
+    # Load pandas/plotly/openai and external clients at startup instead of on
+    # first use: "off", "background" or "blocking"
+    PREWARM = os.getenv("PREWARM", "off")
+
+    # --- API key verification cache ---
+    API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", "60"))
+    API_KEY_NEGATIVE_TTL = int(os.getenv("API_KEY_NEGATIVE_TTL", "10"))
+    API_KEY_CACHE_MAX = int(os.getenv("API_KEY_CACHE_MAX", "10000"))
+
+    # --- API key usage recording ---
+    USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))
+    USAGE_FLUSH_MAX_KEYS = int(os.getenv("USAGE_FLUSH_MAX_KEYS", "500"))
+    USAGE_RATE_WINDOW = int(os.getenv("USAGE_RATE_WINDOW", "60"))
+
+    # --- Clerk token verification ---
+    CLERK_JWKS_TTL = int(os.getenv("CLERK_JWKS_TTL", "300"))
+    # Keys older than this are refetched before serving (no stale fallback)
+    CLERK_JWKS_MAX_STALE = int(os.getenv("CLERK_JWKS_MAX_STALE", "3600"))
+    # Minimum seconds between forced refetches for unknown kids
+    CLERK_JWKS_MIN_REFRESH = int(os.getenv("CLERK_JWKS_MIN_REFRESH", "30"))
+    CLERK_TOKEN_CACHE_MAX = int(os.getenv("CLERK_TOKEN_CACHE_MAX", "10000"))
+
+    # --- Clerk user profiles / Supabase user sync ---
+    USER_PROFILE_TTL = int(os.getenv("USER_PROFILE_TTL", "3600"))
+    USER_PROFILE_ERROR_TTL = int(os.getenv("USER_PROFILE_ERROR_TTL", "60"))
+    CLERK_API_CONNECT_TIMEOUT = float(os.getenv("CLERK_API_CONNECT_TIMEOUT", "2"))
+    CLERK_API_READ_TIMEOUT = float(os.getenv("CLERK_API_READ_TIMEOUT", "5"))
+    CLERK_API_POOL_SIZE = int(os.getenv("CLERK_API_POOL_SIZE", "10"))
+
+    # --- LLM client ---
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+    LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+    # Per-attempt timeout and overall deadline for one LLM call, in seconds
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+    LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+    # --- Rate limits (token buckets per API key / Clerk user, see rate_limits) ---
+    # "sqlite" shares buckets across worker processes, "memory" or "none"
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+    RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "instance/rate_limits.sqlite3")
+    RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "120"))
+    RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "60"))
+    # LLM prompt + completion tokens per identity
+    LLM_TOKENS_PER_HOUR = float(os.getenv("LLM_TOKENS_PER_HOUR", "500000"))
+    LLM_TOKENS_BURST = float(os.getenv("LLM_TOKENS_BURST", "100000"))
+    # Storage for flask-limiter's per-route @limiter.limit decorators
+    RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+
+    # --- Query admission control (per process, see admission) ---
+    QUERY_MAX_IN_FLIGHT = int(os.getenv("QUERY_MAX_IN_FLIGHT", "64"))
+    QUERY_MAX_IN_FLIGHT_PER_TENANT = int(os.getenv("QUERY_MAX_IN_FLIGHT_PER_TENANT", "8"))
+    QUERY_QUEUE_MAX = int(os.getenv("QUERY_QUEUE_MAX", "128"))
+    QUERY_QUEUE_MAX_PER_TENANT = int(os.getenv("QUERY_QUEUE_MAX_PER_TENANT", "16"))
+    # Seconds a query may wait for a slot before it is turned away
+    QUERY_QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", "10"))
+
+    # --- Batch queries (/api/query/batch) ---
+    QUERY_BATCH_MAX_ITEMS = int(os.getenv("QUERY_BATCH_MAX_ITEMS", "50"))
+    # Items of one batch running at once (a request may ask for fewer)
+    QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "4"))
+    # Threads shared by all batches in the process
+    QUERY_BATCH_WORKERS = int(os.getenv("QUERY_BATCH_WORKERS", "16"))
+
+    # --- Ops metrics (/api/metrics) ---
+    # Shared secret sent as X-Metrics-Token; unset disables the endpoint
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    # --- ASGI entry point (asgi.py) ---
+    # Threads for the blocking parts of async /api/query (auth, caches, SQL,
+    # saving messages) and for the WSGI routes served through the adapter
+    ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", "32"))
+    ASYNC_WSGI_WORKERS = int(os.getenv("ASYNC_WSGI_WORKERS", "32"))
+    # Concurrent pandas/Plotly figure renders per process
+    FIGURE_RENDER_CONCURRENCY = int(os.getenv("FIGURE_RENDER_CONCURRENCY", str(os.cpu_count() or 2)))
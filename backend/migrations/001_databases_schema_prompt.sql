@@ -0,0 +1,3 @@
+-- Compact per-table schema rendering used in LLM prompts (see DatabaseConnection.set_schema).
+-- Rows without it are rendered on the fly until their schema is next saved.
+ALTER TABLE "Databases" ADD COLUMN IF NOT EXISTS database_schema_prompt TEXT;
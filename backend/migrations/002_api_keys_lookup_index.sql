@@ -0,0 +1,7 @@
+-- Covering index for API key verification (see app/utils/api_key_cache.py).
+-- The lookup filters active keys by key_hash and reads only these columns,
+-- so Postgres can answer it with an index-only scan.
+CREATE INDEX IF NOT EXISTS api_keys_active_key_hash_idx
+    ON api_keys (key_hash)
+    INCLUDE (key_id, user_id, key_name, expires_at)
+    WHERE is_active;
@@ -0,0 +1,4 @@
+-- When the database last went "Introspecting" (see app/utils/schema_jobs.py).
+-- Rows stuck in that status for longer than SCHEMA_JOB_STALE_AFTER are
+-- treated as left behind by a dead worker and reset to "Failed".
+ALTER TABLE "Databases" ADD COLUMN IF NOT EXISTS introspection_started_at TIMESTAMP;
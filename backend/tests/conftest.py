@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Settings read at import time; tests never reach Supabase, Clerk or Postgres
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.test")
+os.environ.setdefault("CLERK_ISSUER", "https://clerk.test")
+os.environ.setdefault("CLERK_JWKS_URL", "https://clerk.test/.well-known/jwks.json")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from config import Config
+    from app import create_app
+
+    Config.DATABASE_URL = f"sqlite:///{tempfile.mkdtemp()}/app.db"
+    app = create_app()
+    app.testing = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
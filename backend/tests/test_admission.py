@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.utils.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(max_in_flight=1, max_per_tenant=10, queue_max=100, queue_max_per_tenant=100, queue_timeout=5):
+    return AdmissionController(max_in_flight, max_per_tenant, queue_max, queue_max_per_tenant, queue_timeout)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _queue(controller, tenant, name, order):
+    """ Queues one query for tenant in a thread; it records its name once admitted and finishes right away. """
+    queued = controller.queued
+
+    def run():
+        ticket = controller.acquire(tenant)
+        order.append(name)
+        controller.release(ticket)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for(lambda: controller.queued == queued + 1)
+    return thread
+
+
+def test_freed_slots_go_round_robin_across_tenants():
+    controller = _controller(max_in_flight=1)
+    holder = controller.acquire("x")
+    order = []
+    threads = [
+        _queue(controller, tenant, name, order)
+        for tenant, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1"), ("b", "b2")]
+    ]
+
+    controller.release(holder)
+    for thread in threads:
+        thread.join(5)
+    # FIFO within a tenant; a tenant with a backlog goes to the back after each query
+    assert order == ["a1", "b1", "c1", "a2", "b2", "a3"]
+    assert controller.stats()["in_flight"] == 0 and controller.stats()["queued"] == 0
+
+
+def test_per_tenant_in_flight_cap():
+    controller = _controller(max_in_flight=10, max_per_tenant=2)
+    tickets = [controller.acquire("a"), controller.acquire("a")]
+    order = []
+    thread = _queue(controller, "a", "a3", order)
+
+    # Other tenants are not held back by a's queue
+    other = controller.acquire("b")
+    assert controller.stats() ["in_flight"] == 3 and order == []
+
+    controller.release(tickets.pop())
+    thread.join(5)
+    assert order == ["a3"]
+    for ticket in tickets + [other]:
+        controller.release(ticket)
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_queue_caps_reject_right_away():
+    controller = _controller(max_in_flight=1, queue_max=2, queue_max_per_tenant=1)
+    holder = controller.acquire("x")
+    order = []
+    threads = [_queue(controller, "a", "a1", order)]
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("a")
+    assert excinfo.value.reason == "queue full" and excinfo.value.retry_after >= 1
+
+    threads.append(_queue(controller, "b", "b1", order))
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("c")
+    assert excinfo.value.reason == "queue full"
+    assert time.monotonic() - started < 1
+
+    controller.release(holder)
+    for thread in threads:
+        thread.join(5)
+    assert sorted(order) == ["a1", "b1"]
+
+
+def test_queue_timeout():
+    controller = _controller(max_in_flight=1, queue_timeout=0.1)
+    holder = controller.acquire("x")
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire("a")
+    assert excinfo.value.reason == "queue timeout"
+    assert controller.stats() == {**controller.stats(), "in_flight": 1, "queued": 0, "tenants_queued": 0}
+    controller.release(holder)
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_async_waiters_share_slots_and_cancellation_frees_them():
+    controller = _controller(max_in_flight=1)
+
+    async def main():
+        holder = await controller.acquire_async("x")
+        waiter = asyncio.create_task(controller.acquire_async("a"))
+        cancelled = asyncio.create_task(controller.acquire_async("b"))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["queued"] == 2
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert controller.stats()["queued"] == 1
+
+        controller.release(holder)
+        controller.release(await asyncio.wait_for(waiter, 5))
+
+    asyncio.run(main())
+    assert controller.stats()["in_flight"] == 0 and controller.stats()["queued"] == 0
+
+
+# --- /api/query/stream releases its slot however the response ends ---
+
+@pytest.fixture
+def stream_route(monkeypatch):
+    """ /api/query/stream with a stub pipeline; returns the list of events it got to yield. """
+    from app.routes import prompt_response
+
+    produced = []
+
+    def pipeline(ctx):
+        for i in range(50):
+            produced.append(i)
+            yield "rows", {"rows": [{"i": i}]}
+            time.sleep(0.01)
+        yield "done", {"message_id": "m", "figure_url": None}
+
+    monkeypatch.setattr(prompt_response, "_prepare_query", lambda: ({"identity": "user:stream"}, None))
+    monkeypatch.setattr(prompt_response, "run_query_pipeline", pipeline)
+    return produced
+
+
+def _in_flight():
+    from app.utils.admission import query_admission
+    return query_admission.stats()["in_flight"]
+
+
+def test_stream_slot_released_when_closed_before_first_chunk(app, stream_route):
+    from werkzeug.test import EnvironBuilder
+
+    # Called as a WSGI server would, closing the body without reading any of it
+    environ = EnvironBuilder(path="/api/query/stream", method="POST", json={}).get_environ()
+    body = app(environ, lambda status, headers, exc_info=None: None)
+    assert _in_flight() == 1
+    body.close()
+    assert _in_flight() == 0
+    assert stream_route == []
+
+
+def test_stream_slot_released_when_client_disconnects_mid_stream(client, stream_route):
+    response = client.post("/api/query/stream", json={}, buffered=False)
+    chunks = iter(response.response)
+    assert b"event: rows" in next(chunks)
+    assert _in_flight() == 1
+    response.close()
+    assert _in_flight() == 0
+    assert len(stream_route) < 50
+
+
+def test_stream_slot_released_when_asgi_client_disconnects_mid_stream(app, stream_route):
+    from app.asgi import AsyncQueryApp
+
+    asgi = AsyncQueryApp(app)
+    sent = []
+
+    async def receive():
+        if not sent:
+            return {"type": "http.request", "body": b"{}", "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            # The connection is gone once the first event went out
+            raise OSError("client disconnected")
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/api/query/stream", "raw_path": b"/api/query/stream", "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json")], "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+
+    async def main():
+        with pytest.raises(OSError):
+            await asgi(scope, receive, send)
+
+    asyncio.run(main())
+    assert _in_flight() == 0
+    assert len(stream_route) < 50
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from flask import Flask, Response
+from config import Config
+from app.asgi import AsyncQueryApp
+
+
+def _scope(path, method="GET", headers=(), query_string=b""):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query_string, "root_path": "",
+        "headers": list(headers), "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+
+
+async def _call(asgi, scope, body=b""):
+    """ One request through the ASGI app: (status, headers, [body chunks]). """
+    sent = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi(scope, receive, send)
+    start, chunks = sent[0], sent[1:]
+    assert start["type"] == "http.response.start"
+    assert all(m["type"] == "http.response.body" for m in chunks)
+    assert not chunks[-1].get("more_body")
+    return start["status"], dict(start["headers"]), [m.get("body", b"") for m in chunks]
+
+
+def test_non_query_routes_go_through_flask(app, monkeypatch):
+    monkeypatch.setattr(Config, "METRICS_TOKEN", "ops-secret")
+    asgi = AsyncQueryApp(app)
+
+    status, headers, chunks = asyncio.run(_call(asgi, _scope("/api/metrics", headers=[(b"x-metrics-token", b"ops-secret")])))
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    assert b'"counters"' in b"".join(chunks)
+
+    status, _, _ = asyncio.run(_call(asgi, _scope("/api/metrics", headers=[(b"x-metrics-token", b"wrong")])))
+    assert status == 401
+    status, _, _ = asyncio.run(_call(asgi, _scope("/api/no-such-route")))
+    assert status == 404
+
+
+def test_streamed_body_is_sent_chunk_by_chunk_and_closed():
+    flask_app = Flask(__name__)
+    closed = []
+
+    @flask_app.route("/echo", methods=["POST"])
+    def echo():
+        from flask import request
+        response = Response((part.encode() for part in request.get_data(as_text=True).split(",")), mimetype="text/plain")
+        response.call_on_close(lambda: closed.append(True))
+        return response
+
+    asgi = AsyncQueryApp(flask_app)
+    status, headers, chunks = asyncio.run(_call(asgi, _scope("/echo", method="POST"), body=b"a,b,c"))
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/plain")
+    assert [chunk for chunk in chunks if chunk] == [b"a", b"b", b"c"]
+    assert closed == [True]
+
+
+def test_wsgi_routes_run_concurrently_on_the_pool(monkeypatch):
+    monkeypatch.setattr(Config, "ASYNC_WSGI_WORKERS", 8)
+    flask_app = Flask(__name__)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    @flask_app.route("/sleep")
+    def sleep():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+        return "ok"
+
+    asgi = AsyncQueryApp(flask_app)
+
+    async def main():
+        return await asyncio.gather(*(_call(asgi, _scope("/sleep")) for _ in range(8)))
+
+    started = time.monotonic()
+    results = asyncio.run(main())
+    assert [status for status, _, _ in results] == [200] * 8
+    assert peak[0] == 8
+    assert time.monotonic() - started < 1
+
+
+def test_lifespan_startup_and_shutdown(app):
+    asgi = AsyncQueryApp(app)
+    messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(asgi({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
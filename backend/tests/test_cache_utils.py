@@ -0,0 +1,47 @@
+import pytest
+from app.utils.cache_utils import MemoryCache, SQLiteCache
+
+# 10 characters, 29 bytes in UTF-8
+WIDE = "数据库" * 3 + "é"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(max_bytes):
+        if request.param == "memory":
+            return MemoryCache("test_cache", max_bytes)
+        return SQLiteCache("test_cache", str(tmp_path / "cache.db"), max_bytes)
+    return make
+
+
+def test_budget_counts_utf8_bytes_not_characters(make_cache):
+    assert len(WIDE) == 10 and len(WIDE.encode()) == 29
+
+    cache = make_cache(max_bytes=60)
+    cache.set("a", WIDE, ttl=60)
+    assert cache.stats()["bytes"] == 29
+    cache.set("b", WIDE, ttl=60)
+    # 58 bytes fit; a third entry goes over and evicts the oldest
+    cache.set("c", WIDE, ttl=60)
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (2, 58)
+    assert cache.get("a") is None
+    assert cache.get("c") == WIDE
+
+
+def test_value_over_budget_is_not_stored(make_cache):
+    cache = make_cache(max_bytes=20)
+    cache.set("a", WIDE, ttl=60)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_memory_budget_is_released_on_replace_and_delete():
+    cache = MemoryCache("test_cache", max_bytes=100)
+    cache.set("a", WIDE, ttl=60)
+    cache.set("a", "ascii", ttl=60)
+    assert cache.stats()["bytes"] == 5
+    cache.set("b", WIDE, ttl=60)
+    cache.delete("b")
+    cache.delete_prefix("a")
+    assert cache.stats() == {"backend": "memory", "entries": 0, "bytes": 0, "max_bytes": 100}
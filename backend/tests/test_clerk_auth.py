@@ -0,0 +1,133 @@
+import json
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+from jose import jwk, jwt
+from werkzeug.exceptions import Unauthorized
+from app.utils import clerk_auth, metrics
+
+ISSUER = "https://clerk.test"
+
+
+def _rsa_key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return pem, {**public, "kid": kid, "use": "sig"}
+
+
+KEY_A = _rsa_key("key-a")
+KEY_B = _rsa_key("key-b")
+
+
+def _token(key, exp_in=60, sub="user_1"):
+    pem, public = key
+    claims = {"sub": sub, "iss": ISSUER, "iat": int(time.time()), "exp": int(time.time()) + exp_in}
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": public["kid"]})
+
+
+@pytest.fixture
+def jwks(tmp_path, monkeypatch):
+    """ A local JWKS stand-in; returns (write(keys), loads) where loads counts fetches. """
+    path = tmp_path / "jwks.json"
+    loads = []
+    load_jwks = clerk_auth._load_jwks
+
+    def counting_load():
+        loads.append(time.time())
+        return load_jwks()
+
+    def write(*keys):
+        path.write_text(json.dumps({"keys": [public for _, public in keys]}))
+
+    monkeypatch.setattr(clerk_auth, "CLERK_JWKS_FILE", str(path))
+    monkeypatch.setattr(clerk_auth, "CLERK_ISSUER", ISSUER)
+    monkeypatch.setattr(clerk_auth, "_load_jwks", counting_load)
+    monkeypatch.setattr(clerk_auth, "_keys", {})
+    monkeypatch.setattr(clerk_auth, "_keys_fetched_at", 0.0)
+    monkeypatch.setattr(clerk_auth, "_last_forced_refresh", 0.0)
+    clerk_auth._tokens.clear()
+    write(KEY_A)
+    return write, loads, path
+
+
+def _verify(token):
+    app = Flask(__name__)
+    with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+        return clerk_auth.verify_clerk_token()
+
+
+def _counter(name):
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_verified_token_is_cached_until_exp(jwks):
+    token = _token(KEY_A, exp_in=1)
+    assert _verify(token)["sub"] == "user_1"
+
+    hits = _counter("clerk.token_cache.hits")
+    assert _verify(token)["sub"] == "user_1"
+    assert _counter("clerk.token_cache.hits") == hits + 1
+
+    # Past exp the cached payload is dropped and the token is verified (and rejected) again
+    # (jose compares whole seconds, so wait for the second after exp)
+    time.sleep(max(0, jwt.get_unverified_claims(token)["exp"] - time.time()) + 1.1)
+    misses = _counter("clerk.token_cache.misses")
+    with pytest.raises(Unauthorized):
+        _verify(token)
+    assert _counter("clerk.token_cache.misses") == misses + 1
+
+
+def test_unknown_kid_forces_one_rate_limited_refresh(jwks, monkeypatch):
+    write, loads, _ = jwks
+    monkeypatch.setattr(clerk_auth.Config, "CLERK_JWKS_MIN_REFRESH", 30)
+    _verify(_token(KEY_A))
+    assert len(loads) == 1
+
+    # key-b is not published yet: one forced refetch, then none within the interval
+    with pytest.raises(Unauthorized):
+        _verify(_token(KEY_B))
+    assert len(loads) == 2
+    write(KEY_A, KEY_B)
+    with pytest.raises(Unauthorized):
+        _verify(_token(KEY_B, sub="user_2"))
+    assert len(loads) == 2
+
+    # Once the interval has passed, the rotated key is picked up by a single refetch
+    monkeypatch.setattr(clerk_auth, "_last_forced_refresh", time.time() - 31)
+    assert _verify(_token(KEY_B, sub="user_3"))["sub"] == "user_3"
+    assert len(loads) == 3
+
+
+def test_stale_keys_are_served_while_the_refetch_fails(jwks, monkeypatch):
+    _, loads, path = jwks
+    monkeypatch.setattr(clerk_auth.Config, "CLERK_JWKS_TTL", 300)
+    monkeypatch.setattr(clerk_auth.Config, "CLERK_JWKS_MAX_STALE", 3600)
+    _verify(_token(KEY_A))
+    assert len(loads) == 1
+
+    # Past the TTL with the JWKS endpoint down: the request is served from the
+    # current keys while one background refetch fails
+    path.unlink()
+    monkeypatch.setattr(clerk_auth, "_keys_fetched_at", time.time() - 301)
+    assert _verify(_token(KEY_A, sub="user_2"))["sub"] == "user_2"
+    deadline = time.time() + 5
+    while (clerk_auth._refreshing or len(loads) < 2) and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(loads) == 2
+    assert "key-a" in clerk_auth._keys
+
+    # The next request does not wait on the failed fetch either
+    assert _verify(_token(KEY_A, sub="user_3"))["sub"] == "user_3"
+
+
+def test_no_keys_and_no_jwks_is_a_503(jwks):
+    _, _, path = jwks
+    path.unlink()
+    with pytest.raises(Exception) as excinfo:
+        _verify(_token(KEY_A))
+    assert getattr(excinfo.value, "code", None) == 503
@@ -0,0 +1,127 @@
+import asyncio
+import time
+import pytest
+from app.utils import llm_client
+from app.utils.llm_client import CircuitBreaker, LLMError, LLMProvider, LLMUnavailableError
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Overloaded(Exception):
+    pass
+
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+    behaviour = None  # callable(messages) run by every call
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def complete_json(self, messages, model, timeout):
+        return FakeProvider.behaviour(messages)
+
+    async def acomplete_json(self, messages, model, timeout):
+        result = FakeProvider.behaviour(messages)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    def is_retryable(self, error):
+        return isinstance(error, Overloaded)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    llm_client.register_provider("fake", FakeProvider)
+    monkeypatch.setattr(llm_client.Config, "LLM_PROVIDER", "fake")
+    monkeypatch.setattr(llm_client.Config, "LLM_MAX_RETRIES", 0)
+    breaker = CircuitBreaker("fake", failure_threshold=2, cooldown=0.05)
+    monkeypatch.setitem(llm_client._breakers, "fake", breaker)
+    return breaker
+
+
+def _open(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(breaker.cooldown)
+    assert breaker.state == "half_open"
+
+
+def test_cancelled_trial_call_frees_the_trial(breaker):
+    _open(breaker)
+
+    async def hang(messages):
+        await asyncio.sleep(10)
+
+    FakeProvider.behaviour = hang
+
+    async def cancel_trial():
+        task = asyncio.create_task(llm_client.acomplete_json([], "key"))
+        await asyncio.sleep(0.01)
+        assert breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert not breaker.trial_in_flight
+
+    # The next call is let through as the new trial and closes the breaker
+    FakeProvider.behaviour = lambda messages: ("{}", {"prompt_tokens": 1, "completion_tokens": 1})
+    assert llm_client.complete_json([], "key") == "{}"
+    assert breaker.state == "closed"
+
+
+def test_interrupted_sync_trial_frees_the_trial(breaker):
+    _open(breaker)
+
+    def interrupt(messages):
+        raise KeyboardInterrupt
+
+    FakeProvider.behaviour = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        llm_client.complete_json([], "key")
+    assert not breaker.trial_in_flight
+    assert breaker.allow() == (True, True)
+
+
+def test_non_retryable_errors_leave_the_failure_count(breaker):
+    def overloaded(messages):
+        raise Overloaded("503")
+
+    def bad_request(messages):
+        raise BadRequest("400")
+
+    FakeProvider.behaviour = overloaded
+    with pytest.raises(LLMError):
+        llm_client.complete_json([], "key")
+    assert breaker.failures == 1
+
+    FakeProvider.behaviour = bad_request
+    with pytest.raises(LLMError):
+        llm_client.complete_json([], "key")
+    assert breaker.failures == 1
+
+    FakeProvider.behaviour = overloaded
+    with pytest.raises(LLMError):
+        llm_client.complete_json([], "key")
+    assert breaker.state == "open"
+    with pytest.raises(LLMUnavailableError):
+        llm_client.complete_json([], "key")
+
+
+def test_non_retryable_trial_keeps_the_breaker_half_open(breaker):
+    _open(breaker)
+
+    def bad_request(messages):
+        raise BadRequest("400")
+
+    FakeProvider.behaviour = bad_request
+    with pytest.raises(LLMError):
+        llm_client.complete_json([], "key")
+    assert breaker.state == "half_open"
+    assert not breaker.trial_in_flight
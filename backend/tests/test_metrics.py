@@ -0,0 +1,29 @@
+from config import Config
+
+
+def test_metrics_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(Config, "METRICS_TOKEN", None)
+    assert client.get("/api/metrics", headers={"X-Metrics-Token": ""}).status_code == 404
+
+
+def test_metrics_requires_ops_token(client, monkeypatch):
+    monkeypatch.setattr(Config, "METRICS_TOKEN", "ops-secret")
+    # A Clerk session is not enough
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer user"}).status_code == 401
+    assert client.get("/api/metrics", headers={"X-Metrics-Token": "wrong"}).status_code == 401
+
+    response = client.get("/api/metrics", headers={"X-Metrics-Token": "ops-secret"})
+    assert response.status_code == 200
+    assert "counters" in response.get_json()
+
+
+def test_engine_stats_hold_no_database_ids():
+    from app.utils import engine_registry
+
+    engine_registry.get_engine("tenant-database-id", "sqlite://")
+    try:
+        stats = engine_registry.registry_stats()
+        assert stats["size"] >= 1
+        assert "tenant-database-id" not in repr(stats)
+    finally:
+        engine_registry.invalidate_engine("tenant-database-id")
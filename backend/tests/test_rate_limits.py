@@ -0,0 +1,114 @@
+import multiprocessing
+import threading
+import pytest
+from app.utils import rate_limits
+from app.utils.rate_limits import MemoryBuckets, SQLiteBuckets, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limits, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    store = MemoryBuckets() if request.param == "memory" else SQLiteBuckets(str(tmp_path / "buckets.sqlite3"))
+    monkeypatch.setattr(rate_limits, "_store", store)
+    return store
+
+
+def test_burst_capacity_then_wait(store, clock):
+    bucket = TokenBucket("requests", capacity=5, per_second=1)
+    assert [bucket.take("user:a") for _ in range(5)] == [0.0] * 5
+    assert bucket.take("user:a") == pytest.approx(1.0)
+    # Another identity has its own bucket
+    assert bucket.take("user:b") == 0.0
+
+
+def test_refill_arithmetic(store, clock):
+    bucket = TokenBucket("requests", capacity=5, per_second=2)
+    for _ in range(5):
+        bucket.take("user:a")
+
+    clock.now += 1.25  # 2.5 tokens back
+    assert bucket.take("user:a", 2) == 0.0
+    assert bucket.take("user:a", 1) == pytest.approx(0.25)  # 0.5 left, 0.5 missing at 2/s
+
+    # Refill stops at capacity however long the bucket sat idle
+    clock.now += 3600
+    assert [bucket.take("user:a") for _ in range(5)] == [0.0] * 5
+    assert bucket.take("user:a") > 0
+
+
+def test_cost_is_capped_at_capacity(store, clock):
+    bucket = TokenBucket("requests", capacity=5, per_second=1)
+    assert bucket.take("user:a", 50) == 0.0
+    assert bucket.take("user:a") == pytest.approx(1.0)
+
+
+def test_charge_overdraws_and_wait_time(store, clock):
+    bucket = TokenBucket("llm_tokens", capacity=100, per_second=10)
+    assert bucket.wait_time("user:a") == 0.0
+    bucket.charge("user:a", 150)
+    assert bucket.wait_time("user:a") == pytest.approx(5.0)  # -50 tokens at 10/s
+    clock.now += 5
+    assert bucket.wait_time("user:a") == pytest.approx(0.0)
+
+
+def _spend(bucket, identity, attempts):
+    return sum(1 for _ in range(attempts) if bucket.take(identity) == 0.0)
+
+
+def test_threads_share_a_sqlite_bucket_without_lost_updates(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limits, "_store", SQLiteBuckets(str(tmp_path / "buckets.sqlite3")))
+    # Refill is negligible over the test, so exactly `capacity` takes can succeed
+    bucket = TokenBucket("requests", capacity=300, per_second=1e-9)
+    granted = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        count = _spend(bucket, "user:a", 100)
+        with lock:
+            granted.append(count)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(granted) == 300
+
+
+def _spend_in_process(path, attempts, start, results):
+    # A fresh store per process, as each worker process has its own
+    rate_limits._store = SQLiteBuckets(path)
+    start.wait()
+    results.put(_spend(TokenBucket("requests", capacity=300, per_second=1e-9), "user:a", attempts))
+
+
+def test_processes_share_a_sqlite_bucket_without_lost_updates(tmp_path):
+    context = multiprocessing.get_context("fork")
+    path = str(tmp_path / "buckets.sqlite3")
+    SQLiteBuckets(path)
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=_spend_in_process, args=(path, 200, start, results)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    start.set()
+    granted = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(30)
+    assert sum(granted) == 300
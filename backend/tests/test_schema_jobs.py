@@ -0,0 +1,74 @@
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models.database_connection import DatabaseConnection
+from app.utils import schema_jobs
+from app.utils.schema_jobs import STATUS_ACTIVE, STATUS_FAILED, STATUS_INTROSPECTING
+
+
+@pytest.fixture
+def databases(app):
+    with app.app_context():
+        DatabaseConnection.__table__.create(db.engine, checkfirst=True)
+        yield
+        DatabaseConnection.query.delete()
+        db.session.commit()
+
+
+def _add(status, started_at=None, schema=None):
+    row = DatabaseConnection(
+        database_id=uuid.uuid4(), user_id="user_1", database_name="shop", database_string="sqlite://",
+        database_status=status, introspection_started_at=started_at,
+    )
+    row.set_schema(schema or {})
+    db.session.add(row)
+    db.session.commit()
+    return row.database_id
+
+
+def _status(database_id):
+    db.session.expire_all()
+    return DatabaseConnection.query.filter_by(database_id=database_id).one().database_status
+
+
+def test_startup_reset_only_touches_stale_rows(app, databases):
+    stale = datetime.utcnow() - timedelta(seconds=schema_jobs.Config.SCHEMA_JOB_STALE_AFTER + 60)
+    running = _add(STATUS_INTROSPECTING, datetime.utcnow())
+    abandoned = _add(STATUS_INTROSPECTING, stale)
+    legacy = _add(STATUS_INTROSPECTING)
+    active = _add(STATUS_ACTIVE, stale)
+
+    schema_jobs.reset_stuck_introspections(app).result()
+
+    assert _status(running) == STATUS_INTROSPECTING
+    assert _status(abandoned) == STATUS_FAILED
+    assert _status(legacy) == STATUS_FAILED
+    assert _status(active) == STATUS_ACTIVE
+
+
+def test_stale_introspection_is_not_pending(app, databases):
+    row = DatabaseConnection(database_status=STATUS_INTROSPECTING, introspection_started_at=datetime.utcnow())
+    assert schema_jobs.introspection_pending(row)
+    row.introspection_started_at -= timedelta(seconds=schema_jobs.Config.SCHEMA_JOB_STALE_AFTER + 1)
+    assert not schema_jobs.introspection_pending(row)
+    assert not schema_jobs.introspection_pending(DatabaseConnection(database_status=STATUS_ACTIVE))
+
+
+def test_missing_schema_is_fetched_in_the_background(app, databases, monkeypatch):
+    from app.routes import prompt_response
+
+    submitted = []
+    monkeypatch.setattr(prompt_response, "submit_introspection", lambda app, database_id, user_id: submitted.append(database_id))
+    monkeypatch.setattr(prompt_response, "get_engine", lambda *a: pytest.fail("must not connect inline"))
+    database_id = _add(STATUS_ACTIVE)
+
+    with app.test_request_context():
+        target, (response, status) = prompt_response._load_database("user_1", database_id)
+        assert target is None and status == 409
+        assert submitted == [database_id]
+        assert _status(database_id) == STATUS_INTROSPECTING
+
+        # Further queries wait for that job instead of queueing more
+        target, (response, status) = prompt_response._load_database("user_1", database_id)
+        assert status == 409 and submitted == [database_id]
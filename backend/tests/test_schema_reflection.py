@@ -0,0 +1,53 @@
+from sqlalchemy import create_engine, event, text
+from app.utils.nl2sql_utils import get_db_schema, _reflect_tables
+
+DDL = [
+    "CREATE TABLE customers (id INTEGER PRIMARY KEY, name VARCHAR(50), country TEXT)",
+    "CREATE TABLE products (sku TEXT, region TEXT, price NUMERIC(10, 2), PRIMARY KEY (sku, region))",
+    # An FK to the primary key without naming the column, and a composite one
+    "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers,"
+    " sku TEXT, region TEXT, FOREIGN KEY (sku, region) REFERENCES products (sku, region))",
+    "CREATE VIEW big_orders AS SELECT * FROM orders",
+]
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/shop.db")
+    with engine.begin() as conn:
+        for statement in DDL:
+            conn.execute(text(statement))
+    return engine
+
+
+def _statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_sqlite_catalog_matches_per_table_reflection(tmp_path):
+    engine = _engine(tmp_path)
+    schema = get_db_schema(engine)
+    reflected = _reflect_tables(engine, ["customers", "orders", "products"])
+
+    assert list(schema) == ["customers", "orders", "products"]
+    for table_name, table in schema.items():
+        assert table["columns"] == reflected[table_name]["columns"]
+        key = lambda fk: fk["referred_table"]
+        assert sorted(table["foreign_keys"], key=key) == sorted(reflected[table_name]["foreign_keys"], key=key)
+
+    assert {"constrained_columns": ["customer_id"], "referred_table": "customers", "referred_columns": ["id"]} in schema["orders"]["foreign_keys"]
+
+
+def test_sqlite_catalog_reads_every_table_in_a_fixed_number_of_queries(tmp_path):
+    engine = _engine(tmp_path)
+    with engine.begin() as conn:
+        for i in range(30):
+            conn.execute(text(f"CREATE TABLE extra_{i} (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers (id))"))
+    statements = _statements(engine)
+
+    schema = get_db_schema(engine)
+    assert len(schema) == 33
+    assert schema["extra_7"]["foreign_keys"][0]["referred_table"] == "customers"
+    # Table names, columns and foreign keys
+    assert len(statements) <= 3
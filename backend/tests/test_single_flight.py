@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.utils.single_flight import CoalescedError, SingleFlight
+
+N = 20
+
+
+@pytest.fixture
+def flight():
+    return SingleFlight("test")
+
+
+def _run_threads(n, target):
+    """ Starts n threads on target together; returns their results (or raised exceptions) in order. """
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        try:
+            return target()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(n) as pool:
+        return list(pool.map(lambda _: call(), range(n)))
+
+
+def test_identical_keys_make_one_call(flight):
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"rows": [1, 2]}
+
+    results = _run_threads(N, lambda: flight.do("k", work))
+    assert len(calls) == 1
+    assert results == [{"rows": [1, 2]}] * N
+    # Every caller owns its copy
+    assert len({id(r) for r in results}) == N
+    assert flight._calls == {}
+
+
+def test_different_keys_do_not_coalesce(flight):
+    calls = []
+    counter = iter(range(N))
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            key = f"k{next(counter)}"
+        return flight.do(key, lambda: calls.append(key) or time.sleep(0.05) or key)
+
+    results = _run_threads(N, call)
+    assert len(calls) == N
+    assert sorted(results) == sorted(f"k{i}" for i in range(N))
+
+
+def test_leader_exception_reaches_every_waiter(flight):
+    error = ValueError("bad sql")
+
+    def work():
+        time.sleep(0.2)
+        raise error
+
+    results = _run_threads(N, lambda: flight.do("k", work))
+    assert all(isinstance(r, Exception) and str(r) == "bad sql" for r in results)
+    followers = [r for r in results if r is not error]
+    assert len(followers) == N - 1
+    # Each follower gets its own exception, chained to the leader's
+    assert all(isinstance(r, CoalescedError) and r.__cause__ is error for r in followers)
+    assert len({id(r) for r in followers}) == N - 1
+
+
+def test_abandoned_leader_hands_over_to_a_waiter(flight):
+    call, leading = flight.begin("k")
+    assert leading
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.05)
+        return "done"
+
+    with ThreadPoolExecutor(5) as pool:
+        futures = [pool.submit(flight.do, "k", work) for _ in range(5)]
+        time.sleep(0.1)
+        assert not any(f.done() for f in futures)
+        # Leader stops partway without an outcome (client gone)
+        call.abandon()
+        assert [f.result(timeout=5) for f in futures] == ["done"] * 5
+    assert len(calls) == 1
+
+
+def test_async_identical_keys_make_one_call(flight):
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return [1]
+
+    async def main():
+        return await asyncio.gather(*[flight.do_async("k", work) for _ in range(N)])
+
+    assert asyncio.run(main()) == [[1]] * N
+    assert len(calls) == 1
+
+
+def test_async_leader_exception_reaches_every_waiter(flight):
+    async def work():
+        await asyncio.sleep(0.1)
+        raise ValueError("bad sql")
+
+    async def main():
+        return await asyncio.gather(*[flight.do_async("k", work) for _ in range(N)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) or isinstance(r, CoalescedError) for r in results)
+    assert all(str(r) == "bad sql" for r in results)
+
+
+def test_async_cancelled_leader_does_not_strand_waiters(flight):
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(flight.do_async("k", work))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do_async("k", work)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(asyncio.gather(*followers), timeout=5)
+
+    assert asyncio.run(main()) == ["done"] * 5
+    # The cancelled leader's call plus one follower taking over
+    assert len(calls) == 2
+
+
+def test_async_and_thread_callers_share_a_call(flight):
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return "shared"
+
+    async def work_async():
+        return await asyncio.to_thread(work)
+
+    with ThreadPoolExecutor(1) as pool:
+        thread_result = pool.submit(flight.do, "k", work)
+        time.sleep(0.05)
+
+        async def main():
+            return await asyncio.gather(*[flight.do_async("k", work_async) for _ in range(5)])
+
+        assert asyncio.run(main()) == ["shared"] * 5
+        assert thread_result.result() == "shared"
+    assert len(calls) == 1
+
+
+def test_different_keys_do_not_coalesce_async(flight):
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return key
+
+    async def main():
+        return await asyncio.gather(*[flight.do_async(f"k{i}", lambda i=i: work(i)) for i in range(N)])
+
+    assert asyncio.run(main()) == list(range(N))
+    assert len(calls) == N
@@ -101,6 +101,11 @@ const DisplayPanel = ({ messages, onSend, onEmptyClick, showInput }) => {
                               ))}
                             </tbody>
                           </table>
+                          {data.result_handle?.has_more && (
+                            <p className="text-muted small">
+                              Showing {data.results.length} of {data.result_handle.total_rows} rows.
+                            </p>
+                          )}
                         </div>
                       ) : (
                         <p>No results.</p>
@@ -112,9 +117,12 @@ const DisplayPanel = ({ messages, onSend, onEmptyClick, showInput }) => {
                           <p>{data.visualization.why}</p>
 
                           {/* 2. Replace the old Plot component with PlotlyChart */}
-                          {data.visualization.figure_json && (
+                          {(data.visualization.figure_json || data.visualization.figure_url) && (
                             <div className='visualization-scroll'>
-                              <PlotlyChart figureJson={data.visualization.figure_json} />
+                              <PlotlyChart
+                                figureJson={data.visualization.figure_json}
+                                figureUrl={data.visualization.figure_url}
+                              />
                             </div>
                           )}
                         </>
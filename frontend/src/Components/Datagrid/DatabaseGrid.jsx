@@ -72,6 +72,13 @@ function DBGrid() {
     fetchDatabases();
   }, []);
 
+  // Schema introspection runs in the background; refresh until it settles
+  useEffect(() => {
+    if (!cardData.some(db => db.database_status === 'Introspecting')) return;
+    const timer = setTimeout(fetchDatabases, 3000);
+    return () => clearTimeout(timer);
+  }, [cardData]);
+
   const handleAddDatabase = () => {
     setEditData(null);
     setShowModal(true);
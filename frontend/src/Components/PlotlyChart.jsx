@@ -1,20 +1,42 @@
-import React, { useEffect, useRef } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
+import axios from 'axios';
 import Plotly from 'plotly.js-dist-min';
+import { useAuth } from '@clerk/clerk-react';
 
-const PlotlyChart = ({ figureJson }) => {
+// Renders either an inline figure (older messages) or fetches it from
+// the message's figure_url, which builds the chart on demand.
+const PlotlyChart = ({ figureJson, figureUrl }) => {
     const chartRef = useRef(null);
+    const [fetchedJson, setFetchedJson] = useState(null);
+    const { getToken } = useAuth();
 
     useEffect(() => {
-        if (figureJson && chartRef.current) {
+        if (figureJson || !figureUrl) return;
+
+        const fetchFigure = async () => {
+            const token = await getToken();
+            const res = await axios.get(figureUrl, {
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            setFetchedJson(res.data.figure_json);
+        };
+
+        fetchFigure().catch(console.error);
+    }, [figureJson, figureUrl, getToken]);
+
+    const json = figureJson || fetchedJson;
+
+    useEffect(() => {
+        if (json && chartRef.current) {
             try {
-                const figure = JSON.parse(figureJson);
+                const figure = JSON.parse(json);
                 Plotly.react(chartRef.current, figure.data, figure.layout);
 
             } catch (e) {
                 console.error("Error parsing or rendering Plotly JSON:", e);
             }
         }
-    }, [figureJson]);
+    }, [json]);
 
     return <div ref={chartRef} style={{ width: '100%', height: '100%' }} />;
 };